@@ -0,0 +1,241 @@
+"""
+Bootstrap confidence intervals and pairwise permutation tests for the evaluation results.
+
+Loads every evaluation/<tool>/evaluation_TS10.csv and evaluation_TS50.csv once and computes:
+    - percentile bootstrap CIs of the mean ROUGE-1/2/L per tool (all resamples in one matrix product)
+    - two-sided permutation tests of the mean difference for every pair of tools
+
+Results are cached on disk keyed by the CSV modification times, so re-running only recomputes after a
+CSV changes. From the analysis_results folder:
+
+    python significance.py
+
+or, in the notebook:
+
+    from significance import build_tables
+    tables = build_tables()
+    tables["TS10"]["tests"]
+"""
+import itertools
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+
+METRICS = ["ROUGE-1", "ROUGE-2", "ROUGE-L"]
+TEST_SETS = {"TS10": "evaluation_TS10.csv", "TS50": "evaluation_TS50.csv"}
+
+N_RESAMPLES = 10_000
+CONFIDENCE = 0.95
+ALPHA = 0.05
+SEED = 42
+# Resamples drawn at once for the unpaired test, whose null needs a full shuffle per resample
+BLOCK_SIZE = 1_000
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+MAIN_FOLDER = os.path.join(HERE, "evaluation")
+CACHE_FILE = os.path.join(HERE, ".significance_cache.pkl")
+
+_memory_cache = {}
+
+
+def load_files(main_folder: str, target_filename: str) -> dict:
+    file_paths = {}
+    for subfolder in sorted(os.listdir(main_folder)):
+        target_path = os.path.join(main_folder, subfolder, target_filename)
+        if os.path.isfile(target_path):
+            file_paths[subfolder] = target_path
+    return file_paths
+
+
+def load_scores(file_paths: dict) -> dict:
+    """Returns {tool: (n_rows, 3) array} with the columns in METRICS order."""
+    return {tool: pd.read_csv(path)[METRICS].to_numpy(dtype=np.float64) for tool, path in file_paths.items()}
+
+
+def _resample_counts(n: int, rng: np.random.Generator, n_resamples: int) -> np.ndarray:
+    """(n_resamples, n) matrix of how often each row is drawn when resampling n rows with replacement."""
+    picks = rng.integers(0, n, size=(n_resamples, n)) + np.arange(n_resamples)[:, None] * n
+    return np.bincount(picks.ravel(), minlength=n_resamples * n).reshape(n_resamples, n)
+
+
+def bootstrap_ci(scores: np.ndarray, rng: np.random.Generator, n_resamples: int = N_RESAMPLES,
+                 confidence: float = CONFIDENCE) -> tuple[np.ndarray, np.ndarray]:
+    """Percentile bootstrap CIs of the column means of `scores` (n_rows, k), all resamples in one matrix product."""
+    n = len(scores)
+    means = _resample_counts(n, rng, n_resamples) @ scores / n
+    tail = (1.0 - confidence) / 2 * 100
+    low, high = np.percentile(means, [tail, 100 - tail], axis=0)
+    return low, high
+
+
+def paired_permutation_tests(diffs: np.ndarray, rng: np.random.Generator,
+                             n_resamples: int = N_RESAMPLES) -> np.ndarray:
+    """
+    Sign-flip permutation test of mean(diffs) == 0.
+    `diffs` is (n_rows, k): k paired difference columns tested at once against the same sign flips.
+    Returns the k two-sided p-values.
+    """
+    n = len(diffs)
+    observed = np.abs(diffs.mean(axis=0))
+    signs = rng.choice(np.array([-1.0, 1.0]), size=(n_resamples, n))
+    null = np.abs(signs @ diffs / n)
+    return ((null >= observed - 1e-12).sum(axis=0) + 1) / (n_resamples + 1)
+
+
+def unpaired_permutation_tests(pooled: np.ndarray, n_1: int, rng: np.random.Generator,
+                               n_resamples: int = N_RESAMPLES) -> np.ndarray:
+    """
+    Label-shuffling permutation test of mean(group 1) == mean(group 2), for tools with different row counts.
+    `pooled` is (n_1 + n_2, k) with group 1 in the first n_1 rows; the k columns share the same shuffles.
+    Returns the k two-sided p-values.
+    """
+    n, n_2 = len(pooled), len(pooled) - n_1
+    total = pooled.sum(axis=0)
+    observed = np.abs(pooled[:n_1].mean(axis=0) - pooled[n_1:].mean(axis=0))
+
+    exceed = np.zeros(pooled.shape[1])
+    for start in range(0, n_resamples, BLOCK_SIZE):
+        size = min(BLOCK_SIZE, n_resamples - start)
+        # The n_1 smallest random keys of each row pick the shuffled group 1
+        keys = rng.random((size, n))
+        threshold = np.partition(keys, n_1 - 1, axis=1)[:, n_1 - 1:n_1]
+        sums_1 = (keys <= threshold).astype(np.float64) @ pooled
+        null = np.abs(sums_1 / n_1 - (total - sums_1) / n_2)
+        exceed += (null >= observed - 1e-12).sum(axis=0)
+    return (exceed + 1) / (n_resamples + 1)
+
+
+def _split(p_values: np.ndarray, keys: list) -> dict:
+    width = len(METRICS)
+    return {key: p_values[index * width:(index + 1) * width] for index, key in enumerate(keys)}
+
+
+def compute_tables(scores_by_tool: dict, n_resamples: int = N_RESAMPLES, seed: int = SEED) -> dict:
+    """Returns {"ci": DataFrame, "tests": DataFrame} for one test set."""
+    rng = np.random.default_rng(seed)
+
+    # Tools with the same rows (same test repositories) share one resampling matrix
+    by_length = {}
+    for tool, scores in scores_by_tool.items():
+        by_length.setdefault(len(scores), []).append(tool)
+
+    intervals = {}
+    for tools in by_length.values():
+        low, high = bootstrap_ci(np.hstack([scores_by_tool[tool] for tool in tools]), rng, n_resamples)
+        intervals.update(_split(np.stack([low, high], axis=1), tools))
+
+    ci_rows = []
+    for tool, scores in scores_by_tool.items():
+        for index, metric in enumerate(METRICS):
+            ci_rows.append({
+                "tool": tool,
+                "Metric": metric,
+                "Mean": scores[:, index].mean(),
+                "CI low": intervals[tool][index, 0],
+                "CI high": intervals[tool][index, 1],
+            })
+
+    # Paired tools share one sign-flip matrix; the rest share one shuffle per (n_1, n_2) and are tested unpaired
+    pairs = list(itertools.combinations(sorted(scores_by_tool), 2))
+    paired = [(fw1, fw2) for fw1, fw2 in pairs if len(scores_by_tool[fw1]) == len(scores_by_tool[fw2])]
+    p_values = {}
+    if paired:
+        diffs = np.hstack([scores_by_tool[fw1] - scores_by_tool[fw2] for fw1, fw2 in paired])
+        p_values.update(_split(paired_permutation_tests(diffs, rng, n_resamples), paired))
+
+    unpaired = {}
+    for fw1, fw2 in pairs:
+        if (fw1, fw2) not in p_values:
+            # The test is symmetric, so pool the shorter tool first and (818, 865) shares the (865, 818) shuffles
+            n_1, n_2 = sorted((len(scores_by_tool[fw1]), len(scores_by_tool[fw2])))
+            unpaired.setdefault((n_1, n_2), []).append((fw1, fw2))
+    for (n_1, _), group in unpaired.items():
+        pooled = np.hstack([
+            np.concatenate(sorted([scores_by_tool[fw1], scores_by_tool[fw2]], key=len))
+            for fw1, fw2 in group
+        ])
+        p_values.update(_split(unpaired_permutation_tests(pooled, n_1, rng, n_resamples), group))
+
+    test_rows = []
+    for fw1, fw2 in pairs:
+        mean_diff = scores_by_tool[fw1].mean(axis=0) - scores_by_tool[fw2].mean(axis=0)
+        for index, metric in enumerate(METRICS):
+            p = p_values[(fw1, fw2)][index]
+            test_rows.append({
+                "Metric": metric,
+                "Framework 1": fw1,
+                "Framework 2": fw2,
+                "Paired": (fw1, fw2) in paired,
+                "Mean difference": mean_diff[index],
+                "p-value": p,
+                "Significant": "✓" if p < ALPHA else "✗",
+            })
+
+    return {"ci": pd.DataFrame(ci_rows), "tests": pd.DataFrame(test_rows)}
+
+
+def build_tables(main_folder: str = MAIN_FOLDER, n_resamples: int = N_RESAMPLES, seed: int = SEED,
+                 use_cache: bool = True) -> dict:
+    """Returns {"TS10": {"ci": ..., "tests": ...}, "TS50": {...}}, reusing the cache while no CSV has changed."""
+    file_paths = {name: load_files(main_folder, filename) for name, filename in TEST_SETS.items()}
+    key = (
+        tuple(
+            (name, tool, os.path.getmtime(path))
+            for name, paths in file_paths.items()
+            for tool, path in paths.items()
+        ),
+        n_resamples,
+        seed,
+    )
+
+    if use_cache:
+        if key in _memory_cache:
+            return _memory_cache[key]
+        if os.path.isfile(CACHE_FILE):
+            try:
+                with open(CACHE_FILE, "rb") as f:
+                    cached_key, tables = pickle.load(f)
+                if cached_key == key:
+                    _memory_cache[key] = tables
+                    return tables
+            except Exception as e:
+                print(f"Ignoring unreadable cache {CACHE_FILE}: {e}")
+
+    tables = {
+        name: compute_tables(load_scores(paths), n_resamples, seed)
+        for name, paths in file_paths.items()
+    }
+
+    _memory_cache[key] = tables
+    if use_cache:
+        with open(CACHE_FILE, "wb") as f:
+            pickle.dump((key, tables), f)
+    return tables
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    tables = build_tables(use_cache=False)
+    print(f"Computed in {time.perf_counter() - start:.3f}s")
+
+    for name, result in tables.items():
+        print(f"\n##### {name} #####")
+        print(result["ci"].round(3).to_string(index=False))
+        for metric in METRICS:
+            print(f"\n=== {metric} ===")
+            print(result["tests"][result["tests"]["Metric"] == metric]
+                  .drop(columns="Metric")
+                  .round(4)
+                  .to_string(index=False))
+
+    # Warm the on-disk cache and show what a second run costs; the memory cache is emptied first, as a hit
+    # there returns before the disk is written, and again before timing, so only the disk path is measured
+    _memory_cache.clear()
+    build_tables()
+    _memory_cache.clear()
+    start = time.perf_counter()
+    build_tables()
+    print(f"\nFrom the mtime cache in {time.perf_counter() - start:.3f}s")
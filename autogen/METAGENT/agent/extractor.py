@@ -1,10 +1,11 @@
-import os
 from string import Template
 from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.messages import StructuredMessage, TextMessage
 from autogen_agentchat.ui import Console
 from autogen_core import CancellationToken
-from autogen_ext.models.openai import OpenAIChatCompletionClient
+from utils.extraction_store import aextract_once
+from utils.model_clients import get_model_client
+from utils.readme_budget import fit_readme
 
 
 class ExtractorAgent():
@@ -12,12 +13,9 @@ class ExtractorAgent():
 
     def __init__(self, name):
         self.name = name
-        # Create an agent that uses the OpenAI GPT-4o model.
-        model_client = OpenAIChatCompletionClient(
-            model= "gpt-4o-mini",
-            api_key= os.getenv('OPENAI_API_KEY'),
-            temperature=0
-        )
+        self.model = "gpt-4o-mini"
+        # Shared client from the registry, so every agent reuses the same connections
+        model_client = get_model_client(self.model, temperature=0, agent="extractor")
         
         self.agent = AssistantAgent(
             name=name,
@@ -31,7 +29,12 @@ class ExtractorAgent():
         return prompt 
 
     async def run_agent(self, prompt: str, readme_text) -> str:
-        """Creates a ChatCompletionAgent for extraction."""
+        """Extracts the README once; later calls with the same README and prompt reuse the stored text."""
+        # Oversized READMEs are cut to the token budget first, so the stored extraction matches what was sent
+        readme_text = fit_readme(readme_text)
+        return await aextract_once(readme_text, prompt, self.model, lambda: self._extract(prompt, readme_text))
+
+    async def _extract(self, prompt: str, readme_text) -> str:
         # Create instruction  prompt
         prompt = self._build_prompt(prompt, readme_text)
         # Send prompt to agent
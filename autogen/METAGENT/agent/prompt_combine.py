@@ -1,11 +1,10 @@
-import os
 import re
 from string import Template
 from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.messages import StructuredMessage, TextMessage
 from autogen_agentchat.ui import Console
 from autogen_core import CancellationToken
-from autogen_ext.models.openai import OpenAIChatCompletionClient
+from utils.model_clients import get_model_client
 from prompt.prompt import COMBINE_PROMPT
 
 class PromptCombineAgent():
@@ -13,12 +12,8 @@ class PromptCombineAgent():
 
     def __init__(self, name):
         self.name = name
-        # Create an agent that uses the OpenAI GPT-4o model.
-        model_client = OpenAIChatCompletionClient(
-            model= "gpt-4o",
-            api_key= os.getenv('OPENAI_API_KEY'),
-            temperature=0.2
-        )
+        # Shared client from the registry, so every agent reuses the same connections
+        model_client = get_model_client("gpt-4o", temperature=0.2, agent="combiner")
         self.agent = AssistantAgent(
             name=name,
             model_client=model_client,
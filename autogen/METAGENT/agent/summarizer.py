@@ -1,5 +1,4 @@
-from autogen_ext.models.openai import OpenAIChatCompletionClient
-from autogen_core.models import UserMessage
+from autogen_core.models import ChatCompletionClient, CreateResult, RequestUsage, UserMessage
 from autogen_agentchat.messages import TextMessage
 from autogen_agentchat.base import Response
 from autogen_core import CancellationToken
@@ -7,16 +6,24 @@ from typing import List, Sequence
 from string import Template
 from autogen_agentchat.messages import BaseAgentEvent, BaseChatMessage
 from autogen_agentchat.agents import BaseChatAgent
-from metric.rouge import ROUGE
-import os
+from metric.rouge import ROUGE, IncrementalROUGE
+from utils.generation_profiles import get_profile
+from utils.model_clients import get_model_client
+from utils.prompt_layout import stable_layout
+from utils.readme_budget import get_tokenizer
 
 class SummarizerAgent(BaseChatAgent):
-    def __init__(self, name: str, description: str, extracted_text: str, ground_truth: str, threshold: float) -> None:
+    def __init__(self, name: str, description: str, extracted_text: str, ground_truth: str, threshold: float,
+                 stream: bool = False, overrun_ratio: float | None = None) -> None:
         super().__init__(name, description=description)
         self._message_history: List[BaseChatMessage] = []
         self.extracted_text = extracted_text
         self.ground_truth = ground_truth
         self.threshold = threshold
+        # Stream the completion and stop it once it is overrun_ratio times longer than the ground truth (None: never stop).
+        # Opt-in: a stopped summary is scored as it is, so the cut-off changes the experiment's results
+        self.stream = stream
+        self.overrun_ratio = overrun_ratio
 
     @property
     def produced_message_types(self) -> Sequence[type[BaseChatMessage]]:
@@ -36,9 +43,10 @@ class SummarizerAgent(BaseChatAgent):
         response_message = TextMessage(content=str(result.content), source=self.name)
         
         # Calculate ROUGE-Score 
-        rougel_score = ROUGE.get_RougeL(result.content, self.ground_truth)
-        rouge1_score = ROUGE.get_Rouge1(result.content, self.ground_truth)
-        rouge2_score = ROUGE.get_Rouge2(result.content, self.ground_truth)
+        scores = ROUGE.score_all(result.content, self.ground_truth)
+        rougel_score = scores["rougeL"].fmeasure
+        rouge1_score = scores["rouge1"].fmeasure
+        rouge2_score = scores["rouge2"].fmeasure
 
         print(f"\nROUGE Calculated inside Summarizer agent")
         print(f"Rouge1 Score: {rouge1_score}")
@@ -58,23 +66,61 @@ class SummarizerAgent(BaseChatAgent):
         pass
 
     def _build_prompt(self, prompt: str, extracted_text: str) -> str:
-        prompt = Template(prompt)
+        # Optional word budget of the generation profile, kept with the static instructions
+        hint = get_profile("summarizer").hint()
+        if hint:
+            prompt = f"{prompt}\n\n{hint}"
+        # The Teacher may write $extracted_text anywhere; the data goes last so the instructions form the prefix
+        prompt = Template(stable_layout(prompt, ["extracted_text"]))
         return prompt.substitute(extracted_text=extracted_text)
 
-    async def _call_llm(self, prompt: str) -> str:
+    async def _call_llm(self, prompt: str) -> CreateResult:
         # Call the LLM model (e.g., OpenAI API) with the constructed prompt
+        # Failed calls raise LLMCallError after the retries, so an error is never scored as a summary
+        # Shared client: the connection stays open across the turns of the conversation
+        openai_model_client = get_model_client("gpt-4o-mini", temperature=0, agent="summarizer")
+        if self.stream:
+            return await self._stream_llm(openai_model_client, prompt)
+        return await openai_model_client.create([UserMessage(content=prompt, source="user")])
+
+    async def _stream_llm(self, model_client: ChatCompletionClient, prompt: str) -> CreateResult:
+        # Score the completion while it streams so a runaway answer can be cut off early
+        if self.overrun_ratio is None:
+            accumulator = None
+        else:
+            accumulator = IncrementalROUGE(self.ground_truth, overrun_ratio=self.overrun_ratio)
+        chunks = []
+        stream = model_client.create_stream(
+            [UserMessage(content=prompt, source="user")],
+            extra_create_args={"stream_options": {"include_usage": True}},
+        )
         try:
-            # Initialize the OpenAIChatCompletionClient with your API key
-            api_key = os.getenv('OPENAI_API_KEY')
-            openai_model_client = OpenAIChatCompletionClient(
-                                model="gpt-4o-mini", 
-                                api_key=api_key,
-                                temperature=0)
-            result = await openai_model_client.create([UserMessage(content=prompt, source="user")])
-            await openai_model_client.close()
-            return result
-        except Exception as e:
-            return f"Error in LLM call: {str(e)}"
+            async for chunk in stream:
+                if isinstance(chunk, CreateResult):
+                    return chunk
+                chunks.append(chunk)
+                if accumulator is None:
+                    continue
+                accumulator.update(chunk)
+                if accumulator.overrun():
+                    scores = accumulator.scores()
+                    print(f"[{self.name}] Generation stopped after {len(accumulator.candidate_tokens)} words "
+                          f"(expected about {len(accumulator.reference_tokens)}), "
+                          f"Rouge1 so far: {scores['rouge1'].fmeasure}, RougeL so far: {scores['rougeL'].fmeasure}")
+                    break
+        finally:
+            await stream.aclose()
+
+        # Aborted: the provider never sends usage for a partial completion, so it is counted from the prompt and
+        # the streamed chunks with the gpt-4o tokenizer (see utils/readme_budget.py)
+        content = "".join(chunks)
+        tokenizer = get_tokenizer()
+        return CreateResult(
+            finish_reason="length",
+            content=content,
+            usage=RequestUsage(prompt_tokens=tokenizer.count(prompt), completion_tokens=tokenizer.count(content)),
+            cached=False,
+        )
 
 
 
@@ -1,10 +1,11 @@
-import os
 from string import Template
 from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.messages import StructuredMessage, TextMessage
 from autogen_agentchat.ui import Console
 from autogen_core import CancellationToken
-from autogen_ext.models.openai import OpenAIChatCompletionClient
+from utils.generation_profiles import get_profile
+from utils.model_clients import get_model_client
+from utils.prompt_layout import stable_layout
 
 
 class SummarizerEvaluationAgent():
@@ -12,12 +13,8 @@ class SummarizerEvaluationAgent():
 
     def __init__(self, name):
         self.name = name
-        # Create an agent that uses the OpenAI GPT-4o model.
-        model_client = OpenAIChatCompletionClient(
-            model= "gpt-4o-mini",
-            api_key= os.getenv('OPENAI_API_KEY'),
-            temperature=0
-        )
+        # Shared client from the registry, so every agent reuses the same connections
+        model_client = get_model_client("gpt-4o-mini", temperature=0, agent="summarizer")
         
         self.agent = AssistantAgent(
             name=name,
@@ -26,7 +23,12 @@ class SummarizerEvaluationAgent():
         )
         
     def _build_prompt(self, prompt: str, extracted_text: str) -> str:
-        prompt = Template(prompt)
+        # Optional word budget of the generation profile, kept with the static instructions
+        hint = get_profile("summarizer").hint()
+        if hint:
+            prompt = f"{prompt}\n\n{hint}"
+        # The Teacher may write $extracted_text anywhere; the data goes last so the instructions form the prefix
+        prompt = Template(stable_layout(prompt, ["extracted_text"]))
         return prompt.substitute(extracted_text=extracted_text)
 
     async def run_agent(self, prompt: str, extracted_text) -> str:
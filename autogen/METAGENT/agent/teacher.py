@@ -1,5 +1,4 @@
-from autogen_ext.models.openai import OpenAIChatCompletionClient
-from autogen_core.models import UserMessage
+from autogen_core.models import CreateResult, UserMessage
 from autogen_agentchat.messages import TextMessage
 from autogen_agentchat.base import Response
 from autogen_core import CancellationToken
@@ -11,7 +10,8 @@ from prompt.prompt import (
     TEACHER_PROMPT,
 )
 from metric.rouge import ROUGE
-import os
+from utils.generation_profiles import TruncatedOutputError
+from utils.model_clients import get_model_client
 
 
 
@@ -33,16 +33,20 @@ class TeacherAgent(BaseChatAgent):
         # Get information to the Teacher
         summarizer_generated = self._message_history[-1].content
         summarizer_prompt = self._message_history[-2].content
-        rouge_score = ROUGE.get_RougeL(self.ground_truth, summarizer_generated)
+        rouge_score = ROUGE.get_RougeL(summarizer_generated, self.ground_truth)
         
         # Generete prompt
         prompt = self._build_prompt(self.extracted_text, self.ground_truth, summarizer_generated, rouge_score, summarizer_prompt)
 
         # Call the LLM to generate a response
-        result = await self._call_llm(prompt)
-        
-        new_prompt = result.content
-        new_prompt = self._parse_answer(new_prompt) #Fix prompt if the teacher removes $extracted_text
+        try:
+            result = await self._call_llm(prompt)
+            new_prompt = result.content
+            new_prompt = self._parse_answer(new_prompt) #Fix prompt if the teacher removes $extracted_text
+        except TruncatedOutputError as e:
+            # A prompt cut at max_tokens is never optimized against
+            print(f"[{self.name}] {e}, keeping the previous prompt")
+            new_prompt = summarizer_prompt
 
         # Create a new message with the result.
         response_message = TextMessage(content=str(new_prompt), source=self.name)
@@ -81,20 +85,12 @@ class TeacherAgent(BaseChatAgent):
             summarizer_prompt += "\n<EXTRACTED_README>$extracted_text</EXTRACTED_README>"
         return summarizer_prompt
 
-    async def _call_llm(self, prompt: str) -> str:
+    async def _call_llm(self, prompt: str) -> CreateResult:
         # Call the LLM model (e.g., OpenAI API) with the constructed prompt
-        try:
-            # Initialize the OpenAIChatCompletionClient with your API key
-            api_key = os.getenv('OPENAI_API_KEY')
-            openai_model_client = OpenAIChatCompletionClient(
-                                    model="gpt-4o", 
-                                    api_key=api_key,
-                                    temperature=0.7)
-            result = await openai_model_client.create([UserMessage(content=prompt, source="user")])
-            await openai_model_client.close()
-            return result
-        except Exception as e:
-            return f"Error in LLM call: {str(e)}"
+        # Failed calls raise LLMCallError after the retries instead of becoming the next Summarizer prompt
+        # Shared client: the connection stays open across the turns of the conversation
+        openai_model_client = get_model_client("gpt-4o", temperature=0.7, agent="teacher")
+        return await openai_model_client.create([UserMessage(content=prompt, source="user")])
 
 
 
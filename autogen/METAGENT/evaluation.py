@@ -1,56 +1,135 @@
 import asyncio
+import os
+import openai
 import pandas as pd
 from agent.extractor import ExtractorAgent
 from agent.summarizer_evaluation import SummarizerEvaluationAgent
 from metric.rouge import ROUGE
+from utils.batch_runner import chat_request, run_batch
+from utils.extraction_store import get_extraction_store
+from utils.generation_profiles import get_generation_stats, get_profile
+from utils.model_clients import close_model_clients
+from utils.prompt_layout import get_cache_stats
+from utils.readme_budget import fit_readme, get_readme_budget
 from dotenv import load_dotenv
 from prompt.prompt import (
     OPTIMIZED_SUMMARIZER_PROMPT,
     EXTRACTOR_PROMPT
 )
 
+# Same system message as the AssistantAgents, so batch and online requests are identical
+SYSTEM_MESSAGE = "Use tools to solve tasks."
+
+
 class Evaluation:
-    def __init__(self):
+    def __init__(self, batch: bool = False):
         self.EXTRACTOR_NAME = "Extractor"
         self.SUMMARIZER_NAME = "Summarizer"
+        # Batch mode sends all Extractor requests as one Batch API job, then all Summarizer requests
+        self.batch = batch
         self.dic_results = []
 
     async def run(self, dataset: list[dict]):
-        
+        try:
+            if self.batch:
+                await self._run_batch(dataset)
+            else:
+                await self._run(dataset)
+        finally:
+            await close_model_clients()
+            get_cache_stats().report("evaluation")
+            get_generation_stats().report("evaluation")
+            get_readme_budget().report("evaluation")
+
+    def _score(self, description: str, about: str) -> None:
+        scores = ROUGE().score_all(candidate=about, reference=description)
+        rougeL_score = scores["rougeL"].fmeasure
+        rouge1_score = scores["rouge1"].fmeasure
+        rouge2_score = scores["rouge2"].fmeasure
+        print(f"Rouge1 Score: {rouge1_score}")
+        print(f"Rouge2 Score: {rouge2_score}")
+        print(f"RougeL Score: {rougeL_score}")
+
+        # Store result
+        result_save = {
+            "Description": description,
+            "Generated About": about,
+            "ROUGE-L": rougeL_score,
+            "ROUGE-1": rouge1_score,
+            "ROUGE-2": rouge2_score,
+        }
+        self.dic_results.append(result_save)
+
+    async def _run_batch(self, dataset: list[dict]):
+        client = openai.OpenAI()
+        extractor_agent = ExtractorAgent(self.EXTRACTOR_NAME)
+        summarizer_agent = SummarizerEvaluationAgent(self.SUMMARIZER_NAME)
+
+        #### Extractor Agent: one batch for the READMEs not extracted yet ####
+        store = get_extraction_store()
+        extracted = {}
+        requests = []
+        readmes = [fit_readme(data["readme"]) for data in dataset]
+        for i, readme in enumerate(readmes):
+            stored = store.get(readme, EXTRACTOR_PROMPT, extractor_agent.model) if store else None
+            if stored is not None:
+                extracted[i] = stored
+                continue
+            prompt = extractor_agent._build_prompt(EXTRACTOR_PROMPT, readme)
+            requests.append(chat_request(str(i), extractor_agent.model, [
+                {"role": "system", "content": SYSTEM_MESSAGE}, {"role": "user", "content": prompt},
+            ], temperature=0, **get_profile("extractor").params()))
+        extractions, errors = await asyncio.to_thread(run_batch, client, requests, "extractor")
+        for custom_id, extracted_text in extractions.items():
+            i = int(custom_id)
+            extracted[i] = extracted_text
+            if store is not None:
+                store.put(readmes[i], EXTRACTOR_PROMPT, extractor_agent.model, extracted_text)
+
+        #### Summarizer Agent: one batch over the extracted texts ####
+        requests = [
+            chat_request(str(i), "gpt-4o-mini", [
+                {"role": "system", "content": SYSTEM_MESSAGE},
+                {"role": "user", "content": summarizer_agent._build_prompt(OPTIMIZED_SUMMARIZER_PROMPT, extracted_text)},
+            ], temperature=0, **get_profile("summarizer").params())
+            for i, extracted_text in sorted(extracted.items())
+        ]
+        abouts, summary_errors = await asyncio.to_thread(run_batch, client, requests, "summarizer")
+        errors.update(summary_errors)
+
         for i, data in enumerate(dataset):
-            try:
-                description = data["description"]
-                readme = data["readme"]
-                print(f"Data #{i}:\n- Description: {description}\n")
-
-                #### Extractor Agent ####
-                extractor_agent =  ExtractorAgent(self.EXTRACTOR_NAME)
-                extracted_text = await extractor_agent.run_agent(EXTRACTOR_PROMPT, readme)
-
-                #### Summarizer Agent ####
-                summarizer_agent =  SummarizerEvaluationAgent(self.SUMMARIZER_NAME)
-                about = await summarizer_agent.run_agent(OPTIMIZED_SUMMARIZER_PROMPT, extracted_text)
-                
-                rougeL_score = ROUGE().get_RougeL(string_1=about, string_2=description)
-                rouge1_score = ROUGE().get_Rouge1(string_1=about, string_2=description)
-                rouge2_score = ROUGE().get_Rouge2(string_1=about, string_2=description)
-                print(f"Rouge1 Score: {rouge1_score}")
-                print(f"Rouge2 Score: {rouge2_score}")
-                print(f"RougeL Score: {rougeL_score}")
-                
-                # Store result
-                result_save = {
-                    "Description": description,
-                    "Generated About": about,
-                    "ROUGE-L": rougeL_score,
-                    "ROUGE-1": rouge1_score,
-                    "ROUGE-2": rouge2_score,
-                }
-                self.dic_results.append(result_save)
-
-            except Exception as e:
-                print(f"Error while running data {i}: {e}")
+            if str(i) not in abouts:
+                # The row is scored like the others instead of missing from the results
+                print(f"Data #{i}: no batch result ({errors.get(str(i))}), running it online")
+                await self._run_row(i, data)
                 continue
+            print(f"Data #{i}:\n- Description: {data['description']}\n")
+            self._score(data["description"], abouts[str(i)])
+
+    async def _run(self, dataset: list[dict]):
+        
+        for i, data in enumerate(dataset):
+            await self._run_row(i, data)
+
+    async def _run_row(self, i: int, data: dict):
+        try:
+            description = data["description"]
+            readme = data["readme"]
+            print(f"Data #{i}:\n- Description: {description}\n")
+
+            #### Extractor Agent ####
+            extractor_agent =  ExtractorAgent(self.EXTRACTOR_NAME)
+            extracted_text = await extractor_agent.run_agent(EXTRACTOR_PROMPT, readme)
+
+            #### Summarizer Agent ####
+            # SUMMARIZER_STREAM and SUMMARIZER_OVERRUN_RATIO (optimizer/parallel_optimizer.py) stay training-only:
+            # the cut-off is sized on the ground truth, which must not shape the answers being evaluated
+            summarizer_agent =  SummarizerEvaluationAgent(self.SUMMARIZER_NAME)
+            about = await summarizer_agent.run_agent(OPTIMIZED_SUMMARIZER_PROMPT, extracted_text)
+            self._score(description, about)
+
+        except Exception as e:
+            print(f"Error while running data {i}: {e}")
 
 
 class Main:
@@ -59,7 +138,8 @@ class Main:
 
     def run(self):
         test_data = pd.read_csv("data-experiment/ES.csv").to_dict(orient="records")
-        evaluation = Evaluation()
+        # EVALUATION_MODE=batch runs both stages through the Batch API
+        evaluation = Evaluation(batch=os.getenv("EVALUATION_MODE", "online") == "batch")
         asyncio.run(evaluation.run(test_data))
         df_results = pd.DataFrame(evaluation.dic_results)
         df_results.to_csv("results/evaluation_TS10_third_try.csv", index=False)
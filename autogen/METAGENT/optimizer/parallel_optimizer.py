@@ -1,7 +1,28 @@
+"""
+Optimizes the Summarizer prompt on every training README, then combines the approved prompts into one.
+
+Each README gets its own Extractor, Summarizer/Teacher team and conversation, so the READMEs are independent and
+run concurrently; a sweep takes about (rows / concurrency) times the time of one README instead of their sum. The
+approved prompts are combined in row order, as in a sequential run. Configured with environment variables:
+
+    OPTIMIZER_CONCURRENCY     READMEs optimized at the same time (default: 1, one after the other)
+    SUMMARIZER_STREAM         on: stream the Summarizer's completions (default: off)
+    SUMMARIZER_OVERRUN_RATIO  with streaming, stop a completion once it is this many times longer than the ground
+                              truth (default: unset, never stop; 4 stops runaway answers but changes the results)
+
+The shared rate limiter and connection pool (see utils/model_clients.py) still bound the requests in flight.
+"""
+import asyncio
+import os
+
 from agent.extractor import ExtractorAgent
 from agent.summarizer import SummarizerAgent
 from agent.teacher import TeacherAgent
 from agent.prompt_combine import PromptCombineAgent
+from utils.generation_profiles import get_generation_stats
+from utils.model_clients import close_model_clients
+from utils.prompt_layout import get_cache_stats
+from utils.readme_budget import get_readme_budget
 from autogen_agentchat.teams import RoundRobinGroupChat
 from autogen_agentchat.conditions import MaxMessageTermination, TextMentionTermination
 from prompt.prompt import (
@@ -9,72 +30,100 @@ from prompt.prompt import (
     EXTRACTOR_PROMPT
 )
 
+DEFAULT_CONCURRENCY = 1
+
 class ParallelOptimizer:
-    def __init__(self, threshold: float = 0.7):
+    EXTRACTOR_NAME = "Extractor"
+    SUMMARIZER_NAME = "Summarizer"
+    TEACHER_NAME = "Teacher"
+    COMBINE_NAME = "Combiner"
+
+    def __init__(self, threshold: float = 0.7, concurrency: int | None = None):
         self.threshold = threshold
-        
+        if concurrency is None:
+            concurrency = int(os.getenv("OPTIMIZER_CONCURRENCY", DEFAULT_CONCURRENCY))
+        self.concurrency = max(1, concurrency)
+        self.summarizer_stream = os.getenv("SUMMARIZER_STREAM", "off").lower() == "on"
+        overrun_ratio = os.getenv("SUMMARIZER_OVERRUN_RATIO")
+        self.overrun_ratio = float(overrun_ratio) if overrun_ratio else None
 
     async def run(self, max_iterations: int, train_data: list[dict]):
-        
-        # Store different prompt from the interactions
-        data_prompt = [] 
-        EXTRACTOR_NAME = "Extractor"
-        SUMMARIZER_NAME = "Summarizer"
-        TEACHER_NAME = "Teacher"
-        COMBINE_NAME = "Combiner"
-        
-        for i, data in enumerate(train_data):   
-            
-            # Ground truth value
-            description = data["description"]
-            # Readme value
-            readme = data["readme"]
-            
-            print(f"Data #{i}:\n- Description: {description}")
-            
-            # Create and run Extractor Agent
-            extractor_agent =  ExtractorAgent(EXTRACTOR_NAME)
-            extracted_text = await extractor_agent.run_agent(EXTRACTOR_PROMPT, readme)
-            print(f"Extracted text: {extracted_text}")
-            
-            
-            print(f"\n\n-- Summarizer and Teacher Conversation -- \n")
-            
-            # Chat conversation Teacher - Summarizer
-            # Create Summarizer
-            summarizer_agent = SummarizerAgent(
-                name=SUMMARIZER_NAME,
-                description='A agent that summarize READMEs based on the prompt provided by the Teacher agent',
-                extracted_text=extracted_text, 
-                ground_truth= description,
-                threshold=self.threshold
-                )
-
-            # Create Teacher
-            teacher_agent = TeacherAgent(
-                name=TEACHER_NAME,
-                description='A agent that improves the prompts utilized by the Summarizer agent',
-                extracted_text=extracted_text,
-                ground_truth=description)
-            
-            termination = MaxMessageTermination(max_iterations*2) |  TextMentionTermination("APPROVE")
-            
-            # Create Multi Agent team
-            team = RoundRobinGroupChat([summarizer_agent, teacher_agent], termination_condition=termination)
-            # Run team
+        try:
+            await self._run(max_iterations, train_data)
+        finally:
+            await close_model_clients()
+            get_cache_stats().report("training")
+            get_generation_stats().report("training")
+            get_readme_budget().report("training")
+
+    async def _optimize(self, i: int, data: dict, max_iterations: int) -> str | None:
+        """Runs the Extractor and the Summarizer/Teacher team on one README; the approved prompt, if any."""
+        # Ground truth value
+        description = data["description"]
+        # Readme value
+        readme = data["readme"]
+
+        print(f"Data #{i}:\n- Description: {description}")
+
+        # Create and run Extractor Agent
+        extractor_agent =  ExtractorAgent(self.EXTRACTOR_NAME)
+        extracted_text = await extractor_agent.run_agent(EXTRACTOR_PROMPT, readme)
+        print(f"Extracted text #{i}: {extracted_text}")
+
+
+        print(f"\n\n-- Summarizer and Teacher Conversation #{i} -- \n")
+
+        # Chat conversation Teacher - Summarizer
+        # Create Summarizer
+        summarizer_agent = SummarizerAgent(
+            name=self.SUMMARIZER_NAME,
+            description='A agent that summarize READMEs based on the prompt provided by the Teacher agent',
+            extracted_text=extracted_text,
+            ground_truth= description,
+            threshold=self.threshold,
+            stream=self.summarizer_stream,
+            overrun_ratio=self.overrun_ratio
+            )
+
+        # Create Teacher
+        teacher_agent = TeacherAgent(
+            name=self.TEACHER_NAME,
+            description='A agent that improves the prompts utilized by the Summarizer agent',
+            extracted_text=extracted_text,
+            ground_truth=description)
+
+        termination = MaxMessageTermination(max_iterations*2) |  TextMentionTermination("APPROVE")
+
+        # Create Multi Agent team
+        team = RoundRobinGroupChat([summarizer_agent, teacher_agent], termination_condition=termination)
+        # Run team
+        try:
             result = await team.run(task=INITIAL_SUMMARIZER_PROMPT)
-            
+        except RuntimeError as e:
+            # The team re-raises agent errors (e.g. LLMRetriesExhausted) as RuntimeError; skip the README
+            print(f"Skipped Data #{i}: {e}")
+            return None
 
-            if result.stop_reason == "Text 'APPROVE' mentioned":
-                print(f"Added Prompt #{i}: {result.messages[-2].content}")
-                data_prompt.append(result.messages[-2].content)
+        if result.stop_reason == "Text 'APPROVE' mentioned":
+            print(f"Added Prompt #{i}: {result.messages[-2].content}")
+            return result.messages[-2].content
+        return None
+
+    async def _run(self, max_iterations: int, train_data: list[dict]):
+        # The READMEs are optimized independently, up to `concurrency` at a time
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def optimize(i: int, data: dict) -> str | None:
+            async with semaphore:
+                return await self._optimize(i, data, max_iterations)
+
+        results = await asyncio.gather(*(optimize(i, data) for i, data in enumerate(train_data)))
+        # Store different prompt from the interactions, in row order whatever finished first
+        data_prompt = [prompt for prompt in results if prompt is not None]
+        print(f"Length data_prompt: {len(data_prompt)}")
 
-            print(f"Length data_prompt: {len(data_prompt)}")
-            # if len(data_prompt)==4:
-            #     break
-            
         # Create and run Prompt Combiner
-        combine_agent =  PromptCombineAgent(COMBINE_NAME)
+        combine_agent =  PromptCombineAgent(self.COMBINE_NAME)
         combined_text = await combine_agent.run_agent(data_prompt)
         print(f"Extracted text: {combined_text}")
             
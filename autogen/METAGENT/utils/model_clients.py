@@ -0,0 +1,412 @@
+"""Process-wide registry of OpenAI model clients shared by all agents: one connection pool, the LLM response
+cache, retries, rate limiting and generation profiles. Call close_model_clients() once the run is over."""
+import asyncio
+import copy
+import json
+import logging
+import os
+import time
+
+from autogen_core import EVENT_LOGGER_NAME, CacheStore
+from autogen_core.logging import LLMCallEvent
+from autogen_core.models import ChatCompletionClient, CreateResult, UserMessage
+from autogen_ext.models.cache import ChatCompletionCache
+from autogen_ext.models.openai import OpenAIChatCompletionClient
+from openai import DefaultAsyncHttpxClient
+from pydantic import BaseModel
+import httpx
+
+from utils.generation_profiles import GenerationProfile, check_retry, get_generation_stats, get_profile
+from utils.llm_cache import LLMResponseCache, get_llm_cache, is_deterministic
+from utils.prompt_layout import get_cache_stats
+from utils.rate_limiter import RateLimiter, get_rate_limiter
+from utils.resilient_call import RetryPolicy, acall, admitted, get_retry_policy
+
+# Connections kept open per process; the optimizer never has more requests than this in flight
+MAX_CONNECTIONS = 20
+KEEPALIVE_EXPIRY = 60.0
+
+_clients: dict[tuple, ChatCompletionClient] = {}
+_http_client: httpx.AsyncClient | None = None
+_usage_handler: logging.Handler | None = None
+
+
+class LLMCacheStore(CacheStore):
+    """Adapts the SQLite response cache to ChatCompletionCache; keys are namespaced by model and temperature."""
+
+    def __init__(self, cache: LLMResponseCache, model: str, temperature: float, params: dict | None = None):
+        self.cache = cache
+        # The generation profile changes the answers, so it is part of the key
+        self.params = {"temperature": temperature, **(params or {})}
+        self.model = model
+
+    def get(self, key: str, default=None):
+        value = self.cache.get(self.cache.make_key(self.model, self.params, key))
+        # ChatCompletionCache rebuilds CreateResult objects from the stored dicts
+        return default if value is None else json.loads(value)
+
+    def set(self, key: str, value) -> None:
+        if isinstance(value, list):
+            data = [item.model_dump() if isinstance(item, BaseModel) else item for item in value]
+        else:
+            data = value.model_dump()
+        self.cache.set(self.cache.make_key(self.model, self.params, key), json.dumps(data))
+
+
+class ThreadedChatCompletionCache(ChatCompletionCache):
+    """ChatCompletionCache with its store reads and writes in a worker thread, so SQLite never blocks the event loop."""
+
+    async def create(self, messages, *, tools=(), tool_choice="auto", json_output=None, extra_create_args={},
+                     cancellation_token=None) -> CreateResult:
+        cached_result, cache_key = await asyncio.to_thread(
+            self._check_cache, messages, tools, json_output, extra_create_args
+        )
+        # A streamed entry ends with its CreateResult
+        if isinstance(cached_result, list):
+            cached_result = next((item for item in reversed(cached_result) if isinstance(item, CreateResult)), None)
+        if cached_result is not None:
+            cached_result.cached = True
+            return cached_result
+        result = await self.client.create(
+            messages, tools=tools, tool_choice=tool_choice, json_output=json_output,
+            extra_create_args=extra_create_args, cancellation_token=cancellation_token,
+        )
+        await asyncio.to_thread(self.store.set, cache_key, result)
+        return result
+
+    def create_stream(self, messages, *, tools=(), tool_choice="auto", json_output=None, extra_create_args={},
+                      cancellation_token=None):
+        async def _generator():
+            cached_result, cache_key = await asyncio.to_thread(
+                self._check_cache, messages, tools, json_output, extra_create_args
+            )
+            if isinstance(cached_result, CreateResult):
+                cached_result = [cached_result.content, cached_result] if cached_result.content else [cached_result]
+            if cached_result is not None:
+                for item in cached_result:
+                    if isinstance(item, CreateResult):
+                        item.cached = True
+                    yield item
+                return
+            output = []
+            async for item in self.client.create_stream(
+                messages, tools=tools, tool_choice=tool_choice, json_output=json_output,
+                extra_create_args=extra_create_args, cancellation_token=cancellation_token,
+            ):
+                output.append(item)
+                yield item
+            # Only a stream read to the end is stored; one stopped early is not
+            await asyncio.to_thread(self.store.set, cache_key, output)
+
+        return _generator()
+
+
+class CacheStatsHandler(logging.Handler):
+    """
+    Records the usage of every API completion autogen logs (LLMCallEvent) in the prompt cache stats. Streams only
+    log autogen's own usage without the cached tokens, so the streamed Summarizer calls are not counted.
+    """
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if isinstance(record.msg, LLMCallEvent):
+            response = record.msg.kwargs.get("response") or {}
+            get_cache_stats().record_usage(response.get("model"), response.get("usage"))
+
+
+def _track_usage() -> None:
+    global _usage_handler
+    if _usage_handler is None:
+        _usage_handler = CacheStatsHandler()
+        logger = logging.getLogger(EVENT_LOGGER_NAME)
+        logger.addHandler(_usage_handler)
+        # The events are logged at INFO
+        if not logger.isEnabledFor(logging.INFO):
+            logger.setLevel(logging.INFO)
+
+
+class WrappedChatCompletionClient(ChatCompletionClient):
+    """Delegates everything to the wrapped client; subclasses override create and create_stream."""
+
+    def __init__(self, client: ChatCompletionClient, model: str):
+        self.client = client
+        self.model = model
+
+    async def create(self, messages, **kwargs) -> CreateResult:
+        return await self.client.create(messages, **kwargs)
+
+    def create_stream(self, messages, **kwargs):
+        return self.client.create_stream(messages, **kwargs)
+
+    async def close(self) -> None:
+        await self.client.close()
+
+    def actual_usage(self):
+        return self.client.actual_usage()
+
+    def total_usage(self):
+        return self.client.total_usage()
+
+    def count_tokens(self, messages, **kwargs) -> int:
+        return self.client.count_tokens(messages, **kwargs)
+
+    def remaining_tokens(self, messages, **kwargs) -> int:
+        return self.client.remaining_tokens(messages, **kwargs)
+
+    @property
+    def capabilities(self):
+        return self.client.capabilities
+
+    @property
+    def model_info(self):
+        return self.client.model_info
+
+
+class RateLimitedChatCompletionClient(WrappedChatCompletionClient):
+    """Reserves rate limit capacity before each request and reconciles it with the returned usage."""
+
+    def __init__(self, client: ChatCompletionClient, limiter: RateLimiter, model: str, max_tokens: int | None = None):
+        super().__init__(client, model)
+        self.limiter = limiter
+        # The cap of the client's generation profile, unless a request sets its own
+        self.max_tokens = max_tokens
+
+    @staticmethod
+    def _prompt(messages) -> str:
+        return "\n".join(str(message.content) for message in messages)
+
+    async def create(self, messages, **kwargs) -> CreateResult:
+        max_tokens = kwargs.get("extra_create_args", {}).get("max_tokens", self.max_tokens)
+        async with self.limiter.limit(self.model, self._prompt(messages), max_tokens) as reservation:
+            admitted()
+            result = await self.client.create(messages, **kwargs)
+            reservation.reconcile(result.usage.prompt_tokens, result.usage.completion_tokens)
+        return result
+
+    def create_stream(self, messages, **kwargs):
+        async def _generator():
+            max_tokens = kwargs.get("extra_create_args", {}).get("max_tokens", self.max_tokens)
+            async with self.limiter.limit(self.model, self._prompt(messages), max_tokens) as reservation:
+                admitted()
+                stream = self.client.create_stream(messages, **kwargs)
+                try:
+                    async for item in stream:
+                        if isinstance(item, CreateResult):
+                            reservation.reconcile(item.usage.prompt_tokens, item.usage.completion_tokens)
+                        yield item
+                finally:
+                    # The Summarizer stops overrunning streams early; close the underlying request with it
+                    await stream.aclose()
+
+        return _generator()
+
+
+class ResilientChatCompletionClient(WrappedChatCompletionClient):
+    """
+    Retries transient failures and empty completions with backoff (see utils/resilient_call.py); failures
+    surface as LLMCallError instead of text. Streams are retried until their first chunk and never hedged.
+    With `queued`, the wrapped client waits for the rate limiter and each attempt is timed from its admission.
+    """
+
+    def __init__(self, client: ChatCompletionClient, model: str, policy: RetryPolicy | None = None,
+                 queued: bool = False):
+        super().__init__(client, model)
+        self.policy = policy or get_retry_policy()
+        self.queued = queued
+        # A hedged stream that loses the race would be left open
+        self.stream_policy = copy.copy(self.policy)
+        self.stream_policy.hedge = False
+
+    async def create(self, messages, **kwargs) -> CreateResult:
+        return await acall(
+            lambda: self.client.create(messages, **kwargs), self.model, self.policy, validate=lambda r: bool(r.content),
+            queued=self.queued,
+        )
+
+    def create_stream(self, messages, **kwargs):
+        async def first_chunk():
+            stream = self.client.create_stream(messages, **kwargs)
+            try:
+                return stream, await anext(stream)
+            except BaseException:
+                await stream.aclose()
+                raise
+
+        async def _generator():
+            stream, item = await acall(first_chunk, self.model, self.stream_policy, queued=self.queued)
+            try:
+                yield item
+                async for item in stream:
+                    yield item
+            finally:
+                await stream.aclose()
+
+        return _generator()
+
+
+class ProfiledChatCompletionClient(WrappedChatCompletionClient):
+    """
+    Records the finish reason of every output of an agent, cached ones included, and requests an output cut at
+    max_tokens again with the profile's retry_max_tokens (see utils/generation_profiles.py).
+    """
+
+    def __init__(self, client: ChatCompletionClient, model: str, agent: str):
+        super().__init__(client, model)
+        self.agent = agent
+
+    async def create(self, messages, **kwargs) -> CreateResult:
+        result = await self.client.create(messages, **kwargs)
+        get_generation_stats().record(self.agent, result.finish_reason, result.usage.completion_tokens)
+        profile = get_profile(self.agent)
+        if profile.retries(result.finish_reason):
+            print(f"[{self.agent}] Output cut at max_tokens, retrying with max_tokens={profile.retry_max_tokens}")
+            extra_create_args = {**kwargs.get("extra_create_args", {}), "max_tokens": profile.retry_max_tokens}
+            result = await self.client.create(messages, **{**kwargs, "extra_create_args": extra_create_args})
+            get_generation_stats().record(self.agent, result.finish_reason, result.usage.completion_tokens)
+            check_retry(self.agent, result.finish_reason)
+        return result
+
+    def create_stream(self, messages, **kwargs):
+        async def _generator():
+            stream = self.client.create_stream(messages, **kwargs)
+            finished = False
+            try:
+                async for item in stream:
+                    if isinstance(item, CreateResult):
+                        finished = True
+                        get_generation_stats().record(self.agent, item.finish_reason, item.usage.completion_tokens)
+                    yield item
+            finally:
+                await stream.aclose()
+                # Closed before its final result: the Summarizer stopped an overrunning stream
+                if not finished:
+                    get_generation_stats().record(self.agent, "aborted")
+
+        return _generator()
+
+
+def get_model_client(model: str, temperature: float = 0, base_url: str | None = None,
+                     agent: str | None = None) -> ChatCompletionClient:
+    """
+    Returns the shared client for (model, temperature, base_url, agent), creating it on first use. The client of
+    an agent sends the agent's generation profile with every request and records its finish reasons.
+    """
+    global _http_client
+    base_url = base_url or os.getenv("OPENAI_BASE_URL")
+    key = (model, temperature, base_url, agent)
+    client = _clients.get(key)
+    if client is None:
+        _track_usage()
+        profile = get_profile(agent) if agent is not None else GenerationProfile()
+        if _http_client is None:
+            _http_client = DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                )
+            )
+        client = OpenAIChatCompletionClient(
+            model=model,
+            api_key=os.getenv("OPENAI_API_KEY"),
+            temperature=temperature,
+            base_url=base_url,
+            http_client=_http_client,
+            # Retries are left to ResilientChatCompletionClient, so they go through the limiter and the deadline
+            max_retries=0,
+            **profile.params(),
+        )
+        limiter = get_rate_limiter()
+        if limiter is not None:
+            client = RateLimitedChatCompletionClient(client, limiter, model, profile.max_tokens)
+        client = ResilientChatCompletionClient(client, model, queued=limiter is not None)
+        # The cache wraps the limiter, so cache hits never wait for capacity
+        cache = get_llm_cache()
+        if cache is not None and is_deterministic(temperature):
+            client = ThreadedChatCompletionCache(client, LLMCacheStore(cache, model, temperature, profile.params()))
+        if agent is not None:
+            client = ProfiledChatCompletionClient(client, model, agent)
+        _clients[key] = client
+    return client
+
+
+async def close_model_clients() -> None:
+    """Closes every registered client and the shared connection pool."""
+    global _http_client
+    for client in _clients.values():
+        await client.close()
+    _clients.clear()
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+async def _stub_server(connections: list) -> asyncio.AbstractServer:
+    """Minimal keep-alive HTTP server answering every request with a fixed chat completion."""
+    body = json.dumps({
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "gpt-4o-mini-2024-07-18",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": "A stub about."}}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 4, "total_tokens": 14},
+    }).encode()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connections.append(writer)
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                length = 0
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                await reader.readexactly(length)
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                    + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+async def _benchmark(calls: int = 200):
+    connections = []
+    server = await _stub_server(connections)
+    base_url = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    # Measure the connections, not the response cache
+    os.environ["LLM_CACHE"] = "off"
+    messages = [UserMessage(content="Summarize this README.", source="user")]
+
+    # What the agents used to do: a new client per turn, closed right after
+    start = time.perf_counter()
+    for _ in range(calls):
+        client = OpenAIChatCompletionClient(model="gpt-4o-mini", api_key="stub", temperature=0, base_url=base_url)
+        await client.create(messages)
+        await client.close()
+    per_call = time.perf_counter() - start
+    per_call_connections = len(connections)
+
+    connections.clear()
+    start = time.perf_counter()
+    for _ in range(calls):
+        await get_model_client("gpt-4o-mini", 0, base_url).create(messages)
+    shared = time.perf_counter() - start
+    await close_model_clients()
+
+    server.close()
+    await server.wait_closed()
+    print(f"{calls} calls, client per call: {per_call * 1e3 / calls:.2f} ms/call, {per_call_connections} connections")
+    print(f"{calls} calls, shared client:   {shared * 1e3 / calls:.2f} ms/call, {len(connections)} connections")
+
+
+if __name__ == "__main__":
+    # Benchmark against a local OpenAI-compatible stub, from the METAGENT folder: python -m utils.model_clients
+    asyncio.run(_benchmark())
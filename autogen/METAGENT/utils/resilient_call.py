@@ -0,0 +1,360 @@
+"""LLM calls with backoff, per-attempt timeouts, an overall deadline and optional hedged requests;
+queued calls start their attempt once the rate limiter admits them."""
+import asyncio
+import concurrent.futures
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = {408, 409, 429}
+# Transport errors of openai/httpx/azure that carry no status code
+RETRYABLE_NAMES = {"APIConnectionError", "APITimeoutError", "ConnectError", "ConnectTimeout", "ReadTimeout",
+                   "RemoteProtocolError", "ServiceRequestError", "ServiceResponseError"}
+# Latencies kept per model for the hedging quantile
+LATENCY_WINDOW = 200
+
+
+class LLMCallError(Exception):
+    """Base class of the errors raised by the resilient call layer."""
+
+
+class LLMTimeoutError(LLMCallError, TimeoutError):
+    """An attempt took longer than the per-attempt timeout."""
+
+
+class LLMEmptyResponseError(LLMCallError):
+    """The API answered with an empty completion."""
+
+
+class LLMDeadlineExceeded(LLMCallError):
+    """The call did not succeed before its overall deadline."""
+
+
+class LLMAbandonedError(LLMCallError):
+    """Raised by admitted() in a request the call gave up on while it was queued; it is never sent."""
+
+
+class LLMRetriesExhausted(LLMCallError):
+    """Every attempt failed with a transient error."""
+
+    def __init__(self, message: str, attempts: int):
+        super().__init__(message)
+        self.attempts = attempts
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts: int = 5, base_delay: float = 1.0, max_delay: float = 30.0,
+                 timeout: float = 120.0, deadline: float = 600.0, hedge: bool = False,
+                 hedge_quantile: float = 0.95, hedge_min_samples: int = 20):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        """LLM_RETRY_ATTEMPTS, LLM_CALL_TIMEOUT and LLM_CALL_DEADLINE (seconds) and LLM_HEDGE=on."""
+        return cls(
+            max_attempts=int(os.getenv("LLM_RETRY_ATTEMPTS", 5)),
+            timeout=float(os.getenv("LLM_CALL_TIMEOUT", 120)),
+            deadline=float(os.getenv("LLM_CALL_DEADLINE", 600)),
+            hedge=os.getenv("LLM_HEDGE", "off").lower() == "on",
+        )
+
+    def backoff(self, attempt: int, error: BaseException) -> float:
+        """Full jitter: uniform in [0, base * 2**attempt], capped, but never shorter than the server's Retry-After."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, retry_after(error))
+
+
+class LatencyTracker:
+    """Recent successful latencies per model, used to decide when an attempt is slow enough to hedge."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self._latencies = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, key: str, seconds: float) -> None:
+        with self._lock:
+            self._latencies[key].append(seconds)
+
+    def quantile(self, key: str, q: float, min_samples: int) -> float | None:
+        with self._lock:
+            latencies = sorted(self._latencies[key])
+        if len(latencies) < min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+
+def status_code(error: BaseException) -> int | None:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def retry_after(error: BaseException) -> float:
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after", 0)) if headers is not None else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (LLMTimeoutError, LLMEmptyResponseError, TimeoutError, ConnectionError)):
+        return True
+    status = status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    if type(error).__name__ in RETRYABLE_NAMES:
+        return True
+    # Frameworks wrap the API error (e.g. Semantic Kernel's ServiceResponseException)
+    return error.__cause__ is not None and is_retryable(error.__cause__)
+
+
+class _Request:
+    """One request of an attempt; its clock starts when it is admitted, not when it is queued."""
+
+    def __init__(self, timeout: float, ends_at: float, ready, queued: bool):
+        self.timeout = timeout
+        self.ends_at = ends_at
+        # Set once the request is admitted or done
+        self.ready = ready
+        self.admitted_at = None
+        self.abandoned = False
+        if not queued:
+            self.admit()
+
+    def admit(self) -> None:
+        if self.admitted_at is None:
+            self.admitted_at = time.monotonic()
+            self.timeout = max(0.0, min(self.timeout, self.ends_at - self.admitted_at))
+            self.ready.set()
+
+
+_request: contextvars.ContextVar[_Request | None] = contextvars.ContextVar("llm_request", default=None)
+
+
+def admitted() -> None:
+    """
+    Called by the attempt function of a queued call once the rate limiter admits its request: the attempt's
+    timeout and latency start now. Raises LLMAbandonedError if the call stopped waiting for this request.
+    """
+    request = _request.get()
+    if request is None:
+        return
+    if request.abandoned:
+        raise LLMAbandonedError("Request given up on while queued")
+    request.admit()
+
+
+def request_timeout() -> float | None:
+    """Seconds the current request may run, for the HTTP client's own timeout; None outside a resilient call."""
+    request = _request.get()
+    return None if request is None else request.timeout
+
+
+_policy: RetryPolicy | None = None
+_tracker = LatencyTracker()
+# Sync attempts run here so they can be timed out and hedged; see request_timeout() for the ones given up on
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-call")
+
+
+def get_retry_policy() -> RetryPolicy:
+    global _policy
+    if _policy is None:
+        _policy = RetryPolicy.from_env()
+    return _policy
+
+
+def _check(result, validate):
+    if validate is not None and not validate(result):
+        raise LLMEmptyResponseError("Empty completion")
+    return result
+
+
+async def _aattempt(fn: Callable[[], Awaitable[T]], key: str, policy: RetryPolicy, deadline: float, validate,
+                    queued: bool) -> T:
+    tasks: dict[asyncio.Future, _Request] = {}
+
+    def send(ends_at: float) -> _Request:
+        request = _Request(policy.timeout, ends_at, asyncio.Event(), queued)
+        token = _request.set(request)
+        try:
+            # The task copies the current context, so admitted() and request_timeout() see its own request
+            task = asyncio.ensure_future(fn())
+        finally:
+            _request.reset(token)
+        task.add_done_callback(lambda _: request.ready.set())
+        tasks[task] = request
+        return request
+
+    first = send(deadline)
+    try:
+        # Queued in the rate limiter: only the deadline runs
+        try:
+            await asyncio.wait_for(first.ready.wait(), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            raise LLMDeadlineExceeded(f"{key}: not admitted by the rate limiter within the {policy.deadline:g}s "
+                                      f"deadline") from None
+        started = first.admitted_at or time.monotonic()
+        timeout = min(policy.timeout, deadline - started)
+        hedge_after = _tracker.quantile(key, policy.hedge_quantile, policy.hedge_min_samples) if policy.hedge else None
+        if hedge_after is not None and hedge_after < timeout:
+            done, _ = await asyncio.wait(list(tasks), timeout=max(0.0, started + hedge_after - time.monotonic()))
+            if not done:
+                print(f"[{key}] No answer after {hedge_after:.1f}s (p{policy.hedge_quantile * 100:.0f}), hedging")
+                send(started + timeout)
+        error = None
+        while tasks:
+            remaining = started + timeout - time.monotonic()
+            done, _ = await asyncio.wait(list(tasks), timeout=max(0.0, remaining), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise LLMTimeoutError(f"No answer from {key} within {timeout:g}s")
+            for task in done:
+                request = tasks.pop(task)
+                try:
+                    result = _check(task.result(), validate)
+                except Exception as e:
+                    # The hedge may still succeed
+                    error = e
+                    continue
+                _tracker.record(key, time.monotonic() - (request.admitted_at or started))
+                return result
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _attempt(fn: Callable[[], T], key: str, policy: RetryPolicy, deadline: float, validate, queued: bool) -> T:
+    futures: dict[concurrent.futures.Future, _Request] = {}
+
+    def send(ends_at: float) -> _Request:
+        request = _Request(policy.timeout, ends_at, threading.Event(), queued)
+        token = _request.set(request)
+        try:
+            context = contextvars.copy_context()
+        finally:
+            _request.reset(token)
+        future = _executor.submit(context.run, fn)
+        future.add_done_callback(lambda _: request.ready.set())
+        futures[future] = request
+        return request
+
+    first = send(deadline)
+    try:
+        if not first.ready.wait(max(0.0, deadline - time.monotonic())):
+            raise LLMDeadlineExceeded(f"{key}: not admitted by the rate limiter within the {policy.deadline:g}s "
+                                      f"deadline")
+        started = first.admitted_at or time.monotonic()
+        timeout = min(policy.timeout, deadline - started)
+        hedge_after = _tracker.quantile(key, policy.hedge_quantile, policy.hedge_min_samples) if policy.hedge else None
+        if hedge_after is not None and hedge_after < timeout:
+            done, _ = concurrent.futures.wait(list(futures), timeout=max(0.0, started + hedge_after - time.monotonic()))
+            if not done:
+                print(f"[{key}] No answer after {hedge_after:.1f}s (p{policy.hedge_quantile * 100:.0f}), hedging")
+                send(started + timeout)
+        error = None
+        while futures:
+            remaining = started + timeout - time.monotonic()
+            done, _ = concurrent.futures.wait(
+                list(futures), timeout=max(0.0, remaining), return_when=concurrent.futures.FIRST_COMPLETED
+            )
+            if not done:
+                raise LLMTimeoutError(f"No answer from {key} within {timeout:g}s")
+            for future in done:
+                request = futures.pop(future)
+                try:
+                    result = _check(future.result(), validate)
+                except Exception as e:
+                    error = e
+                    continue
+                _tracker.record(key, time.monotonic() - (request.admitted_at or started))
+                return result
+        raise error
+    finally:
+        # A thread cannot be stopped: a queued request is dropped when admitted, a sent one ends at its
+        # request_timeout() in the HTTP client
+        for future, request in futures.items():
+            request.abandoned = True
+            future.cancel()
+
+
+def _next_delay(key: str, policy: RetryPolicy, attempt: int, error: Exception, started: float) -> float:
+    if not is_retryable(error):
+        raise error
+    if attempt + 1 == policy.max_attempts:
+        raise LLMRetriesExhausted(f"{key}: {policy.max_attempts} attempts failed, last: {error!r}",
+                                  policy.max_attempts) from error
+    delay = policy.backoff(attempt, error)
+    if time.monotonic() - started + delay >= policy.deadline:
+        raise LLMDeadlineExceeded(f"{key}: no answer within the {policy.deadline:g}s deadline, last: {error!r}") from error
+    print(f"[{key}] Attempt {attempt + 1} failed ({type(error).__name__}: {error}), retrying in {delay:.1f}s")
+    return delay
+
+
+async def acall(fn: Callable[[], Awaitable[T]], key: str, policy: RetryPolicy | None = None,
+                validate: Callable[[T], bool] | None = None, queued: bool = False) -> T:
+    """
+    Awaits fn() with retries; `key` names the model for logs and latencies, `validate` rejects empty results.
+    With `queued`, fn waits for the rate limiter and calls admitted() before it sends its request.
+    """
+    policy = policy or get_retry_policy()
+    started = time.monotonic()
+    for attempt in range(policy.max_attempts):
+        try:
+            return await _aattempt(fn, key, policy, started + policy.deadline, validate, queued)
+        except Exception as e:
+            delay = _next_delay(key, policy, attempt, e, started)
+        await asyncio.sleep(delay)
+
+
+def call(fn: Callable[[], T], key: str, policy: RetryPolicy | None = None,
+         validate: Callable[[T], bool] | None = None, queued: bool = False) -> T:
+    """Blocking counterpart of acall; fn passes request_timeout() to its HTTP client."""
+    policy = policy or get_retry_policy()
+    started = time.monotonic()
+    for attempt in range(policy.max_attempts):
+        try:
+            return _attempt(fn, key, policy, started + policy.deadline, validate, queued)
+        except Exception as e:
+            delay = _next_delay(key, policy, attempt, e, started)
+        time.sleep(delay)
+
+
+async def _demo(calls: int = 400):
+    """Simulated API with a heavy tail (5% of the answers take 10x longer): p99 latency without and with hedging."""
+    global _tracker
+    rng = random.Random(0)
+
+    async def request():
+        await asyncio.sleep(0.02 * (10 if rng.random() < 0.05 else 1) * rng.uniform(0.8, 1.2))
+        return "An about."
+
+    for hedge in (False, True):
+        _tracker = LatencyTracker()
+        policy = RetryPolicy(hedge=hedge)
+        latencies = []
+        for _ in range(calls):
+            start = time.perf_counter()
+            await acall(request, "demo", policy)
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        print(f"hedge={'on ' if hedge else 'off'}  p50 {latencies[calls // 2] * 1e3:6.1f} ms  "
+              f"p99 {latencies[int(calls * 0.99)] * 1e3:6.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(_demo())
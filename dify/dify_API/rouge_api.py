@@ -1,8 +1,34 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Body, HTTPException, Header
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from rouge_score import rouge_scorer
 
-app = FastAPI()
+# Set ROUGE_API_VERBOSE=1 to print the received payloads again
+VERBOSE = os.getenv("ROUGE_API_VERBOSE", "0") == "1"
+# Worker processes for /rouge/batch (default: number of CPUs) and pairs sent to a worker at once
+BATCH_WORKERS = int(os.getenv("ROUGE_API_WORKERS", "0")) or None
+BATCH_CHUNK_SIZE = 64
+
+# Built once per process: creating a RougeScorer (and its stemmer) per request dominated the request time
+scorer = rouge_scorer.RougeScorer(["rouge1", "rouge2", "rougeL"], use_stemmer=True)
+
+executor = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global executor
+    executor = ProcessPoolExecutor(max_workers=BATCH_WORKERS)
+    yield
+    executor.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Define a hardcoded API key (replace this with your own key)
 EXPECTED_API_KEY = "123456"  # TODO: Replace with your actual API key
@@ -12,57 +38,109 @@ class InputData(BaseModel):
     point: str
     params: dict
 
+class RougePair(BaseModel):
+    ground_truth: str
+    generated: str
+
+class BatchInputData(BaseModel):
+    pairs: list[RougePair]
+
+
+def log(message: str):
+    if VERBOSE:
+        print(message)
+
+
+def check_api_key(authorization: str):
+    auth_scheme, _, api_key = (authorization or "").partition(" ")
+
+    if auth_scheme.lower() != "bearer" or api_key != EXPECTED_API_KEY:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+
 @app.post("/rouge")
 async def dify_receive(data: InputData = Body(...), authorization: str = Header(None)):
     """
     Receive API query data from Dify.
     """
     # Check API key authentication
-    auth_scheme, _, api_key = authorization.partition(" ")
-
-    if auth_scheme.lower() != "bearer" or api_key != EXPECTED_API_KEY:
-        raise HTTPException(status_code=401, detail="Unauthorized")
+    check_api_key(authorization)
 
     point = data.point
 
     # Debugging logs
-    print(f"Received point: {point}")
-    print(f"Params: {data.params}")
+    log(f"Received point: {point}")
+    log(f"Params: {data.params}")
 
     # Ping-Pong Test
     if point == "ping":
         return {"result": "pong"}
 
-    # Call ROUGE computation inside the handler function
+    # Call ROUGE computation inside the handler function, off the event loop
     if point == "app.external_data_tool.query":
-        return handle_app_external_data_tool_query(params=data.params)
+        return await run_in_threadpool(handle_app_external_data_tool_query, params=data.params)
 
     raise HTTPException(status_code=400, detail="Not implemented")
 
-def handle_app_external_data_tool_query(params: dict):
+
+@app.post("/rouge/batch")
+async def dify_receive_batch(data: BatchInputData = Body(...), authorization: str = Header(None)):
     """
-    Handles external data tool query and computes ROUGE score.
+    Scores a whole list of (ground_truth, generated) pairs in one round trip.
+    Results come back in the order of the pairs.
     """
-    # Extract expected parameters
-    ground_truth = params.get("ground_truth")
-    generated = params.get("generated")
+    check_api_key(authorization)
 
-    # Debugging logs
-    print(f"Ground Truth: {ground_truth}")
-    print(f"Generated: {generated}")
+    log(f"Received batch of {len(data.pairs)} pairs")
+
+    pairs = [(pair.ground_truth, pair.generated) for pair in data.pairs]
+    if len(pairs) <= BATCH_CHUNK_SIZE:
+        # Not worth shipping to another process
+        results = await run_in_threadpool(score_pairs, pairs)
+    else:
+        loop = asyncio.get_running_loop()
+        chunks = [pairs[start:start + BATCH_CHUNK_SIZE] for start in range(0, len(pairs), BATCH_CHUNK_SIZE)]
+        chunk_results = await asyncio.gather(
+            *(loop.run_in_executor(executor, score_pairs, chunk) for chunk in chunks)
+        )
+        results = [result for chunk_result in chunk_results for result in chunk_result]
+
+    return {"result": results}
 
+
+def score_pair(ground_truth: str, generated: str) -> dict:
     # Validate input
     if not ground_truth or not generated:
         return {"error": "Both 'ground_truth' and 'generated' text are required"}
 
     # Compute ROUGE scores
-    scorer = rouge_scorer.RougeScorer(["rouge1", "rouge2", "rougeL"], use_stemmer=True)
     scores = scorer.score(ground_truth, generated)
 
     return {
-        "result": {
-            "rouge1": scores["rouge1"].fmeasure,
-            "rouge2": scores["rouge2"].fmeasure,
-            "rougeL": scores["rougeL"].fmeasure
-        }
+        "rouge1": scores["rouge1"].fmeasure,
+        "rouge2": scores["rouge2"].fmeasure,
+        "rougeL": scores["rougeL"].fmeasure
     }
+
+
+def score_pairs(pairs: list[tuple[str, str]]) -> list[dict]:
+    return [score_pair(ground_truth, generated) for ground_truth, generated in pairs]
+
+
+def handle_app_external_data_tool_query(params: dict):
+    """
+    Handles external data tool query and computes ROUGE score.
+    """
+    # Extract expected parameters
+    ground_truth = params.get("ground_truth")
+    generated = params.get("generated")
+
+    # Debugging logs
+    log(f"Ground Truth: {ground_truth}")
+    log(f"Generated: {generated}")
+
+    scores = score_pair(ground_truth, generated)
+    if "error" in scores:
+        return scores
+
+    return {"result": scores}
@@ -1,45 +1,61 @@
+import json
 from typing import Mapping
 from werkzeug import Request, Response
-from flask import Flask, jsonify
 from dify_plugin import Endpoint
 from rouge_score import rouge_scorer
 
-app = Flask(__name__)
+# Built once per plugin process instead of once per request
+scorer = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'], use_stemmer=True)
+
+
+def score_pair(reference: str, hypothesis: str) -> dict:
+    scores = scorer.score(reference, hypothesis)
+    return {
+        name: {
+            "precision": round(scores[name].precision, 4),
+            "recall": round(scores[name].recall, 4),
+            "f1": round(scores[name].fmeasure, 4),
+        }
+        for name in ('rouge1', 'rouge2', 'rougeL')
+    }
+
 
 class RougeScoreEndpoint(Endpoint):
- 
+
     def _invoke(self, r: Request, values: Mapping, settings: Mapping) -> Response:
-        # reference = values.get("reference", "")
-        # hypothesis = values.get("hypothesis", "")
-
-        # scorer = rouge_scorer.RougeScorer(['rouge1', 'rouge2', 'rougeL'], use_stemmer=True)
-        # scores = scorer.score(reference, hypothesis)
-
-        # result = {
-        #     "rouge1": {
-        #         "precision": round(scores['rouge1'].precision, 4),
-        #         "recall": round(scores['rouge1'].recall, 4),
-        #         "f1": round(scores['rouge1'].fmeasure, 4),
-        #     },
-        #     "rouge2": {
-        #         "precision": round(scores['rouge2'].precision, 4),
-        #         "recall": round(scores['rouge2'].recall, 4),
-        #         "f1": round(scores['rouge2'].fmeasure, 4),
-        #     },
-        #     "rougeL": {
-        #         "precision": round(scores['rougeL'].precision, 4),
-        #         "recall": round(scores['rougeL'].recall, 4),
-        #         "f1": round(scores['rougeL'].fmeasure, 4),
-        #     }
-        # }
-
-        # with app.app_context():
-        #     return jsonify(result)
         """
-        Invokes the endpoint with the given request.
+        Scores newline-delimited JSON pairs, one {"reference": ..., "hypothesis": ...} object per line.
+        Each result is written back as its own JSON line as soon as it is computed,
+        so large batches are never buffered in memory.
         """
         app_id = values["app_id"]
+        lines = r.stream
+
         def generator():
-            yield f"{app_id} <br>"
-        return Response(generator(), status=200, content_type="text/html")
+            for line_number, line in enumerate(lines, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+
+                try:
+                    pair = json.loads(line)
+                    reference = pair.get("reference", "")
+                    hypothesis = pair.get("hypothesis", "")
+                except (ValueError, AttributeError):
+                    yield json.dumps({"app_id": app_id, "line": line_number, "error": "Invalid JSON pair"}) + "\n"
+                    continue
+
+                if not reference or not hypothesis:
+                    yield json.dumps({
+                        "app_id": app_id,
+                        "line": line_number,
+                        "error": "Both 'reference' and 'hypothesis' text are required",
+                    }) + "\n"
+                    continue
+
+                result = {"app_id": app_id, "line": line_number, **score_pair(reference, hypothesis)}
+                if "id" in pair:
+                    result["id"] = pair["id"]
+                yield json.dumps(result) + "\n"
 
+        return Response(generator(), status=200, content_type="application/x-ndjson")
@@ -0,0 +1,153 @@
+import copy
+import functools
+import json
+
+from haystack import component
+from haystack.components.generators.chat import AzureOpenAIChatGenerator, OpenAIChatGenerator
+from haystack.dataclasses import ChatMessage
+from haystack.tools import flatten_tools_or_toolsets
+
+from tools.generation_profiles import check_retry, get_generation_stats, get_profile
+from tools.llm_cache import get_llm_cache, is_deterministic
+from tools.prompt_layout import get_cache_stats
+from tools.rate_limiter import get_rate_limiter
+from tools.resilient_call import admitted, call, get_retry_policy, request_timeout
+
+
+def _has_reply(result: dict) -> bool:
+    return any((reply.text or "").strip() or reply.tool_calls for reply in result["replies"])
+
+
+def _api_run(model, run, messages, streaming_callback, generation_kwargs, tools, tools_strict, max_tokens) -> dict:
+    # Requests that reach the API wait for the model's shared RPM/TPM budget
+    limiter = get_rate_limiter()
+
+    def send() -> dict:
+        # The attempt is timed from here, and the HTTP client aborts the request when the attempt is given up on
+        admitted()
+        timeout = request_timeout()
+        kwargs = generation_kwargs if timeout is None else {**(generation_kwargs or {}), "timeout": timeout}
+        return run(messages, streaming_callback, kwargs, tools=tools, tools_strict=tools_strict)
+
+    def attempt() -> dict:
+        if limiter is None:
+            result = send()
+        else:
+            prompt = messages if isinstance(messages, str) else "\n".join(message.text or "" for message in messages)
+            with limiter.limit_sync(model, prompt, max_tokens) as reservation:
+                result = send()
+                for reply in result["replies"]:
+                    usage = reply.meta.get("usage") or {}
+                    reservation.reconcile(usage.get("prompt_tokens"), usage.get("completion_tokens"))
+        # One usage per request, repeated on each of its replies
+        if result["replies"]:
+            get_cache_stats().record_usage(model, result["replies"][0].meta.get("usage"))
+        return result
+
+    # Empty replies and transient errors are retried with backoff instead of by the scripts;
+    # a hedged duplicate would stream its tokens twice
+    policy = get_retry_policy()
+    if streaming_callback is not None and policy.hedge:
+        policy = copy.copy(policy)
+        policy.hedge = False
+    return call(attempt, model, policy, validate=_has_reply, queued=True)
+
+
+def _record_finish(generator, result: dict):
+    # Finish reason of the API answer under the generator's agent (see tools/generation_profiles.py)
+    if generator.agent is None or not result["replies"]:
+        return None
+    meta = result["replies"][0].meta
+    usage = meta.get("usage") or {}
+    get_generation_stats().record(generator.agent, meta.get("finish_reason"), usage.get("completion_tokens"))
+    return meta.get("finish_reason")
+
+
+def _generate(generator, model, run, messages, streaming_callback, generation_kwargs, tools, tools_strict,
+              max_tokens) -> dict:
+    # A Teacher or Combiner answer cut at max_tokens is requested once more with the profile's retry_max_tokens,
+    # and raises TruncatedOutputError when that one is cut too: a truncated prompt is never used
+    result = _api_run(model, run, messages, streaming_callback, generation_kwargs, tools, tools_strict, max_tokens)
+    finish_reason = _record_finish(generator, result)
+    if generator.agent is None or not get_profile(generator.agent).retries(finish_reason):
+        return result
+    retry_max_tokens = get_profile(generator.agent).retry_max_tokens
+    print(f"[{generator.agent}] Output cut at max_tokens, retrying with max_tokens={retry_max_tokens}")
+    retry_kwargs = {**(generator.generation_kwargs or {}), **(generation_kwargs or {})}
+    retry_kwargs.pop("max_completion_tokens", None)
+    retry_kwargs["max_tokens"] = retry_max_tokens
+    result = _api_run(model, run, messages, streaming_callback, retry_kwargs, tools, tools_strict, retry_max_tokens)
+    check_retry(generator.agent, _record_finish(generator, result))
+    return result
+
+
+def _cached_run(generator, run, messages, streaming_callback, generation_kwargs, tools, tools_strict) -> dict:
+    # Only temperature 0 calls are cached; everything else goes straight to the API
+    merged_kwargs = {**(generator.generation_kwargs or {}), **(generation_kwargs or {})}
+    model = getattr(generator, "azure_deployment", None) or generator.model
+    max_tokens = merged_kwargs.get("max_completion_tokens") or merged_kwargs.get("max_tokens")
+    cache = get_llm_cache() if is_deterministic(merged_kwargs.get("temperature")) else None
+    if cache is None:
+        return _generate(generator, model, run, messages, streaming_callback, generation_kwargs, tools, tools_strict,
+                         max_tokens)
+
+    params = {
+        "generation_kwargs": merged_kwargs,
+        # Toolsets are flattened into their tools, as the generator does before sending them
+        "tools": [tool.tool_spec for tool in flatten_tools_or_toolsets(tools or generator.tools)],
+        "tools_strict": tools_strict,
+    }
+    prompt = messages if isinstance(messages, str) else [message.to_dict() for message in messages]
+    cache_key = cache.make_key(model, params, prompt)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return {"replies": [ChatMessage.from_dict(reply) for reply in json.loads(cached)]}
+
+    result = _generate(generator, model, run, messages, streaming_callback, generation_kwargs, tools, tools_strict,
+                       max_tokens)
+    cache.set(cache_key, json.dumps([reply.to_dict() for reply in result["replies"]]))
+    return result
+
+
+def _with_profile(parent_init):
+    def __init__(self, *args, agent: str | None = None, **kwargs):
+        # Retries are left to resilient_call, so they go through the rate limiter and the deadline
+        kwargs.setdefault("max_retries", 0)
+        # The agent's generation profile fills in the generation kwargs the script does not set
+        if agent is not None:
+            kwargs["generation_kwargs"] = {**get_profile(agent).params(), **(kwargs.get("generation_kwargs") or {})}
+        parent_init(self, *args, **kwargs)
+        self.agent = agent
+    return __init__
+
+
+def _with_cache(parent_run):
+    # functools.wraps keeps the parent's signature and output types, so the input sockets stay the same
+    @functools.wraps(parent_run)
+    def run(self, messages, streaming_callback=None, generation_kwargs=None, *, tools=None, tools_strict=None):
+        return _cached_run(
+            self, functools.partial(parent_run, self), messages, streaming_callback, generation_kwargs, tools, tools_strict
+        )
+    return run
+
+
+@component
+class CachedOpenAIChatGenerator(OpenAIChatGenerator):
+    """
+    OpenAIChatGenerator answering temperature 0 calls from the on-disk LLM response cache, rate limited and retried.
+    With `agent`, it sends that agent's generation profile and records its finish reasons.
+    """
+
+    __init__ = _with_profile(OpenAIChatGenerator.__init__)
+    run = _with_cache(OpenAIChatGenerator.run)
+
+
+@component
+class CachedAzureOpenAIChatGenerator(AzureOpenAIChatGenerator):
+    """
+    AzureOpenAIChatGenerator answering temperature 0 calls from the on-disk LLM response cache, rate limited and
+    retried. With `agent`, it sends that agent's generation profile and records its finish reasons.
+    """
+
+    __init__ = _with_profile(AzureOpenAIChatGenerator.__init__)
+    run = _with_cache(AzureOpenAIChatGenerator.run)
@@ -1,6 +1,4 @@
-from rouge_score import rouge_scorer
+from metric.rouge import ROUGE
 
 def compute_rouge(generated_text: str, reference_text: str) -> float:
-    scorer = rouge_scorer.RougeScorer(['rougeL'], use_stemmer=True)
-    scores = scorer.score(reference_text, generated_text)
-    return scores['rougeL'].fmeasure
+    return ROUGE().get_RougeL(string_1=generated_text, string_2=reference_text)
@@ -5,7 +5,7 @@ from haystack.components.generators.chat import OpenAIChatGenerator
 from haystack.components.agents import Agent
 from haystack.dataclasses import ChatMessage
 from haystack.utils import Secret
-from rouge_score import rouge_scorer
+from metric.rouge import ROUGE
 from haystack.tools import tool
 from prompt_orig import EXTRACTOR_PROMPT, INITIAL_SUMMARIZER_PROMPT, TEACHER_PROMPT, COMBINE_PROMPT, TEACHER_PROMPT_ALPHA
 
@@ -15,10 +15,9 @@ class RougeEvaluator:
     def run(self, generated_about: str, ground_truth: str):
         print("\033[90mGround truth:\033[0m", ground_truth)
         print("\033[90mGenerated about:\033[0m", generated_about)
-        scorer = rouge_scorer.RougeScorer(['rougeL'], use_stemmer=True)
-        score = scorer.score(ground_truth, generated_about)
-        print(f"\033[96m[METRIC] ROUGE-L score: {score['rougeL'].fmeasure:.4f}\033[0m")
-        return {"score": score["rougeL"].fmeasure}
+        score = ROUGE().get_RougeL(string_1=generated_about, string_2=ground_truth)
+        print(f"\033[96m[METRIC] ROUGE-L score: {score:.4f}\033[0m")
+        return {"score": score}
 
 
 @component
@@ -31,10 +30,8 @@ class MessageTextExtractor:
 @tool
 def calculate_rouge_score(description: str, generated_about: str) -> float:
     """Compute ROUGE-L score between generated and ground truth descriptions."""
-    scorer = rouge_scorer.RougeScorer(['rougeL'], use_stemmer=True)
-    score = scorer.score(description, generated_about)
-    print(f"\033[96m[TOOL FUNCTION CALL] ROUGE-L score: {score['rougeL'].fmeasure:.4f}\033[0m")
-    global_scorer = score["rougeL"].fmeasure
+    global_scorer = ROUGE().get_RougeL(string_1=generated_about, string_2=description)
+    print(f"\033[96m[TOOL FUNCTION CALL] ROUGE-L score: {global_scorer:.4f}\033[0m")
     return global_scorer
 
 @tool
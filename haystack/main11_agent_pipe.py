@@ -7,6 +7,7 @@ from haystack.dataclasses import ChatMessage
 from haystack.utils import Secret
 from haystack.tools import tool
 from prompt_orig import EXTRACTOR_PROMPT, INITIAL_SUMMARIZER_PROMPT, TEACHER_PROMPT, COMBINE_PROMPT
+from metric.rouge import ROUGE
 
 @tool
 def noop() -> str:
@@ -22,10 +23,9 @@ class MessageTextExtractor:
 class RougeEvaluator:
     @component.output_types(score=float)
     def run(self, generated_about: str, ground_truth: str):
-        from rouge_score import rouge_scorer
-        score = rouge_scorer.RougeScorer(['rougeL'], use_stemmer=True).score(ground_truth, generated_about)
-        print(f"\033[93m[ROUGE-L SCORE] → {score['rougeL'].fmeasure:.4f}\033[0m")
-        return {"score": score["rougeL"].fmeasure}
+        score = ROUGE().get_RougeL(string_1=generated_about, string_2=ground_truth)
+        print(f"\033[93m[ROUGE-L SCORE] → {score:.4f}\033[0m")
+        return {"score": score}
 
 # Load dataset
 print("\033[92m[INFO] Loading dataset from data/train_data1.csv...\033[0m")
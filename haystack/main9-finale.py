@@ -1,11 +1,14 @@
 import os
 import pandas as pd
 from haystack import component
-from haystack.components.generators.chat import OpenAIChatGenerator
+from components.cached_chat_generator import CachedOpenAIChatGenerator
+from tools.extraction_store import extract_once
+from tools.readme_budget import fit_readme, get_readme_budget
+from tools.generation_profiles import TruncatedOutputError, get_generation_stats
 from haystack.components.agents import Agent
 from haystack.dataclasses import ChatMessage
 from haystack.utils import Secret
-from rouge_score import rouge_scorer
+from metric.rouge import ROUGE
 from haystack.tools import tool
 from prompt_orig import EXTRACTOR_PROMPT, INITIAL_SUMMARIZER_PROMPT, TEACHER_PROMPT, COMBINE_PROMPT, TEACHER_PROMPT_ALPHA
 
@@ -15,10 +18,9 @@ class RougeEvaluator:
     def run(self, generated_about: str, ground_truth: str):
         print("\033[90mGround truth:\033[0m", ground_truth)
         print("\033[90mGenerated about:\033[0m", generated_about)
-        scorer = rouge_scorer.RougeScorer(['rougeL'], use_stemmer=True)
-        score = scorer.score(ground_truth, generated_about)
-        print(f"\033[96m[METRIC] ROUGE-L score: {score['rougeL'].fmeasure:.4f}\033[0m")
-        return {"score": score["rougeL"].fmeasure}
+        score = ROUGE().get_RougeL(string_1=generated_about, string_2=ground_truth)
+        print(f"\033[96m[METRIC] ROUGE-L score: {score:.4f}\033[0m")
+        return {"score": score}
 
 @component
 class MessageTextExtractor:
@@ -30,9 +32,7 @@ class MessageTextExtractor:
 @tool
 def calculate_rouge_score(generated_about: str, ground_truth: str) -> float:
     """Compute ROUGE-L score between generated and ground truth descriptions."""
-    scorer = rouge_scorer.RougeScorer(['rougeL'], use_stemmer=True)
-    score = scorer.score(ground_truth, generated_about)
-    return score["rougeL"].fmeasure
+    return ROUGE().get_RougeL(string_1=generated_about, string_2=ground_truth)
 
 @tool
 def noop() -> str:
@@ -41,7 +41,8 @@ def noop() -> str:
 
 # Agent definitions
 extractor_agent = Agent(
-    chat_generator=OpenAIChatGenerator(
+    chat_generator=CachedOpenAIChatGenerator(
+        agent="extractor",
         model="gpt-4o-mini",
         generation_kwargs={"temperature": 0.0},
         api_key=Secret.from_env_var("OPENAI_API_KEY")
@@ -50,7 +51,8 @@ extractor_agent = Agent(
 )
 
 summarizer_agent = Agent(
-    chat_generator=OpenAIChatGenerator(
+    chat_generator=CachedOpenAIChatGenerator(
+        agent="summarizer",
         model="gpt-4o-mini",
         generation_kwargs={"temperature": 0.0},
         api_key=Secret.from_env_var("OPENAI_API_KEY")
@@ -60,7 +62,8 @@ summarizer_agent = Agent(
 )
 
 teacher_agent = Agent(
-    chat_generator=OpenAIChatGenerator(
+    chat_generator=CachedOpenAIChatGenerator(
+        agent="teacher",
         model="gpt-4o",
         generation_kwargs={"temperature": 0.7},
         api_key=Secret.from_env_var("OPENAI_API_KEY")
@@ -70,7 +73,8 @@ teacher_agent = Agent(
 )
 
 combine_agent = Agent(
-    chat_generator=OpenAIChatGenerator(
+    chat_generator=CachedOpenAIChatGenerator(
+        agent="combiner",
         model="gpt-4o",
         generation_kwargs={"temperature": 0.2},
         api_key=Secret.from_env_var("OPENAI_API_KEY")
@@ -84,6 +88,20 @@ summarizer_agent_prompt_start = ChatMessage.from_system(INITIAL_SUMMARIZER_PROMP
 teacher_agent_prompt = ChatMessage.from_system(TEACHER_PROMPT)
 combine_agent_prompt = ChatMessage.from_system(COMBINE_PROMPT)
 
+
+def extract_readme(readme: str) -> str:
+    """Runs the ExtractorAgent once per README; later iterations and phases reuse the stored extraction."""
+    readme = fit_readme(readme)
+
+    def extract() -> str:
+        extractor_result = extractor_agent.run(messages=[
+            extractor_agent_prompt,
+            ChatMessage.from_user(readme)
+        ])
+        return extractor_result["messages"][-1].text
+    return extract_once(readme, EXTRACTOR_PROMPT, "gpt-4o-mini", extract)
+
+
 train_df = pd.read_csv("data/train_data.csv")
 print(f"\033[92m[INFO] Dataset loaded with {len(train_df)} rows.\033[0m")
 
@@ -106,11 +124,7 @@ for idx, row in train_df.iterrows():
         print(f"\n\033[95m[INFO] Iteration {iteration}...\033[0m")
 
         # 1. ExtractorAgent
-        extractor_result = extractor_agent.run(messages=[
-            extractor_agent_prompt,
-            ChatMessage.from_user(readme)
-        ])
-        extracted_text = extractor_result["messages"][-1].text
+        extracted_text = extract_readme(readme)
         print(f"\033[93m[EXTRACTED TEXT]\033[0m\n{extracted_text}")
 
 
@@ -125,8 +139,7 @@ for idx, row in train_df.iterrows():
         print(f"\033[92m[GENERATED ABOUT]\033[0m\n{generated_about}")
 
         # 3. ROUGE Evaluation
-        scorer = rouge_scorer.RougeScorer(['rougeL'], use_stemmer=True)
-        rouge_score = scorer.score(description, generated_about)["rougeL"].fmeasure
+        rouge_score = ROUGE().get_RougeL(string_1=generated_about, string_2=description)
         print(f"\033[96m[ROUGE-L]: {rouge_score:.4f}\033[0m")
 
         if rouge_score > best_score:
@@ -160,11 +173,16 @@ for idx, row in train_df.iterrows():
 </CURRENT_PROMPT>"""
 
         print(f"\033[93m[TEACHER INPUT]\033[0m\n{teacher_input}")
-        teacher_result = teacher_agent.run(messages=[
-            teacher_agent_prompt,
-            ChatMessage.from_user(teacher_input)
-        ])
-        new_summarizer_prompt = teacher_result["messages"][-1].text
+        try:
+            teacher_result = teacher_agent.run(messages=[
+                teacher_agent_prompt,
+                ChatMessage.from_user(teacher_input)
+            ])
+            new_summarizer_prompt = teacher_result["messages"][-1].text
+        except TruncatedOutputError as e:
+            # A prompt cut at max_tokens is never optimized against
+            print(f"\033[91m[TEACHER] {e}, keeping the previous prompt\033[0m")
+            new_summarizer_prompt = summarizer_prompt.text
         if "$extracted_text" not in new_summarizer_prompt:
             new_summarizer_prompt += "\n\n<EXTRACTED_README>\n$extracted_text\n</EXTRACTED_README>"
         print(f"\033[91m[TEACHER FEEDBACK]\033[0m\n{new_summarizer_prompt}")
@@ -199,3 +217,5 @@ timestamp = pd.Timestamp.now().strftime("%Y%m%d_%H%M%S")
 os.makedirs("result/train", exist_ok=True)
 with open(f"result/train/final_combined_prompt{timestamp}.txt", "w", encoding="utf-8") as f:
     f.write(final_prompt)
+get_generation_stats().report("training")
+get_readme_budget().report("training")
@@ -1,11 +1,12 @@
 import os
 import pandas as pd
 from haystack import component
-from haystack.components.generators.chat import OpenAIChatGenerator
+from components.cached_chat_generator import CachedOpenAIChatGenerator
+from tools.extraction_store import extract_once
+from tools.readme_budget import fit_readme
 from haystack.components.agents import Agent
 from haystack.dataclasses import ChatMessage
 from haystack.utils import Secret
-from rouge_score import rouge_scorer
 from haystack.tools import tool
 from tools.others_orig import save_parallel_train_result  # o dove hai definito la funzione
 from prompt_orig import EXTRACTOR_PROMPT, INITIAL_SUMMARIZER_PROMPT, TEACHER_PROMPT, COMBINE_PROMPT 
@@ -21,10 +22,9 @@ class RougeEvaluator:
     def run(self, generated_about: str, ground_truth: str):
         print("\033[90mGround truth:\033[0m", ground_truth)
         print("\033[90mGenerated about:\033[0m", generated_about)
-        scorer = rouge_scorer.RougeScorer(['rougeL'], use_stemmer=True)
-        score = scorer.score(ground_truth, generated_about)
-        print(f"\033[96m[METRIC] ROUGE-L score: {score['rougeL'].fmeasure:.4f}\033[0m")
-        return {"score": score["rougeL"].fmeasure}
+        score = ROUGE().get_RougeL(string_1=generated_about, string_2=ground_truth)
+        print(f"\033[96m[METRIC] ROUGE-L score: {score:.4f}\033[0m")
+        return {"score": score}
 
 @component
 class MessageTextExtractor:
@@ -36,9 +36,7 @@ class MessageTextExtractor:
 @tool
 def calculate_rouge_score(generated_about: str, ground_truth: str) -> float:
     """Compute ROUGE-L score between generated and ground truth descriptions."""
-    scorer = rouge_scorer.RougeScorer(['rougeL'], use_stemmer=True)
-    score = scorer.score(ground_truth, generated_about)
-    return score["rougeL"].fmeasure
+    return ROUGE().get_RougeL(string_1=generated_about, string_2=ground_truth)
 
 @tool
 def noop() -> str:
@@ -47,7 +45,7 @@ def noop() -> str:
 
 # Agent definitions
 extractor_agent = Agent(
-    chat_generator=OpenAIChatGenerator(
+    chat_generator=CachedOpenAIChatGenerator(
         model="gpt-4o-mini",
         generation_kwargs={"temperature": 0.0},
         api_key=Secret.from_env_var("OPENAI_API_KEY")
@@ -56,7 +54,7 @@ extractor_agent = Agent(
 )
 
 summarizer_agent = Agent(
-    chat_generator=OpenAIChatGenerator(
+    chat_generator=CachedOpenAIChatGenerator(
         model="gpt-4o-mini",
         generation_kwargs={"temperature": 0.0},
         api_key=Secret.from_env_var("OPENAI_API_KEY")
@@ -66,7 +64,7 @@ summarizer_agent = Agent(
 )
 
 teacher_agent = Agent(
-    chat_generator=OpenAIChatGenerator(
+    chat_generator=CachedOpenAIChatGenerator(
         model="gpt-4o",
         generation_kwargs={"temperature": 0.7},
         api_key=Secret.from_env_var("OPENAI_API_KEY")
@@ -76,7 +74,7 @@ teacher_agent = Agent(
 )
 
 combine_agent = Agent(
-    chat_generator=OpenAIChatGenerator(
+    chat_generator=CachedOpenAIChatGenerator(
         model="gpt-4o",
         generation_kwargs={"temperature": 0.2},
         api_key=Secret.from_env_var("OPENAI_API_KEY")
@@ -91,6 +89,20 @@ teacher_agent_prompt = ChatMessage.from_system(TEACHER_PROMPT)
 combine_agent_prompt = ChatMessage.from_system(COMBINE_PROMPT)
 
 
+def extract_readme(readme: str) -> str:
+    """Runs the ExtractorAgent once per README; later iterations and phases reuse the stored extraction."""
+    readme = fit_readme(readme)
+
+    def extract() -> str:
+        extractor_result = extractor_agent.run(messages=[
+            extractor_agent_prompt,
+            ChatMessage.from_user(readme)
+        ])
+        return extractor_result["messages"][-1].text
+    return extract_once(readme, EXTRACTOR_PROMPT, "gpt-4o-mini", extract)
+
+
+
 # ------------------------- TRAIN PHASE ------------------------- 
 # train_df = pd.read_csv("data/TS50.csv")
 # print(f"\033[92m[INFO] Dataset loaded with {len(train_df)} rows.\033[0m")
@@ -267,11 +279,7 @@ for idx, row in test_df.iterrows():
     ground_truth = row["description"]
 
     # Estrazione
-    extractor_result = extractor_agent.run(messages=[
-        extractor_agent_prompt,
-        ChatMessage.from_user(readme)
-    ])
-    extracted_text = extractor_result["messages"][-1].text
+    extracted_text = extract_readme(readme)
     print(f"\033[93m[EXTRACTED TEXT]\033[0m\n{extracted_text}")
     # Sintesi
     summ_input=[
@@ -284,9 +292,10 @@ for idx, row in test_df.iterrows():
     generated_about = summarizer_result["messages"][-1].text
     print(f"\033[92m[GENERATED ABOUT]\033[0m\n{generated_about}")
 
-    rougeL_score = ROUGE().get_RougeL(string_1=generated_about, string_2=ground_truth)
-    rouge1_score = ROUGE().get_Rouge1(string_1=generated_about, string_2=ground_truth)
-    rouge2_score = ROUGE().get_Rouge2(string_1=generated_about, string_2=ground_truth)
+    scores = ROUGE().score_all(candidate=generated_about, reference=ground_truth)
+    rougeL_score = scores["rougeL"].fmeasure
+    rouge1_score = scores["rouge1"].fmeasure
+    rouge2_score = scores["rouge2"].fmeasure
     rouge1 = rouge1_score
     rouge2 = rouge2_score
     rougeL = rougeL_score
@@ -1,16 +1,20 @@
 import os
 import pandas as pd
 from haystack import component
-from haystack.components.generators.chat import OpenAIChatGenerator, AzureOpenAIChatGenerator 
+from components.cached_chat_generator import CachedAzureOpenAIChatGenerator
+from tools.extraction_store import extract_once
+from tools.readme_budget import fit_readme, get_readme_budget
+from tools.generation_profiles import get_generation_stats
+from tools.prompt_layout import get_cache_stats
+from tools.resilient_call import LLMCallError
 from haystack.components.agents import Agent
 from haystack.dataclasses import ChatMessage
 from haystack.utils import Secret
-from rouge_score import rouge_scorer
 from haystack.tools import tool
 from tools.others_orig import save_parallel_train_result  # o dove hai definito la funzione
 from prompt_orig import EXTRACTOR_PROMPT, INITIAL_SUMMARIZER_PROMPT, TEACHER_PROMPT_EVO, COMBINE_PROMPT_EVO 
 from tools.others_orig import save_evaluation_result  # Assicurati che sia definita lì
-from datetime import datetime as dt, time
+from datetime import datetime as dt
 import csv
 from metric.rouge import ROUGE
 import time
@@ -33,10 +37,9 @@ class RougeEvaluator:
     def run(self, generated_about: str, ground_truth: str):
         print("\033[90mGround truth:\033[0m", ground_truth)
         print("\033[90mGenerated about:\033[0m", generated_about)
-        scorer = rouge_scorer.RougeScorer(['rougeL'], use_stemmer=True)
-        score = scorer.score(ground_truth, generated_about)
-        print(f"\033[96m[METRIC] ROUGE-L score: {score['rougeL'].fmeasure:.4f}\033[0m")
-        return {"score": score["rougeL"].fmeasure}
+        score = ROUGE().get_RougeL(string_1=generated_about, string_2=ground_truth)
+        print(f"\033[96m[METRIC] ROUGE-L score: {score:.4f}\033[0m")
+        return {"score": score}
 
 @component
 class MessageTextExtractor:
@@ -48,9 +51,7 @@ class MessageTextExtractor:
 @tool
 def calculate_rouge_score(generated_about: str, ground_truth: str) -> float:
     """Compute ROUGE-L score between generated and ground truth descriptions."""
-    scorer = rouge_scorer.RougeScorer(['rougeL'], use_stemmer=True)
-    score = scorer.score(ground_truth, generated_about)
-    return score["rougeL"].fmeasure
+    return ROUGE().get_RougeL(string_1=generated_about, string_2=ground_truth)
 
 @tool
 def noop() -> str:
@@ -60,7 +61,8 @@ def noop() -> str:
 
 # Agent definitions
 extractor_agent = Agent(
-    chat_generator=AzureOpenAIChatGenerator(
+    chat_generator=CachedAzureOpenAIChatGenerator(
+        agent="extractor",
         azure_endpoint=endpoint_mini,
         api_key=Secret.from_token(subscription_key_mini),
         azure_deployment=deployment_mini,
@@ -70,7 +72,8 @@ extractor_agent = Agent(
 )
 
 summarizer_agent = Agent(
-    chat_generator=AzureOpenAIChatGenerator(
+    chat_generator=CachedAzureOpenAIChatGenerator(
+        agent="summarizer",
         azure_endpoint=endpoint_mini,
         api_key=Secret.from_token(subscription_key_mini),
         azure_deployment=deployment_mini,
@@ -81,7 +84,8 @@ summarizer_agent = Agent(
 )
 
 teacher_agent = Agent(
-    chat_generator=AzureOpenAIChatGenerator(
+    chat_generator=CachedAzureOpenAIChatGenerator(
+        agent="teacher",
         azure_endpoint=endpoint,
         api_key=Secret.from_token(subscription_key),
         azure_deployment=deployment,
@@ -91,7 +95,8 @@ teacher_agent = Agent(
 )
 
 combine_agent = Agent(
-    chat_generator=AzureOpenAIChatGenerator(
+    chat_generator=CachedAzureOpenAIChatGenerator(
+        agent="combiner",
         azure_endpoint=endpoint,
         api_key=Secret.from_token(subscription_key),
         azure_deployment=deployment,
@@ -107,6 +112,20 @@ teacher_agent_prompt = ChatMessage.from_system(TEACHER_PROMPT_EVO)
 combine_agent_prompt = ChatMessage.from_system(COMBINE_PROMPT_EVO)
 
 
+def extract_readme(readme: str) -> str:
+    """Runs the ExtractorAgent once per README; later iterations and phases reuse the stored extraction."""
+    readme = fit_readme(readme)
+
+    def extract() -> str:
+        extractor_result = extractor_agent.run(messages=[
+            extractor_agent_prompt,
+            ChatMessage.from_user(readme)
+        ])
+        return extractor_result["messages"][-1].text
+    return extract_once(readme, EXTRACTOR_PROMPT, deployment_mini, extract)
+
+
+
 
 #------------------------- TRAIN PHASE ------------------------- 
 # train_df = pd.read_csv("data/TS50.csv")
@@ -148,26 +167,9 @@ combine_agent_prompt = ChatMessage.from_system(COMBINE_PROMPT_EVO)
 #             ChatMessage.from_user(extracted_text)
 #         ]
 #         print(f"\033[93m[SUMMARIZER INPUT]\033[0m\n{summ_input}")
-#         # Retry mechanism for summarizer
-#         max_retries = 5
-#         retry_count = 0
-#         generated_about = None
-
-#         while retry_count < max_retries:
-#             summarizer_result = summarizer_agent.run([
-#                 summarizer_prompt,
-#                 ChatMessage.from_user(extracted_text)
-#             ])
-#             generated_about = summarizer_result["messages"][-1].text
-#             if generated_about and generated_about.strip():
-#                 break  # Success
-#             else:
-#                 retry_count += 1
-#                 print(f"\033[91m[WARNING] Empty output. Retrying summarizer... (Attempt {retry_count})\033[0m")
-
-#         if not generated_about or not generated_about.strip():
-#             print(f"\033[91m[ERROR] Summarizer failed after {max_retries} attempts.\033[0m")
-#             generated_about = "N/A"  # or handle it differently (e.g., skip, log, etc.)
+#         # Empty replies are retried with backoff by the chat generator (tools/resilient_call.py)
+#         summarizer_result = summarizer_agent.run(summ_input)
+#         generated_about = summarizer_result["messages"][-1].text
 #         print(f"\033[92m[GENERATED ABOUT]\033[0m\n{generated_about}")
 
 #         # 3. ROUGE Evaluation
@@ -317,6 +319,7 @@ data_debug = []
 rouge1_total = 0
 rouge2_total = 0
 rougeL_total = 0
+failed_rows = 0
 
 for idx, row in test_df.iterrows():
     print(f"\n\033[94m[Test Row {idx+1}]\033[0m")
@@ -324,27 +327,38 @@ for idx, row in test_df.iterrows():
     readme = row["readme"]
     ground_truth = row["description"]
 
-    # Estrazione
-    extractor_result = extractor_agent.run(messages=[
-        extractor_agent_prompt,
-        ChatMessage.from_user(readme)
-    ])
-    extracted_text = extractor_result["messages"][-1].text
-    print(f"\033[93m[EXTRACTED TEXT]\033[0m\n{extracted_text}")
-    # Sintesi
-    summ_input=[
-            summarizer_agent_prompt_start,
-            ChatMessage.from_user(extracted_text)
-        ]
-    print(f"\033[93m[SUMMARIZER INPUT]\033[0m\n{summ_input}")
-    summarizer_result = summarizer_agent.run(summ_input)
+    try:
+        # Estrazione
+        extracted_text = extract_readme(readme)
+        print(f"\033[93m[EXTRACTED TEXT]\033[0m\n{extracted_text}")
+        # Sintesi
+        summ_input=[
+                summarizer_agent_prompt_start,
+                ChatMessage.from_user(extracted_text)
+            ]
+        print(f"\033[93m[SUMMARIZER INPUT]\033[0m\n{summ_input}")
+        summarizer_result = summarizer_agent.run(summ_input)
+    except LLMCallError as e:
+        # Still failing after the retries: keep the row as failed, so the CSV still lines up with the test set
+        print(f"\033[91m[ERROR] Row failed: {e}\033[0m")
+        failed_rows += 1
+        data_debug.append({
+            "description": ground_truth,
+            "generated_about": "",
+            "rouge1_score": float("nan"),
+            "rouge2_score": float("nan"),
+            "rougeL_score": float("nan"),
+            "error": str(e),
+        })
+        continue
     print(f"\033[93m[SUMMARIZER RESULT]\033[0m\n{summarizer_result}")
     generated_about = summarizer_result["messages"][-1].text
     print(f"\033[92m[GENERATED ABOUT]\033[0m\n{generated_about}")
 
-    rougeL_score = ROUGE().get_RougeL(string_1=generated_about, string_2=ground_truth)
-    rouge1_score = ROUGE().get_Rouge1(string_1=generated_about, string_2=ground_truth)
-    rouge2_score = ROUGE().get_Rouge2(string_1=generated_about, string_2=ground_truth)
+    scores = ROUGE().score_all(candidate=generated_about, reference=ground_truth)
+    rougeL_score = scores["rougeL"].fmeasure
+    rouge1_score = scores["rouge1"].fmeasure
+    rouge2_score = scores["rouge2"].fmeasure
     rouge1 = rouge1_score
     rouge2 = rouge2_score
     rougeL = rougeL_score
@@ -360,13 +374,17 @@ for idx, row in test_df.iterrows():
         "generated_about": generated_about,
         "rouge1_score": rouge1,
         "rouge2_score": rouge2,
-        "rougeL_score": rougeL
+        "rougeL_score": rougeL,
+        "error": "",
     })
 
-# Calcola le medie
-avg_rouge1 = rouge1_total / len(data_debug)
-avg_rouge2 = rouge2_total / len(data_debug)
-avg_rougeL = rougeL_total / len(data_debug)
+# Calcola le medie (sulle righe riuscite)
+scored_rows = len(data_debug) - failed_rows
+avg_rouge1 = rouge1_total / scored_rows if scored_rows else float("nan")
+avg_rouge2 = rouge2_total / scored_rows if scored_rows else float("nan")
+avg_rougeL = rougeL_total / scored_rows if scored_rows else float("nan")
+if failed_rows:
+    print(f"\n\033[91m[WARN] {failed_rows}/{len(data_debug)} righe fallite (ROUGE NaN, vedi colonna Error)\033[0m")
 
 # Prepara il dizionario di debug
 debug_result = {
@@ -379,3 +397,6 @@ debug_result = {
 # Salvataggio finale
 save_evaluation_result("result/test", debug_result)
 print("\n\033[92m✅ [INFO] Risultati di test salvati correttamente.\033[0m")
+get_cache_stats().report("evaluation")
+get_generation_stats().report("evaluation")
+get_readme_budget().report("evaluation")
@@ -2,7 +2,9 @@ import os
 import re
 import pandas as pd
 from haystack import component
-from haystack.components.generators.chat import OpenAIChatGenerator
+from components.cached_chat_generator import CachedOpenAIChatGenerator
+from tools.extraction_store import extract_once
+from tools.readme_budget import fit_readme
 from haystack.components.agents import Agent
 from haystack.dataclasses import ChatMessage
 from haystack.utils import Secret
@@ -21,7 +23,7 @@ def noop() -> str:
 
 # Agent definitions
 extractor_agent = Agent(
-    chat_generator=OpenAIChatGenerator(
+    chat_generator=CachedOpenAIChatGenerator(
         model="gpt-4o-mini",
         generation_kwargs={"temperature": 0.0},
         api_key=Secret.from_env_var("OPENAI_API_KEY")
@@ -30,7 +32,7 @@ extractor_agent = Agent(
 )
 
 summarizer_agent = Agent(
-    chat_generator=OpenAIChatGenerator(
+    chat_generator=CachedOpenAIChatGenerator(
         model="gpt-4o-mini",
         generation_kwargs={"temperature": 0.0},
         api_key=Secret.from_env_var("OPENAI_API_KEY")
@@ -41,7 +43,7 @@ summarizer_agent = Agent(
 
 
 analysis_agent = Agent(
-    chat_generator=OpenAIChatGenerator(
+    chat_generator=CachedOpenAIChatGenerator(
         model="gpt-4o",
         #generation_kwargs={"temperature": 0.3},
         api_key=Secret.from_env_var("OPENAI_API_KEY")
@@ -50,7 +52,7 @@ analysis_agent = Agent(
 )
 
 analysis_summarizer_agent = Agent(
-    chat_generator=OpenAIChatGenerator(
+    chat_generator=CachedOpenAIChatGenerator(
         model="gpt-4o",
         #generation_kwargs={"temperature": 0.3},
         api_key=Secret.from_env_var("OPENAI_API_KEY")
@@ -59,7 +61,7 @@ analysis_summarizer_agent = Agent(
 )
 
 seq_teacher_agent = Agent(
-    chat_generator=OpenAIChatGenerator(
+    chat_generator=CachedOpenAIChatGenerator(
         model="gpt-4o",
         generation_kwargs={"temperature": 0.7},
         api_key=Secret.from_env_var("OPENAI_API_KEY")
@@ -76,6 +78,20 @@ analysis_agent_prompt = ChatMessage.from_system(ANALYSIS_PROMPT)
 analysis_summarizer_agent_prompt = ChatMessage.from_system(ANALYSIS_SUMMARIZER_PROMPT)
 seq_teacher_agent_prompt = ChatMessage.from_system(SEQUENTIAL_TEACHER_PROMPT)
 
+
+def extract_readme(readme: str) -> str:
+    """Runs the ExtractorAgent once per README; later iterations and phases reuse the stored extraction."""
+    readme = fit_readme(readme)
+
+    def extract() -> str:
+        extractor_result = extractor_agent.run(messages=[
+            extractor_agent_prompt,
+            ChatMessage.from_user(readme)
+        ])
+        return extractor_result["messages"][-1].text
+    return extract_once(readme, EXTRACTOR_PROMPT, "gpt-4o-mini", extract)
+
+
 # ------------------------- TRAIN PHASE ------------------------- 
 train_df = pd.read_csv("data/train_data.csv")
 print(f"\033[92m[INFO] Dataset loaded with {len(train_df)} rows.\033[0m")
@@ -285,11 +301,7 @@ for idx, row in test_df.iterrows():
     ground_truth = row["description"]
 
     # Estrazione
-    extractor_result = extractor_agent.run(messages=[
-        extractor_agent_prompt,
-        ChatMessage.from_user(readme)
-    ])
-    extracted_text = extractor_result["messages"][-1].text
+    extracted_text = extract_readme(readme)
     print(f"\033[93m[EXTRACTED TEXT]\033[0m\n{extracted_text}")
     # Sintesi
     summ_input=[
@@ -303,9 +315,10 @@ for idx, row in test_df.iterrows():
     print(f"\033[92m[GENERATED ABOUT]\033[0m\n{generated_about}")
 
     # ROUGE evaluation
-    rougeL_score = ROUGE().get_RougeL(string_1=generated_about, string_2=ground_truth)
-    rouge1_score = ROUGE().get_Rouge1(string_1=generated_about, string_2=ground_truth)
-    rouge2_score = ROUGE().get_Rouge2(string_1=generated_about, string_2=ground_truth)
+    scores = ROUGE().score_all(candidate=generated_about, reference=ground_truth)
+    rougeL_score = scores["rougeL"].fmeasure
+    rouge1_score = scores["rouge1"].fmeasure
+    rouge2_score = scores["rouge2"].fmeasure
     rouge1 = rouge1_score
     rouge2 = rouge2_score
     rougeL = rougeL_score
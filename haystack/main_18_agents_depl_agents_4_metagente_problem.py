@@ -6,7 +6,7 @@ from haystack.components.agents import Agent
 from haystack.utils import Secret
 from haystack.dataclasses import ChatMessage, ChatRole, ToolCallResult
 import sys
-from rouge_score import rouge_scorer
+from metric.rouge import ROUGE
 # === CONFIG AZURE LLM ===
 subscription_key = ""
 endpoint = ""
@@ -26,9 +26,7 @@ def rouge_l_score(generated: str, reference: str) -> float:
     Returns a float between 0 and 1.
     """
     print(f"\033[94m[INFO -ROUGE SCORE]'{generated}'  ------------  {reference}")
-    scorer = rouge_scorer.RougeScorer(["rougeL"], use_stemmer=True)
-    score = scorer.score(reference, generated)
-    rougue_l_f1 = round(score["rougeL"].fmeasure, 4)
+    rougue_l_f1 = round(ROUGE().get_RougeL(string_1=generated, string_2=reference), 4)
     print(f"\033[94m[METRIC] ROUGE-L F1 score: {rougue_l_f1}\033[0m")
     return rougue_l_f1
 
@@ -0,0 +1,123 @@
+"""Extract-once store: Extractor outputs in SQLite under (README hash, prompt hash, model), reused by every
+later iteration and test set."""
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Awaitable, Callable
+
+# EXTRACTION_STORE_PATH overrides it; EXTRACTION_STORE=off always calls the Extractor
+DEFAULT_PATH = os.path.join(".llm_cache", "extractions.sqlite")
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ExtractionStore:
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._memory: dict[tuple, str] = {}
+        # Concurrent requests for the same README wait for the first extraction instead of repeating it
+        self._pending: dict[tuple, asyncio.Future] = {}
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS extractions ("
+            "readme_hash TEXT NOT NULL, prompt_hash TEXT NOT NULL, model TEXT NOT NULL, "
+            "extracted_text TEXT NOT NULL, created REAL NOT NULL, "
+            "PRIMARY KEY (readme_hash, prompt_hash, model))"
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def make_key(readme: str, extractor_prompt: str, model: str) -> tuple:
+        return _sha256(readme), _sha256(extractor_prompt), model
+
+    def get(self, readme: str, extractor_prompt: str, model: str) -> str | None:
+        key = self.make_key(readme, extractor_prompt, model)
+        with self._lock:
+            if key in self._memory:
+                return self._memory[key]
+            row = self._connection.execute(
+                "SELECT extracted_text FROM extractions WHERE readme_hash = ? AND prompt_hash = ? AND model = ?", key
+            ).fetchone()
+            if row is not None:
+                self._memory[key] = row[0]
+                return row[0]
+        return None
+
+    def put(self, readme: str, extractor_prompt: str, model: str, extracted_text: str) -> None:
+        key = self.make_key(readme, extractor_prompt, model)
+        with self._lock:
+            self._memory[key] = extracted_text
+            self._connection.execute(
+                "INSERT OR REPLACE INTO extractions VALUES (?, ?, ?, ?, ?)", (*key, extracted_text, time.time())
+            )
+            self._connection.commit()
+
+    def get_or_extract(self, readme: str, extractor_prompt: str, model: str, extract: Callable[[], str]) -> str:
+        extracted_text = self.get(readme, extractor_prompt, model)
+        if extracted_text is None:
+            extracted_text = extract()
+            self.put(readme, extractor_prompt, model, extracted_text)
+        return extracted_text
+
+    async def aget_or_extract(self, readme: str, extractor_prompt: str, model: str,
+                              extract: Callable[[], Awaitable[str]]) -> str:
+        key = self.make_key(readme, extractor_prompt, model)
+        pending = self._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        pending = asyncio.get_running_loop().create_future()
+        self._pending[key] = pending
+        try:
+            # SQLite is read and written in a worker thread, so the event loop keeps serving the other coroutines
+            extracted_text = await asyncio.to_thread(self.get, readme, extractor_prompt, model)
+            if extracted_text is None:
+                extracted_text = await extract()
+                await asyncio.to_thread(self.put, readme, extractor_prompt, model, extracted_text)
+            pending.set_result(extracted_text)
+            return extracted_text
+        except BaseException as e:
+            pending.set_exception(e)
+            # Waiters see the error; nobody else is left to retrieve it
+            pending.exception()
+            raise
+        finally:
+            del self._pending[key]
+
+
+_store: ExtractionStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_extraction_store() -> ExtractionStore | None:
+    """Returns the process-wide store, or None when EXTRACTION_STORE=off."""
+    global _store
+    if os.getenv("EXTRACTION_STORE", "on").lower() == "off":
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = ExtractionStore(os.getenv("EXTRACTION_STORE_PATH", DEFAULT_PATH))
+        return _store
+
+
+def extract_once(readme: str, extractor_prompt: str, model: str, extract: Callable[[], str]) -> str:
+    store = get_extraction_store()
+    if store is None:
+        return extract()
+    return store.get_or_extract(readme, extractor_prompt, model, extract)
+
+
+async def aextract_once(readme: str, extractor_prompt: str, model: str, extract: Callable[[], Awaitable[str]]) -> str:
+    store = get_extraction_store()
+    if store is None:
+        return await extract()
+    return await store.aget_or_extract(readme, extractor_prompt, model, extract)
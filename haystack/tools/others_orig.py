@@ -82,6 +82,8 @@ def save_parallel_train_result(train_result_dir: str, debug_result: dict) -> Non
 
 def save_evaluation_result(test_result_dir: str, debug_result: dict) -> None:
     csv_data = []
+    # Rows that failed after the retries carry an "error" and NaN scores
+    with_errors = any("error" in data for data in debug_result["data_debug"])
 
     for data in debug_result["data_debug"]:
         csv_data.append(
@@ -93,6 +95,8 @@ def save_evaluation_result(test_result_dir: str, debug_result: dict) -> None:
                 data["rougeL_score"],
             ]
         )
+        if with_errors:
+            csv_data[-1].append(data.get("error", ""))
 
     csv_data[0].extend(
         [
@@ -112,6 +116,8 @@ def save_evaluation_result(test_result_dir: str, debug_result: dict) -> None:
         "Average ROUGE-2",
         "Average ROUGE-L",
     ]
+    if with_errors:
+        header.insert(5, "Error")
 
     timestamp = dt.now().strftime("%Y-%m-%d_%H-%M-%S")
     os.makedirs(test_result_dir, exist_ok=True)
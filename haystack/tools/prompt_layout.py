@@ -0,0 +1,118 @@
+"""Prefix-stable prompt assembly, so the provider's prompt cache can reuse the static instructions, and the
+cached share of the prompt tokens of a run."""
+import csv
+import re
+import sys
+import textwrap
+import threading
+from typing import Sequence
+
+
+def _placeholder(name: str) -> str:
+    # $name, ${name} (string.Template), {{name}} (Jinja) and {{$name}} (Semantic Kernel)
+    return rf"(?:\${name}\b|\$\{{{name}\}}|\{{\{{\s*\$?{name}\s*\}}\}})"
+
+
+def _block(name: str) -> re.Pattern:
+    """A placeholder wrapped in <TAG>...</TAG>, or alone on its line; inline ones are part of a sentence and stay."""
+    placeholder = _placeholder(name)
+    return re.compile(
+        rf"^[ \t]*(?:<(?P<tag>[A-Za-z_][\w -]*)>\s*{placeholder}\s*</(?P=tag)>|{placeholder})[ \t]*$\n?",
+        re.MULTILINE,
+    )
+
+
+def stable_layout(template: str, order: Sequence[str]) -> str:
+    """
+    Moves the blocks of the given placeholders to the end of the template, in that order (most stable first).
+    The static text keeps its order, so templates that are already laid out come back unchanged.
+    """
+    blocks = []
+    for name in order:
+        match = _block(name).search(template)
+        if match is None:
+            continue
+        blocks.append(textwrap.dedent(match.group(0)).strip())
+        template = template[:match.start()] + template[match.end():]
+    if not blocks:
+        return template
+    static = re.sub(r"\n[ \t]*\n(?:[ \t]*\n)+", "\n\n", template).rstrip()
+    return static + "\n\n" + "\n\n".join(blocks) + "\n"
+
+
+def cached_tokens(usage) -> int:
+    """prompt_tokens_details.cached_tokens of an API usage, as an object or a dict; 0 when not reported."""
+    details = usage.get("prompt_tokens_details") if isinstance(usage, dict) else getattr(usage, "prompt_tokens_details", None)
+    value = details.get("cached_tokens") if isinstance(details, dict) else getattr(details, "cached_tokens", None)
+    return value or 0
+
+
+class CacheStats:
+    """Prompt and cached prompt tokens of the calls that reached the API, per model."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.models: dict[str, list[int]] = {}
+
+    def record(self, model: str | None, prompt_tokens: int | None, cached: int | None) -> None:
+        if not prompt_tokens:
+            return
+        with self._lock:
+            counts = self.models.setdefault(model or "unknown", [0, 0, 0])
+            counts[0] += 1
+            counts[1] += prompt_tokens
+            counts[2] += cached or 0
+
+    def record_usage(self, model: str | None, usage) -> None:
+        if usage is None:
+            return
+        prompt_tokens = usage.get("prompt_tokens") if isinstance(usage, dict) else getattr(usage, "prompt_tokens", None)
+        self.record(model, prompt_tokens, cached_tokens(usage))
+
+    def ratio(self) -> float:
+        with self._lock:
+            prompt_tokens = sum(counts[1] for counts in self.models.values())
+            cached = sum(counts[2] for counts in self.models.values())
+        return cached / prompt_tokens if prompt_tokens else 0.0
+
+    def report(self, label: str) -> None:
+        with self._lock:
+            models = {model: list(counts) for model, counts in self.models.items()}
+        if not models:
+            print(f"[Prompt cache {label}] No API calls")
+            return
+        for model, (requests, prompt_tokens, cached) in sorted(models.items()):
+            print(f"[Prompt cache {label}] {model}: {cached}/{prompt_tokens} prompt tokens cached "
+                  f"({cached / prompt_tokens:.1%}) over {requests} requests")
+        if len(models) != 1:
+            print(f"[Prompt cache {label}] Total: {self.ratio():.1%} of the prompt tokens cached")
+
+    def reset(self) -> None:
+        with self._lock:
+            self.models.clear()
+
+
+_stats = CacheStats()
+
+
+def get_cache_stats() -> CacheStats:
+    return _stats
+
+
+def usage_cache_ratio(path: str) -> tuple[float, float]:
+    """(input_tokens, input_cached_tokens) summed over a usage export; blank minutes count as 0."""
+    with open(path, newline="", encoding="utf-8") as f:
+        dialect = csv.Sniffer().sniff(f.readline(), delimiters=",;")
+        f.seek(0)
+        rows = list(csv.DictReader(f, dialect=dialect))
+    total = sum(float(row.get("input_tokens") or 0) for row in rows)
+    cached = sum(float(row.get("input_cached_tokens") or 0) for row in rows)
+    return total, cached
+
+
+if __name__ == "__main__":
+    # Cached ratio of usage exports, e.g. python -m utils.prompt_layout ../../analysis_results/token_usage/autogen/*.csv
+    for path in sys.argv[1:]:
+        total, cached = usage_cache_ratio(path)
+        ratio = f"{cached / total:.1%}" if total else "n/a"
+        print(f"{path}: {cached:.0f}/{total:.0f} input tokens cached ({ratio})")
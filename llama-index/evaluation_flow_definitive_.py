@@ -15,13 +15,23 @@ from prompts.prompt_orig import (
 )
 from llama_index.llms.openai import OpenAI
 from llama_index.utils.workflow import draw_all_possible_flows
-from tools.tools import simple_rouge_l_score
+from tools.llm_clients import close_async_http_client, get_async_http_client
+from tools.tools import aextract_readme, aresilient_complete, fill_summarizer_prompt, simple_rouge_l_score
+from tools.generation_profiles import TruncatedOutputError, get_generation_stats
+from tools.prompt_layout import get_cache_stats
+from tools.readme_budget import get_readme_budget
 import pandas as pd
 from llama_index.llms.ollama import Ollama
 from llama_index.core.agent.workflow import AgentOutput, ToolCall, ToolCallResult
 
 # ---- LLM Setup ----
-llm = OpenAI(model="gpt-4o")
+def make_llm() -> OpenAI:
+    """The LLM of the workflow."""
+    # Built by the workflows inside the running loop, on its connection pool (see tools/llm_clients.py)
+    # SDK retries are off: resilient_call retries through the rate limiter and the deadline (tools/resilient_call.py)
+    return OpenAI(model="gpt-4o", max_retries=0, async_http_client=get_async_http_client())
+
+
 #llm = Ollama(model=os.getenv("OLLAMA_MODEL"))
 
 # ---- Dataset ----
@@ -55,6 +65,7 @@ class CombinedEvent(Event):
 # ---- Workflow ----
 class MetagenteWorkflow(Workflow):
     def __init__(self, **kwargs):
+        self.llm = make_llm()
         self.prompt = INITIAL_SUMMARIZER_PROMPT
         self.best_prompts = []
         self.max_attempts = 2
@@ -67,11 +78,11 @@ class MetagenteWorkflow(Workflow):
         except StopIteration:
             return CombinedEvent(result="No more Readme, let's evaluate all the prompts.....")
         await ctx.set("attempt", 0)
-        prompt = EXTRACTOR_PROMPT.replace("$readme_text", row.readme)
-        print(f"\n📥 Row READ:\n{row.readme}\n\n🧠 Extractor Prompt:\n{prompt}")
-        response = llm.complete(prompt, timeout=600)
+        print(f"\n📥 Row READ:\n{row.readme}")
+        # Through the extraction store and the response cache, like the evaluation flows
+        extracted_text = await aextract_readme(self.llm, EXTRACTOR_PROMPT, row.readme)
         return ExtractedEvent(
-            extracted_text=response.text.strip(),
+            extracted_text=extracted_text,
             description=row.description
         )
 
@@ -85,10 +96,10 @@ class MetagenteWorkflow(Workflow):
             extracted_text = ev.extracted_text
             description = ev.description
 
-        filled = self.prompt.replace("$extracted_text", extracted_text)
+        filled = fill_summarizer_prompt(self.prompt, extracted_text)
         print(f"\n🧠 Summarizer Prompt:\n{filled}")
 
-        response = llm.complete(filled, timeout=600)
+        response = await aresilient_complete(self.llm, filled, agent="summarizer")
         return SummaryEvent(
             summary=response.text.strip(),
             extracted_text=extracted_text,
@@ -123,8 +134,13 @@ class MetagenteWorkflow(Workflow):
             .replace("$summarizer_prompt", self.prompt)
 
         print(f"\n🧠 Teacher Prompt:\n{filled}")
-        response = llm.complete(filled, timeout=600)
-        new_prompt = response.text.strip()
+        try:
+            response = await aresilient_complete(self.llm, filled, agent="teacher")
+            new_prompt = response.text.strip()
+        except TruncatedOutputError as e:
+            # A prompt cut at max_tokens is never optimized against
+            print(f"\n⚠️ Teacher: {e}, keeping the previous prompt")
+            new_prompt = self.prompt
 
         await ctx.set("attempt", attempt + 1)
 
@@ -141,7 +157,7 @@ class MetagenteWorkflow(Workflow):
         prompt_list = "\n---\n".join(self.best_prompts)
         filled = COMBINE_PROMPT.replace("$summarizer_list", prompt_list)
         print(f"\n🧠 COMBINE Prompt:\n{filled}")
-        response = llm.complete(filled, timeout=600)
+        response = await aresilient_complete(self.llm, filled, agent="combiner")
         final_prompt = response.text.strip()
         with open("final_prompt.txt", "w") as f:
             f.write(final_prompt)
@@ -153,6 +169,10 @@ class MetagenteWorkflow(Workflow):
 async def main():
     w = MetagenteWorkflow(timeout=8900, verbose=True)
     result = await w.run()
+    get_cache_stats().report("training")
+    get_generation_stats().report("training")
+    get_readme_budget().report("training")
+    await close_async_http_client()
     print("\n✅ FINITO:", result)
     draw_all_possible_flows(MetagenteWorkflow, filename="workflow_simple_eventd_WF_1.html")
 
@@ -1,9 +1,10 @@
 import os
+import asyncio
 import json
 import pandas as pd
 import csv
 from datetime import datetime
-from rouge_score import rouge_scorer
+from metric.rouge import ROUGE
 from llama_index.core.workflow import (
     Workflow,
     step,
@@ -12,6 +13,7 @@ from llama_index.core.workflow import (
     Event,
     Context,
 )
+from pydantic import BaseModel, Field
 from prompts.prompt_orig import (
     EXTRACTOR_PROMPT,
     INITIAL_SUMMARIZER_PROMPT,
@@ -21,6 +23,11 @@ from prompts.prompt_orig import (
 from llama_index.llms.openai import OpenAI
 from llama_index.utils.workflow import draw_all_possible_flows
 from tools.others_orig import save_parallel_train_result, save_evaluation_result
+from tools.llm_clients import close_async_http_client, get_async_http_client
+from tools.tools import aextract_readme, acached_complete, aresilient_complete, batch_evaluate, fill_summarizer_prompt
+from tools.generation_profiles import TruncatedOutputError, get_generation_stats
+from tools.prompt_layout import get_cache_stats
+from tools.readme_budget import get_readme_budget
 # ---- Colored Logs ----
 RED     = "\033[91m"
 GREEN   = "\033[92m"
@@ -53,42 +60,76 @@ endpoint = ""
 model_name = "gpt-4o"
 deployment = "gpt-4o"
 
-llm_mini = AzureOpenAI(
-    api_version=api_version,
-    azure_endpoint=endpoint_mini,
-    api_key=subscription_key_mini,
-    model=deployment_mini,
-    engine=model_name_mini
-)
-llm = AzureOpenAI(
-    api_version=api_version,
-    azure_endpoint=endpoint,
-    api_key=subscription_key,
-    model=deployment,
-    engine=model_name
-)
+def make_llms() -> tuple[AzureOpenAI, AzureOpenAI]:
+    """(llm, llm_mini) of the workflows."""
+    # Built by the workflows inside the running loop, on its connection pool (see tools/llm_clients.py)
+    # SDK retries are off: resilient_call retries through the rate limiter and the deadline (tools/resilient_call.py)
+    llm_mini = AzureOpenAI(
+        api_version=api_version,
+        azure_endpoint=endpoint_mini,
+        api_key=subscription_key_mini,
+        model=deployment_mini,
+        engine=model_name_mini,
+        max_retries=0,
+        async_http_client=get_async_http_client(),
+    )
+    llm = AzureOpenAI(
+        api_version=api_version,
+        azure_endpoint=endpoint,
+        api_key=subscription_key,
+        model=deployment,
+        engine=model_name,
+        max_retries=0,
+        async_http_client=get_async_http_client(),
+    )
+    return llm, llm_mini
+
+
 # ---- LLM Setup ----
 #llm = OpenAI(model="gpt-4o")
 #llm_mini = OpenAI(model="gpt-4o-mini")
 # ---- Dataset ----
 data_train = pd.read_csv("data/TS50.csv")
-rows_train = iter(data_train.itertuples())
+# READMEs optimized at the same time by the training workflow (workers per step); the LLM calls of all steps
+# together are bounded by LLM_CONCURRENCY (see tools/tools.py)
+OPTIMIZER_CONCURRENCY = int(os.getenv("OPTIMIZER_CONCURRENCY", 4))
 
 data_test = pd.read_csv("data/test_data.csv")
 rows_test = iter(data_test.itertuples())
 
 
+# ---- Per-README training state ----
+class RowState(BaseModel):
+    """Optimization state of one training README, carried by the events of its sub-run."""
+    index: int
+    readme: str
+    description: str
+    prompt: str = INITIAL_SUMMARIZER_PROMPT
+    best_prompt: str = INITIAL_SUMMARIZER_PROMPT
+    best_score: float = 0.0
+    attempt: int = 0
+    iteration_data: list[dict] = Field(default_factory=list)
+
+
 # ---- Event Classes ----
+class RowEvent(Event):
+    row: RowState
+
+class RowDoneEvent(Event):
+    row: RowState
+
 class ExtractedEvent(Event):
     extracted_text: str
     description: str
     readme: str
+    row: RowState | None = None
 
 class SummaryEvent(Event):
     summary: str
     extracted_text: str
     description: str
     readme: str
+    row: RowState | None = None
 
 class EvaluatedEvent(Event):
     rouge_score: float
@@ -96,96 +137,89 @@ class EvaluatedEvent(Event):
     extracted_text: str
     description: str
     readme: str
+    row: RowState | None = None
 
 class PromptUpdateEvent(Event):
     new_prompt: str
     extracted_text: str
     description: str
     readme: str
+    row: RowState | None = None
 
 class CombinedEvent(Event):
     result: str
+    best_prompts: list = []
 
 
 # ---- Training Workflow ----
 class MetagenteWorkflow(Workflow):
     def __init__(self, max_attempts: int = 15, **kwargs):
-        self.prompt = INITIAL_SUMMARIZER_PROMPT
-        self.best_prompt = INITIAL_SUMMARIZER_PROMPT
-        self.best_score = 0.0
+        self.llm, self.llm_mini = make_llms()
         self.iteration_debug = []  # ← per raccogliere tutti i dati
         self.data_prompt = []      # ← per i prompt da combinare
-        self.best_prompts = []
         self.max_attempts = max_attempts
-        self.train_row_index = 0
         super().__init__(**kwargs)    
 
     @step
-    async def Extractor_Agent(self, ctx: Context, ev: StartEvent) -> ExtractedEvent | CombinedEvent:
-        print(f"{BLUE}[Extractor_Agent: Extracting from README...]{RESET}")
-        try:
-            row = next(rows_train)
-        except StopIteration:
-            return CombinedEvent(result="No more Readme, let's evaluate all the prompts.....")
-        await ctx.set("attempt", 0)
-        print(f"{WHITE}[Evaluation Progress: Row #{self.train_row_index + 1}]{RESET}")
-        self.train_row_index += 1
+    async def Dispatch_Rows(self, ctx: Context, ev: StartEvent) -> RowEvent | CombinedEvent:
+        # Every README is an independent sub-run: its state travels with its events
+        rows = list(data_train.itertuples())
+        if not rows:
+            return CombinedEvent(result="No Readme to optimize.")
+        await ctx.set("num_rows", len(rows))
+        print(f"{BLUE}[Dispatch_Rows: {len(rows)} READMEs, {OPTIMIZER_CONCURRENCY} at a time]{RESET}")
+        for index, row in enumerate(rows):
+            ctx.send_event(RowEvent(row=RowState(index=index, readme=row.readme, description=row.description)))
+        return None
+
+    @step(num_workers=OPTIMIZER_CONCURRENCY)
+    async def Extractor_Agent(self, ctx: Context, ev: RowEvent) -> ExtractedEvent:
+        row = ev.row
+        print(f"{BLUE}[Extractor_Agent #{row.index + 1}: Extracting from README...]{RESET}")
         prompt = EXTRACTOR_PROMPT.replace("$readme_text", row.readme)
-        print(f"{DARK_GRAY}[Extractor_Agent: LLM prompt ->]\n{prompt}{RESET}")
-        response = llm_mini.complete(prompt, temperature=0.0)
-        print(f"{ORANGE}[Extractor_Agent: LLM output ->]\n{response.text.strip()}{RESET}")
-        self.prompt = INITIAL_SUMMARIZER_PROMPT         # 🔁 Reset del prompt
-        self.best_prompt = INITIAL_SUMMARIZER_PROMPT    # 🔁 Reset del best prompt
-        self.best_score = 0.0    
+        print(f"{DARK_GRAY}[Extractor_Agent #{row.index + 1}: LLM prompt ->]\n{prompt}{RESET}")
+        extracted_text = await aextract_readme(self.llm_mini, EXTRACTOR_PROMPT, row.readme)
+        print(f"{ORANGE}[Extractor_Agent #{row.index + 1}: LLM output ->]\n{extracted_text}{RESET}")
         return ExtractedEvent(
-            extracted_text=response.text.strip(),
+            extracted_text=extracted_text,
             description=row.description,
-            readme=row.readme
+            readme=row.readme,
+            row=row
         )
 
-    @step
+    @step(num_workers=OPTIMIZER_CONCURRENCY)
     async def Summarizer_Agent(self, ctx: Context, ev: ExtractedEvent | PromptUpdateEvent) -> SummaryEvent:
+        row = ev.row
         if isinstance(ev, PromptUpdateEvent):
-            self.prompt = ev.new_prompt
-        filled = self.prompt.replace("$extracted_text", ev.extracted_text)
-        print(f"{CYAN}[Summarizer_Agent: LLM prompt ->]\n{filled}{RESET}")
-        response = llm_mini.complete(filled, temperature=0.0)
-        print(f"{CYAN}[Summarizer_Agent: LLM output ->]\n{response.text.strip()}{RESET}")
+            row.prompt = ev.new_prompt
+        filled = fill_summarizer_prompt(row.prompt, ev.extracted_text)
+        print(f"{CYAN}[Summarizer_Agent #{row.index + 1}: LLM prompt ->]\n{filled}{RESET}")
+        response = await acached_complete(self.llm_mini, filled, agent="summarizer", temperature=0.0)
+        print(f"{CYAN}[Summarizer_Agent #{row.index + 1}: LLM output ->]\n{response.text.strip()}{RESET}")
         return SummaryEvent(
             summary=response.text.strip(),
             extracted_text=ev.extracted_text,
             description=ev.description,
-            readme=ev.readme
+            readme=ev.readme,
+            row=row
         )
 
-    @step
-    async def Teacher_Agent(self, ctx: Context, ev: EvaluatedEvent) -> PromptUpdateEvent | StartEvent:
-        attempt = await ctx.get("attempt", default=0)
-        print(f"{RED}[Teacher_Agent: Evaluating and updating prompt... Attempt #{attempt + 1}]{RESET}")
+    @step(num_workers=OPTIMIZER_CONCURRENCY)
+    async def Teacher_Agent(self, ctx: Context, ev: EvaluatedEvent) -> PromptUpdateEvent | RowDoneEvent:
+        row = ev.row
+        attempt = row.attempt
+        print(f"{RED}[Teacher_Agent #{row.index + 1}: Evaluating and updating prompt... Attempt #{attempt + 1}]{RESET}")
 
         # 🔥 Check if this is the best prompt so far
-        if ev.rouge_score > self.best_score:
-            self.best_score = ev.rouge_score
-            self.best_prompt = self.prompt
-            print(f"{GREEN}[Teacher_Agent: 🔄 Nuovo best prompt salvato (ROUGE={ev.rouge_score:.4f})]{RESET}")
+        if ev.rouge_score > row.best_score:
+            row.best_score = ev.rouge_score
+            row.best_prompt = row.prompt
+            print(f"{GREEN}[Teacher_Agent #{row.index + 1}: 🔄 Nuovo best prompt salvato (ROUGE={ev.rouge_score:.4f})]{RESET}")
 
         # Condizione di arresto
         if ev.rouge_score >= 0.7 or attempt >= self.max_attempts:
-            if self.best_score >= 0.7 and self.best_prompt not in self.data_prompt:
-                self.data_prompt.append(self.best_prompt)
-
-            self.best_prompts.append(self.best_prompt)
-            print(f"{ORANGE}[Teacher_Agent: ⏹️ Iterazioni terminate - si torna all'inizio]{RESET}")
-
-            iteration_data = await ctx.get("iteration_data", [])
-            self.iteration_debug.append({
-                "readme": ev.readme,
-                "description": ev.description,
-                "iteration_debug": iteration_data,
-                "best_ROUGE-L": self.best_score,
-                "best_summarizer_prompt": self.best_prompt
-            })
-            return StartEvent()
+            print(f"{ORANGE}[Teacher_Agent #{row.index + 1}: ⏹️ Iterazioni terminate]{RESET}")
+            return RowDoneEvent(row=row)
 
         # Prompt improvement via LLM
         filled = TEACHER_PROMPT \
@@ -193,39 +227,42 @@ class MetagenteWorkflow(Workflow):
             .replace("$description", ev.description) \
             .replace("$generated_about", ev.summary) \
             .replace("$rouge_score", str(ev.rouge_score)) \
-            .replace("$summarizer_prompt", self.prompt)
-        print(f"{YELLOW}[Teacher_Agent: LLM prompt ->]\n{filled}{RESET}")
-        response = llm.complete(filled, temperature=0.7)
-        new_prompt = response.text.strip()
+            .replace("$summarizer_prompt", row.prompt)
+        print(f"{YELLOW}[Teacher_Agent #{row.index + 1}: LLM prompt ->]\n{filled}{RESET}")
+        try:
+            response = await aresilient_complete(self.llm, filled, agent="teacher", temperature=0.7)
+            new_prompt = response.text.strip()
+        except TruncatedOutputError as e:
+            # A prompt cut at max_tokens is never optimized against
+            print(f"{RED}[Teacher_Agent #{row.index + 1}: {e}, keeping the previous prompt]{RESET}")
+            new_prompt = row.prompt
         if "$extracted_text" not in new_prompt:
             new_prompt += "\n\n<EXTRACTED_README>\n$extracted_text\n</EXTRACTED_README>"
-        print(f"{MAGENTA}[Teacher_Agent: LLM output (new prompt) ->]\n{new_prompt}{RESET}")
-        await ctx.set("attempt", attempt + 1)
+        print(f"{MAGENTA}[Teacher_Agent #{row.index + 1}: LLM output (new prompt) ->]\n{new_prompt}{RESET}")
+        row.attempt = attempt + 1
         return PromptUpdateEvent(
             new_prompt=new_prompt,
             extracted_text=ev.extracted_text,
             description=ev.description,
-            readme=ev.readme
+            readme=ev.readme,
+            row=row
         )
 
 
 
-    @step
+    @step(num_workers=OPTIMIZER_CONCURRENCY)
     async def gen_about_evaluation_tool_4_train(self, ctx: Context, ev: SummaryEvent) -> EvaluatedEvent:
         print(f"{YELLOW}[Evaluator: Calculating ROUGE score...]{RESET}")
 
         # Calcola tutte le metriche ROUGE
-        scores = rouge_scorer.RougeScorer(["rouge1", "rouge2", "rougeL"], use_stemmer=True).score(ev.summary, ev.description)
+        scores = ROUGE().score_all(candidate=ev.summary, reference=ev.description)
         rouge1 = scores["rouge1"].fmeasure
         rouge2 = scores["rouge2"].fmeasure
         rougeL = scores["rougeL"].fmeasure
 
-        # Recupera lo storico dal contesto, oppure inizializzalo
-        iteration_data = await ctx.get("iteration_data", default=[])
-
-        # Aggiungi il turno attuale
-        iteration_data.append({
-            "summarizer_prompt": self.prompt,
+        # Aggiungi il turno attuale allo storico del README
+        ev.row.iteration_data.append({
+            "summarizer_prompt": ev.row.prompt,
             "readme": ev.readme,
             "extracted_text": ev.extracted_text,
             "description": ev.description,
@@ -235,27 +272,48 @@ class MetagenteWorkflow(Workflow):
             "rougeL_score": rougeL,
         })
 
-        # Salva nel contesto per il Teacher
-        await ctx.set("iteration_data", iteration_data)
-
         return EvaluatedEvent(
             rouge_score=rougeL,
             summary=ev.summary,
             extracted_text=ev.extracted_text,
             description=ev.description,
-            readme=ev.readme
+            readme=ev.readme,
+            row=ev.row
         )
 
 
+    @step
+    async def Collect_Rows(self, ctx: Context, ev: RowDoneEvent) -> CombinedEvent | None:
+        num_rows = await ctx.get("num_rows")
+        done = ctx.collect_events(ev, [RowDoneEvent] * num_rows)
+        if done is None:
+            return None
+        # The READMEs finish in any order; the combiner gets them in dataset order
+        rows = sorted((event.row for event in done), key=lambda row: row.index)
+        for row in rows:
+            if row.best_score >= 0.7 and row.best_prompt not in self.data_prompt:
+                self.data_prompt.append(row.best_prompt)
+            self.iteration_debug.append({
+                "readme": row.readme,
+                "description": row.description,
+                "iteration_debug": row.iteration_data,
+                "best_ROUGE-L": row.best_score,
+                "best_summarizer_prompt": row.best_prompt
+            })
+        return CombinedEvent(
+            result="No more Readme, let's evaluate all the prompts.....",
+            best_prompts=[row.best_prompt for row in rows]
+        )
+
     @step
     async def Prompt_Combine_Agent(self, ev: CombinedEvent) -> StopEvent:
         print(f"{GREEN}[Prompt_Combine_Agent: Combining best prompts...]{RESET}")
-        if not self.best_prompts:
+        if not ev.best_prompts:
             return StopEvent(result="Nessun prompt da combinare.")
-        prompt_list = "\n---\n".join(self.best_prompts)
+        prompt_list = "\n---\n".join(ev.best_prompts)
         filled = COMBINE_PROMPT.replace("$summarizer_list", prompt_list)
         print(f"{RED}[Prompt_Combine_Agent: LLM prompt ->]\n{filled}{RESET}")
-        response = llm.complete(filled, temperature=0.2)
+        response = await aresilient_complete(self.llm, filled, agent="combiner", temperature=0.2)
         final_prompt = response.text.strip()
         print(f"{YELLOW}[Prompt_Combine_Agent: LLM output (final prompt) ->]\n{final_prompt}{RESET}")
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
@@ -275,14 +333,15 @@ class MetagenteWorkflow(Workflow):
     
 # ---- Evaluation Workflow ----
 class MetagenteEvaluationWorkflow(Workflow):
-    def __init__(self, prompt_filename:str, **kwargs):
+    def __init__(self, prompt_filename:str, batch: bool = False, **kwargs):
+        self.llm, self.llm_mini = make_llms()
         try:
             with open(prompt_filename, "r", encoding="utf-8") as final_prompt:
                 self.summarizer_prompt = final_prompt.read().strip()
                 print(f"{BLUE}[Evaluator Setup: Prompt loaded ->]\n{self.summarizer_prompt}{RESET}")
         except FileNotFoundError:
             raise RuntimeError("final_prompt.txt non trovato; eseguire prima il training.")
-        self.scorer = rouge_scorer.RougeScorer(["rouge1", "rouge2", "rougeL"], use_stemmer=True)
+        self.rouge = ROUGE()
         self.debug_result = {
             "data_debug": [],
             "avg_rouge1_score": 0.0,
@@ -294,6 +353,10 @@ class MetagenteEvaluationWorkflow(Workflow):
         self.total_rougeL = 0.0
         self.count = 0
         self.test_row_index = 0
+        # Batch mode: both stages for the whole test set go through the Batch API before the first row is scored
+        self.batch = batch
+        self.batch_extractions = None
+        self.batch_summaries = None
         super().__init__(**kwargs)
 
     @step
@@ -315,25 +378,38 @@ class MetagenteEvaluationWorkflow(Workflow):
             return StopEvent(result="Workflow completato.")
         print(f"{WHITE}[Evaluation Progress: Row #{self.test_row_index + 1}]{RESET}")
         self.test_row_index += 1
+        if self.batch and self.batch_extractions is None:
+            # The Batch API polls until the batch is done, off the event loop
+            self.batch_extractions, self.batch_summaries = await asyncio.to_thread(
+                batch_evaluate,
+                self.llm_mini, EXTRACTOR_PROMPT, self.summarizer_prompt, list(data_test.readme)
+            )
         prompt = EXTRACTOR_PROMPT.replace("$readme_text", row.readme)
         print(f"{DARK_GRAY}[Extractor_Agent - Eval: LLM prompt ->]\n{prompt}{RESET}")
-        response = llm_mini.complete(prompt, temperature=0.0)
-        print(f"{ORANGE}[Extractor_Agent - Eval: LLM output ->]\n{response.text.strip()}{RESET}")
+        if self.batch and row.readme in self.batch_extractions:
+            extracted_text = self.batch_extractions[row.readme]
+        else:
+            # Online call, also for the rows whose batch request failed
+            extracted_text = await aextract_readme(self.llm_mini, EXTRACTOR_PROMPT, row.readme)
+        print(f"{ORANGE}[Extractor_Agent - Eval: LLM output ->]\n{extracted_text}{RESET}")
 
         return ExtractedEvent(
-            extracted_text=response.text.strip(),
+            extracted_text=extracted_text,
             description=row.description,
             readme=row.readme
         )
 
     @step
     async def Summarizer_Agent(self, ctx: Context, ev: ExtractedEvent ) -> SummaryEvent:
-        filled = self.summarizer_prompt.replace("$extracted_text", ev.extracted_text)
+        filled = fill_summarizer_prompt(self.summarizer_prompt, ev.extracted_text)
         print(f"{RED}[Summarizer_Agent: LLM prompt ->]\n{filled}{RESET}")
-        response = llm_mini.complete(filled, temperature=0.0)
-        print(f"{CYAN}[Summarizer_Agent: LLM output ->]\n{response.text.strip()}{RESET}")
+        if self.batch and ev.extracted_text in self.batch_summaries:
+            summary = self.batch_summaries[ev.extracted_text]
+        else:
+            summary = (await acached_complete(self.llm_mini, filled, agent="summarizer", temperature=0.0)).text.strip()
+        print(f"{CYAN}[Summarizer_Agent: LLM output ->]\n{summary}{RESET}")
         return SummaryEvent(
-            summary=response.text.strip(),
+            summary=summary,
             extracted_text=ev.extracted_text,
             description=ev.description,
             readme=ev.readme
@@ -344,7 +420,7 @@ class MetagenteEvaluationWorkflow(Workflow):
         print(f"{YELLOW}[Evaluator: Calculating ROUGE score...]{RESET}")
 
         # Calcola tutte le metriche ROUGE
-        scores = rouge_scorer.RougeScorer(["rouge1", "rouge2", "rougeL"], use_stemmer=True).score(ev.summary, ev.description)
+        scores = self.rouge.score_all(candidate=ev.summary, reference=ev.description)
         rouge1 = scores["rouge1"].fmeasure
         rouge2 = scores["rouge2"].fmeasure
         rougeL = scores["rougeL"].fmeasure
@@ -384,11 +460,18 @@ async def main():
     # draw_all_possible_flows(MetagenteWorkflow, filename=f"workflow_train_{timestamp}.html")
 
 
-    e = MetagenteEvaluationWorkflow(timeout=None , prompt_filename="final_prompt_2025-06-10_10-03-15.txt", verbose=True)
+    e = MetagenteEvaluationWorkflow(
+        timeout=None, prompt_filename="final_prompt_2025-06-10_10-03-15.txt", verbose=True,
+        # EVALUATION_MODE=batch runs both stages through the Batch API
+        batch=os.getenv("EVALUATION_MODE", "online") == "batch",
+    )
     await e.run()
+    get_cache_stats().report("evaluation")
+    get_generation_stats().report("evaluation")
+    get_readme_budget().report("evaluation")
+    await close_async_http_client()
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M")
     draw_all_possible_flows(MetagenteEvaluationWorkflow, filename=f"workflow_test_50_{timestamp}.html")
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
@@ -11,14 +11,13 @@ Your task is to shorten and extract only the introduction and description inform
 
 
 INITIAL_SUMMARIZER_PROMPT = """
-Summarize the following extracted text from a Github repository README into a short term/phrase introducing the repository:
-<EXTRACTED_README>
-$extracted_text
-</EXTRACTED_README>
-
+Summarize the following extracted text from a Github repository README into a short term/phrase introducing the repository.
 The output should include only a short term/phrase introducing the repository.
 Once finished, hand off to TeacherAgent**: After summarizing the extracted text, save the summary with your function and than hand off to the TeacherAgent with the summary as output
 
+<EXTRACTED_README>
+$extracted_text
+</EXTRACTED_README>
 """
 
 TEACHER_AWARENESS_PROMPT = """
@@ -256,14 +255,15 @@ COMBINE_PROMPT = """
 You are a professional Prompt Engineer. You are working on a system using a Large Language Model (LLM) to help developers automatically generate a short Description term/phrase contain key concept/idea from an extracted text of the README of a Github repository. Your task is to combine several candidate prompts for the LLM into a final prompt.
  
 # Steps:
-- **Review all candidate prompts**: Analyze the following prompts to identify common parts to be included in the final prompt and also includes specific details or conditional key points from these prompts to be included in the final prompt
-<CANDIDATE_PROMPTS>
-$summarizer_list
-</CANDIDATE_PROMPTS>
+- **Review all candidate prompts**: Analyze the prompts in <CANDIDATE_PROMPTS> to identify common parts to be included in the final prompt and also includes specific details or conditional key points from these prompts to be included in the final prompt
 - **Generate a final prompt**: Based on the common parts and conditional key points, generate a final prompt for the LLM.
 
 # Output Format:
 Do not include any reasoning/explanation like "Based on the result of the above review:", "Here's the", ... or any output identifiers like "Prompt:", "New Prompt", ... The output should only include a string representing the prompt for the LLM
+
+<CANDIDATE_PROMPTS>
+$summarizer_list
+</CANDIDATE_PROMPTS>
 """
 
 ANALYSIS_PROMPT = """
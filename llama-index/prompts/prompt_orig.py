@@ -12,19 +12,26 @@ $readme_text
 """
 
 INITIAL_SUMMARIZER_PROMPT = """
-Summarize the following extracted text from a Github repository README into a short term/phrase introducing the repository:
+Summarize the following extracted text from a Github repository README into a short term/phrase introducing the repository.
+The output should include only a short term/phrase introducing the repository.
+ 
 <EXTRACTED_README>
 $extracted_text
 </EXTRACTED_README>
- 
-The output should include only a short term/phrase introducing the repository.
 """
 
+# Static instructions first and the data last, from the most stable (same for every iteration of a README) to the
+# least stable, so the provider can serve the shared prefix from its prompt cache (see tools/prompt_layout.py)
 TEACHER_PROMPT = """
-You are a professional Prompt Engineer. You are working on a system using a Large Language Model (LLM) to help developers automatically generate a short Description term/phrase contain key concept/idea from an extracted text of the README of a Github repository. Your task is to modify and improve the current prompt of the LLM based on the result of testing on a data include a README and a ground truth description.
+You are a professional Prompt Engineer. You are working on a system using a Large Language Model (LLM) to help developers automatically generate a short Description term/phrase contain key concept/idea from an extracted text of the README of a Github repository. Your task is to modify and improve the current prompt of the LLM based on the result of testing on a data include a README and a ground truth description. The data, the current prompt and its result are given at the end.
  
 # Steps:
-- **Analyze the data for testing**: Analyze the following data include an extracted text from a README and a ground truth description from a GitHub repository:
+- **Analyze the data for testing**: Analyze the data include an extracted text from a README in <EXTRACTED_TEXT> and a ground truth description from a GitHub repository in <GROUND_TRUTH DESCRIPTION>.
+- **Review the current result**: Review the generated description in <GENERATED_DESCRIPTION> using the extracted text and its ROUGE score on the ground truth description in <ROUGE_SCORE> to identify improvements that could be made.
+- **Prioritize extracting existing tagline/functional description/purpose statement/overview**: Compare the text from the beginning of the extracted text from README and the ground truth description. If the ground truth description is already existed in this extracted text as a tagline/functional description/purpose statement/overview, you must include in the new prompt the instruction to prioritize using it.
+- **Modify the current prompt**: Identify mistakes and lacking instructions in the current prompt in <CURRENT_PROMPT> from the result of the above review. You should preserve the current prompt as much as possible and only make small changes to the prompt based on the identified mistakes and lacking instructions.
+As the new prompt will not include the ground truth description, DO NOT mention about the ground truth description in the new prompt. DO NOT include any reasoning/explanation like "Based on the result of the above review:", "Here's the", ... or any output identifiers like "Prompt:", "New Prompt", ... The output should only include a string representing the new prompt for the LLM
+ 
 <EXTRACTED_TEXT>
 $extracted_text
 </EXTRACTED_TEXT>
@@ -32,33 +39,32 @@ $extracted_text
 <GROUND_TRUTH DESCRIPTION>
 $description
 </GROUND_TRUTH DESCRIPTION>
-- **Review the current result**: Review the generated description using the extracted text its ROUGE score on the ground truth description to identify improvements that could be made:
+ 
+<CURRENT_PROMPT>
+$summarizer_prompt
+</CURRENT_PROMPT>
+ 
 <GENERATED_DESCRIPTION>
 $generated_about
 </GENERATED_DESCRIPTION>
 <ROUGE_SCORE>
 $rouge_score
 </ROUGE_SCORE>
-- **Prioritize extracting existing tagline/functional description/purpose statement/overview**: Compare the text from the beginning of the extracted text from README and the ground truth description. If the ground truth description is already existed in this extracted text as a tagline/functional description/purpose statement/overview, you must include in the new prompt the instruction to prioritize using it.
-- **Modify the current prompt**: Identify mistakes and lacking instructions in the current prompt from the result of the above review. You should preserve the current prompt as much as possible and only make small changes to the prompt based on the identified mistakes and lacking instructions.
-<CURRENT_PROMPT>
-$summarizer_prompt
-</CURRENT_PROMPT>
-As the new prompt will not include the ground truth description, DO NOT mention about the ground truth description in the new prompt. DO NOT include any reasoning/explanation like "Based on the result of the above review:", "Here's the", ... or any output identifiers like "Prompt:", "New Prompt", ... The output should only include a string representing the new prompt for the LLM
 """
 
 COMBINE_PROMPT = """
 You are a professional Prompt Engineer. You are working on a system using a Large Language Model (LLM) to help developers automatically generate a short Description term/phrase contain key concept/idea from an extracted text of the README of a Github repository. Your task is to combine several candidate prompts for the LLM into a final prompt.
  
 # Steps:
-- **Review all candidate prompts**: Analyze the following prompts to identify common parts to be included in the final prompt and also includes specific details or conditional key points from these prompts to be included in the final prompt
-<CANDIDATE_PROMPTS>
-$summarizer_list
-</CANDIDATE_PROMPTS>
+- **Review all candidate prompts**: Analyze the prompts in <CANDIDATE_PROMPTS> to identify common parts to be included in the final prompt and also includes specific details or conditional key points from these prompts to be included in the final prompt
 - **Generate a final prompt**: Based on the common parts and conditional key points, generate a final prompt for the LLM.
 
 # Output Format:
 Do not include any reasoning/explanation like "Based on the result of the above review:", "Here's the", ... or any output identifiers like "Prompt:", "New Prompt", ... The output should only include a string representing the prompt for the LLM
+
+<CANDIDATE_PROMPTS>
+$summarizer_list
+</CANDIDATE_PROMPTS>
 """
 
 ANALYSIS_PROMPT = """
@@ -141,10 +147,23 @@ $extracted_text
 </EXTRACTED_README>"""
 
 TEACHER_PROMPT_EVO = """
-You are a professional Prompt Engineer. You are working on a system using a Large Language Model (LLM) to help developers automatically generate a short Description term/phrase contain key concept/idea from an extracted text of the README of a Github repository. Your task is to modify and improve the current prompt of the LLM based on the result of testing on a data include a README and a ground truth description.
+You are a professional Prompt Engineer. You are working on a system using a Large Language Model (LLM) to help developers automatically generate a short Description term/phrase contain key concept/idea from an extracted text of the README of a Github repository. Your task is to modify and improve the current prompt of the LLM based on the result of testing on a data include a README and a ground truth description. The data, the previous attempts, the current prompt and its result are given at the end.
  
 # Steps:
-- **Analyze the data for testing**: Analyze the following data include an extracted text from a README and a ground truth description from a GitHub repository:
+- **Analyze the data for testing**: Analyze the data include an extracted text from a README in <EXTRACTED_TEXT> and a ground truth description from a GitHub repository in <GROUND_TRUTH DESCRIPTION>.
+
+- **Review the current result**: Review the generated description in <GENERATED_DESCRIPTION> using the extracted text and its ROUGE score on the ground truth description in <ROUGE_SCORE> to identify improvements that could be made.
+
+- **Previous Attempts History (if any)**:
+You may find useful to consider the previous prompt variations and their ROUGE-L results in <HISTORY_ATTEMPTS>.
+
+- **Prioritize extracting existing tagline/functional description/purpose statement/overview**: Compare the text from the beginning of the extracted text from README and the ground truth description. If the ground truth description is already existed in this extracted text as a tagline/functional description/purpose statement/overview, you must include in the new prompt the instruction to prioritize using it.
+
+- **Modify the current prompt**: Identify mistakes and lacking instructions in the current prompt in <CURRENT_PROMPT> from the result of the above review. You should preserve the current prompt as much as possible and only make small changes to the prompt based on the identified mistakes and lacking instructions.
+IMPORTANT: The new prompt MUST include the placeholder extracted text that you find in the summarizer prompt. Leave it as is, otherwise, the system will fail.
+
+As the new prompt will not include the ground truth description, DO NOT mention about the ground truth description in the new prompt. DO NOT include any reasoning/explanation like "Based on the result of the above review:", "Here's the", ... or any output identifiers like "Prompt:", "New Prompt", ... The output must be only the new prompt string for the LLM, with no explanations or formatting.
+
 <EXTRACTED_TEXT>
 $extracted_text
 </EXTRACTED_TEXT>
@@ -153,28 +172,20 @@ $extracted_text
 $description
 </GROUND_TRUTH DESCRIPTION>
 
-- **Review the current result**: Review the generated description using the extracted text its ROUGE score on the ground truth description to identify improvements that could be made:
-<GENERATED_DESCRIPTION>
-$generated_about
-</GENERATED_DESCRIPTION>
-<ROUGE_SCORE>
-$rouge_score
-</ROUGE_SCORE>
-
-- **Previous Attempts History (if any)**:
-You may find useful to consider the following previous prompt variations and their ROUGE-L results.
+<HISTORY_ATTEMPTS>
 $history_attempts
-
-- **Prioritize extracting existing tagline/functional description/purpose statement/overview**: Compare the text from the beginning of the extracted text from README and the ground truth description. If the ground truth description is already existed in this extracted text as a tagline/functional description/purpose statement/overview, you must include in the new prompt the instruction to prioritize using it.
-
-- **Modify the current prompt**: Identify mistakes and lacking instructions in the current prompt from the result of the above review. You should preserve the current prompt as much as possible and only make small changes to the prompt based on the identified mistakes and lacking instructions.
-IMPORTANT: The new prompt MUST include the placeholder extracted text that you find in the summarizer prompt. Leave it as is, otherwise, the system will fail.
+</HISTORY_ATTEMPTS>
 
 <CURRENT_PROMPT>
 $summarizer_prompt
 </CURRENT_PROMPT>
 
-As the new prompt will not include the ground truth description, DO NOT mention about the ground truth description in the new prompt. DO NOT include any reasoning/explanation like "Based on the result of the above review:", "Here's the", ... or any output identifiers like "Prompt:", "New Prompt", ... The output must be only the new prompt string for the LLM, with no explanations or formatting.
+<GENERATED_DESCRIPTION>
+$generated_about
+</GENERATED_DESCRIPTION>
+<ROUGE_SCORE>
+$rouge_score
+</ROUGE_SCORE>
 """
 
 COMBINE_PROMPT_EVO = """
@@ -183,18 +194,17 @@ You are a professional Prompt Engineer. You are working on a system that uses a
 Your task is to combine several candidate prompts into a single, optimized prompt to be used by the LLM.
 
 ## Instructions:
-1. Carefully analyze the candidate prompts provided below. For each one, a ROUGE-L score is reported, indicating how well the prompt performed in generating accurate descriptions.
+1. Carefully analyze the candidate prompts provided in <CANDIDATE_PROMPTS> at the end. For each one, a ROUGE-L score is reported, indicating how well the prompt performed in generating accurate descriptions.
 2. Identify:
    - Common structures and essential instructions that appear in high-scoring prompts.
    - Unique or valuable elements from prompts with high ROUGE-L scores (e.g., > 0.70).
    - Patterns or phrasing that may have contributed to lower scores, which should be avoided or revised.
 3. Based on this analysis, synthesize a final prompt that maximizes clarity, generalizability, and expected performance based on ROUGE-L.
 
-<CANDIDATE_PROMPTS>
-$summarizer_list
-</CANDIDATE_PROMPTS>
-
 ## Output format:
 Return only the final prompt as a plain string. Do not include any explanation, justification, or labels like “Prompt:”.
-"""
 
+<CANDIDATE_PROMPTS>
+$summarizer_list
+</CANDIDATE_PROMPTS>
+"""
\ No newline at end of file
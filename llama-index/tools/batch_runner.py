@@ -0,0 +1,104 @@
+"""Runs chat completion requests through the provider Batch API; request and result JSONL files are
+kept under BATCH_DIR."""
+import json
+import os
+import time
+import uuid
+
+import openai
+
+from tools.generation_profiles import get_generation_stats
+from tools.prompt_layout import get_cache_stats
+
+# BATCH_DIR overrides it; BATCH_POLL_SECONDS sets the time between status checks
+DEFAULT_DIR = os.path.join(".llm_cache", "batches")
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchError(Exception):
+    """Raised when a batch ends in any state other than completed."""
+
+
+def chat_request(custom_id: str, model: str, messages: list[dict], **params) -> dict:
+    """One JSONL line of a chat completions batch; the url is filled in by run_batch."""
+    return {"custom_id": custom_id, "method": "POST", "body": {"model": model, "messages": messages, **params}}
+
+
+def _write_jsonl(path: str, records: list[dict]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def _download(client: openai.OpenAI, file_id: str | None, path: str) -> list[dict]:
+    """The JSONL records of a batch file, also saved to path; none when the batch has no such file."""
+    if file_id is None:
+        return []
+    text = client.files.content(file_id).text
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def _error_message(record: dict) -> str:
+    response = record.get("response") or {}
+    error = record.get("error") or (response.get("body") or {}).get("error") or {}
+    status = response.get("status_code")
+    message = error.get("message") if isinstance(error, dict) else str(error)
+    return message or f"status {status}"
+
+
+def run_batch(client: openai.OpenAI, requests: list[dict], name: str) -> tuple[dict[str, str], dict[str, str]]:
+    """
+    Submits the requests as one batch and returns ({custom_id: completion text}, {custom_id: error}): every request
+    is in one of the two. `name` is the agent that sent them, which the finish reasons are recorded under.
+    """
+    if not requests:
+        return {}, {}
+    # Azure serves the batch endpoint without the /v1 prefix
+    endpoint = "/chat/completions" if isinstance(client, openai.AzureOpenAI) else "/v1/chat/completions"
+    directory = os.getenv("BATCH_DIR", DEFAULT_DIR)
+    os.makedirs(directory, exist_ok=True)
+    stamp = f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    input_path = os.path.join(directory, f"{name}_{stamp}_input.jsonl")
+    _write_jsonl(input_path, [{**request, "url": endpoint} for request in requests])
+
+    with open(input_path, "rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=input_file.id, endpoint=endpoint, completion_window="24h", metadata={"name": name}
+    )
+    print(f"[Batch {name}] {len(requests)} requests submitted as {batch.id}")
+
+    poll_seconds = float(os.getenv("BATCH_POLL_SECONDS", 30))
+    while batch.status not in TERMINAL_STATUSES:
+        time.sleep(poll_seconds)
+        batch = client.batches.retrieve(batch.id)
+    if batch.status != "completed":
+        raise BatchError(f"Batch {batch.id} ({name}) ended as {batch.status}: {batch.errors}")
+
+    # A batch whose requests all failed has an error file and no output file
+    output_path = os.path.join(directory, f"{name}_{stamp}_output.jsonl")
+    records = _download(client, batch.output_file_id, output_path)
+    records += _download(client, batch.error_file_id, os.path.join(directory, f"{name}_{stamp}_errors.jsonl"))
+
+    results = {}
+    errors = {}
+    for record in records:
+        response = record.get("response") or {}
+        if response.get("status_code") == 200:
+            body = response["body"]
+            choice = body["choices"][0]
+            usage = body.get("usage") or {}
+            results[record["custom_id"]] = choice["message"]["content"] or ""
+            get_cache_stats().record_usage(body.get("model"), usage)
+            get_generation_stats().record(name, choice.get("finish_reason"), usage.get("completion_tokens"))
+        else:
+            errors[record["custom_id"]] = _error_message(record)
+    for request in requests:
+        if request["custom_id"] not in results:
+            errors.setdefault(request["custom_id"], "no result in the batch output")
+    for custom_id, error in errors.items():
+        print(f"[Batch {name}] {custom_id} failed: {error}")
+    print(f"[Batch {name}] {len(results)} completed, {len(errors)} failed, results in {directory}")
+    return results, errors
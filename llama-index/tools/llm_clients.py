@@ -0,0 +1,144 @@
+"""
+Process-wide async HTTP client shared by the LLMs of the workflows.
+
+The workflow steps await llm.acomplete (through aextract_readme, acached_complete and aresilient_complete in
+tools/tools.py), so a step waiting on the API hands the event loop to the other steps instead of blocking it for
+the whole round trip. The workflows build their LLMs with async_http_client=get_async_http_client(): every LLM
+reuses the same keep-alive connection pool instead of opening its own. The pool belongs to the event loop it was
+created in, so LLMs are built inside the running loop (in the workflow constructors, from main) and a later
+asyncio.run gets a new pool; close_async_http_client() closes it once the workflow is over.
+
+Benchmark of blocking and awaited calls under the workflow runtime, against a local stub with 200 ms latency
+(from the llama-index folder):
+
+    python -m tools.llm_clients
+"""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+from openai import DefaultAsyncHttpxClient
+
+# Connections kept open per process; the workflows never have more requests than this in flight
+MAX_CONNECTIONS = 20
+KEEPALIVE_EXPIRY = 60.0
+
+_http_client: httpx.AsyncClient | None = None
+_http_client_loop: asyncio.AbstractEventLoop | None = None
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    The shared connection pool of the running event loop, passed to the LLMs as async_http_client. Raises
+    RuntimeError outside a coroutine: a pool created at import time would be tied to no loop, or to a closed one.
+    """
+    global _http_client, _http_client_loop
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client_loop is not loop:
+        # The pool of an earlier asyncio.run cannot be closed any more, as its loop is gone
+        _http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS,
+                                keepalive_expiry=KEEPALIVE_EXPIRY)
+        )
+        _http_client_loop = loop
+    return _http_client
+
+
+async def close_async_http_client() -> None:
+    """Closes the pool of the running event loop; the next get_async_http_client() opens a new one."""
+    global _http_client, _http_client_loop
+    if _http_client is not None and _http_client_loop is asyncio.get_running_loop():
+        await _http_client.aclose()
+    _http_client = None
+    _http_client_loop = None
+
+
+def _stub_server(latency: float) -> ThreadingHTTPServer:
+    """HTTP server in a thread answering every chat completion after `latency` seconds."""
+    body = json.dumps({
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": 0,
+        "model": "gpt-4o-mini-2024-07-18",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": "A stub about."}}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 4, "total_tokens": 14},
+    }).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    # Outside the event loop, so blocking calls made from a step can still be answered
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def _benchmark(rows: int = 16, workers: int = 4, latency: float = 0.2):
+    from llama_index.core.workflow import Context, Event, StartEvent, StopEvent, Workflow, step
+    from llama_index.llms.openai import OpenAI
+
+    from tools.tools import aresilient_complete, resilient_complete
+
+    server = _stub_server(latency)
+    llm = OpenAI(model="gpt-4o-mini", api_key="stub", api_base=f"http://127.0.0.1:{server.server_port}/v1",
+                 max_retries=0, async_http_client=get_async_http_client())
+
+    class CallEvent(Event):
+        index: int
+
+    class DoneEvent(Event):
+        index: int
+
+    class FanOutWorkflow(Workflow):
+        def __init__(self, awaited: bool, **kwargs):
+            self.awaited = awaited
+            super().__init__(**kwargs)
+
+        @step
+        async def fan_out(self, ctx: Context, ev: StartEvent) -> CallEvent:
+            for index in range(rows):
+                ctx.send_event(CallEvent(index=index))
+            return None
+
+        @step(num_workers=workers)
+        async def call(self, ctx: Context, ev: CallEvent) -> DoneEvent:
+            if self.awaited:
+                await aresilient_complete(llm, f"Summarize README {ev.index}.")
+            else:
+                resilient_complete(llm, f"Summarize README {ev.index}.")
+            return DoneEvent(index=ev.index)
+
+        @step
+        async def collect(self, ctx: Context, ev: DoneEvent) -> StopEvent:
+            if ctx.collect_events(ev, [DoneEvent] * rows) is None:
+                return None
+            return StopEvent(result=rows)
+
+    for label, awaited in (("complete (blocking)", False), ("acomplete (awaited)", True)):
+        start = time.perf_counter()
+        await FanOutWorkflow(awaited, timeout=None).run()
+        elapsed = time.perf_counter() - start
+        print(f"{rows} steps, num_workers={workers}, {label}: {elapsed:.2f} s "
+              f"({rows * latency / elapsed:.1f} requests in flight on average)")
+    await close_async_http_client()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(_benchmark())
@@ -0,0 +1,121 @@
+"""
+Re-computes ROUGE-1/2/L for saved evaluation CSVs, fanning the rows out over a process pool.
+
+Run it from the llama-index folder, passing CSV files or folders of CSVs:
+
+    python -m tools.rescore_rouge result/test ../haystack/result/test ../analysis_results/evaluation/autogen
+
+Each file is written in the layout produced by save_evaluation_result under --output-dir (default: result/rescored),
+at its path relative to the repository root, e.g. result/rescored/haystack/result/test/<file>.csv. The saved results
+of the replication package are only overwritten with an explicit --in-place.
+"""
+import argparse
+import csv
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from metric.rouge import ROUGE
+
+TEXT_COLUMNS = ["Description", "Generated About"]
+SCORE_COLUMNS = ["ROUGE-1", "ROUGE-2", "ROUGE-L"]
+AVERAGE_COLUMNS = ["Average ROUGE-1", "Average ROUGE-2", "Average ROUGE-L"]
+DEFAULT_OUTPUT_DIR = os.path.join("result", "rescored")
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _collect_csv_files(paths: list[str]) -> list[str]:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "*.csv"))))
+        else:
+            files.append(path)
+    return files
+
+
+def _score_chunk(task: tuple) -> pd.DataFrame:
+    """Worker: scores one chunk of (candidate, reference) rows."""
+    candidates, references = task
+    return ROUGE().score_batch(candidates, references)[SCORE_COLUMNS]
+
+
+def _write_evaluation_csv(path: str, df: pd.DataFrame, scores: pd.DataFrame) -> None:
+    # Same layout as save_evaluation_result: the averages only appear on the first data row
+    rows = [
+        [description, generated_about, *score_row]
+        for description, generated_about, score_row in zip(
+            df["Description"], df["Generated About"], scores.itertuples(index=False, name=None)
+        )
+    ]
+    if rows:
+        rows[0].extend(scores.mean().tolist())
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(TEXT_COLUMNS + SCORE_COLUMNS + AVERAGE_COLUMNS)
+        writer.writerows(rows)
+
+
+def _output_path(path: str, output_dir: str) -> str:
+    # Relative to the repository root, so llama-index/result/test and haystack/result/test do not collide
+    absolute = os.path.abspath(path)
+    relative = os.path.relpath(absolute, REPO_ROOT)
+    if relative.startswith(os.pardir):
+        relative = os.path.splitdrive(absolute)[1].lstrip(os.sep)
+    return os.path.join(output_dir, relative)
+
+
+def rescore_files(paths: list[str], output_dir: str = DEFAULT_OUTPUT_DIR, in_place: bool = False, chunk_size: int = 256,
+                  workers: int = None) -> list[str]:
+    """Re-scores every evaluation CSV under `paths` and returns the files written."""
+    frames = {}
+    tasks = []
+    owners = []
+    for path in _collect_csv_files(paths):
+        df = pd.read_csv(path)
+        if not set(TEXT_COLUMNS).issubset(df.columns):
+            print(f"Skipping {path}: no {TEXT_COLUMNS} columns to score")
+            continue
+
+        df[TEXT_COLUMNS] = df[TEXT_COLUMNS].fillna("").astype(str)
+        frames[path] = df
+
+        candidates = df["Generated About"].tolist()
+        references = df["Description"].tolist()
+        for start in range(0, len(df), chunk_size):
+            tasks.append((candidates[start:start + chunk_size], references[start:start + chunk_size]))
+            owners.append(path)
+
+    # Chunks come back in submission order, so each file's scores can simply be concatenated
+    chunks = {path: [] for path in frames}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for path, scores in zip(owners, executor.map(_score_chunk, tasks)):
+            chunks[path].append(scores)
+
+    written = []
+    for path, df in frames.items():
+        scores = pd.concat(chunks[path], ignore_index=True) if chunks[path] else pd.DataFrame(columns=SCORE_COLUMNS)
+        target = path if in_place else _output_path(path, output_dir)
+        _write_evaluation_csv(target, df, scores)
+        print(f"Rescored {len(df)} rows -> {target}")
+        written.append(target)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-compute ROUGE-1/2/L for evaluation result CSVs.")
+    parser.add_argument("paths", nargs="+", help="CSV files or folders containing CSV files")
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR,
+                        help=f"Write the rescored files here, at their path in the repository (default: {DEFAULT_OUTPUT_DIR})")
+    output.add_argument("--in-place", action="store_true", help="Overwrite the input files instead")
+    parser.add_argument("--chunk-size", type=int, default=256, help="Rows scored per worker task")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: number of CPUs)")
+    args = parser.parse_args()
+
+    rescore_files(args.paths, output_dir=args.output_dir, in_place=args.in_place, chunk_size=args.chunk_size,
+                  workers=args.workers)
@@ -1,9 +1,23 @@
 from llama_index.core.tools.tool_spec.base import BaseToolSpec
+from llama_index.core.base.llms.types import CompletionResponse
 from llama_index.core.workflow import Context
 from metric.rouge import ROUGE
+from tools.llm_cache import get_llm_cache, is_deterministic
+from tools.extraction_store import aextract_once, extract_once, get_extraction_store
+from tools.batch_runner import chat_request, run_batch
+from tools.generation_profiles import check_retry, get_generation_stats, get_profile
+from tools.prompt_layout import get_cache_stats, stable_layout
+from tools.rate_limiter import get_rate_limiter
+from tools.readme_budget import fit_readme
+from tools.resilient_call import acall, admitted, call, request_timeout
 import pandas as pd
+import asyncio
 import os
+import weakref
 
+# In-flight LLM calls of all the workflow steps together: num_workers only bounds each step on its own
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 4))
+_llm_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
 
 
 
@@ -74,9 +88,256 @@ async def calculate_rouge_score(ctx: Context) -> str:
     return f"New rouge_score calculated is {rouge_score}"
 
 def simple_rouge_l_score(generated_about: str, ground_truth_description: str) -> float:
-    rouge = ROUGE()
-    rouge1_score = rouge.get_Rouge1(string_1=generated_about, string_2=ground_truth_description)
-    rouge2_score = rouge.get_Rouge2(string_1=generated_about, string_2=ground_truth_description)
-    rougeL_score = rouge.get_RougeL(string_1=generated_about, string_2=ground_truth_description)
+    scores = ROUGE().score_all(candidate=generated_about, reference=ground_truth_description)
+    rouge1_score = scores["rouge1"].fmeasure
+    rouge2_score = scores["rouge2"].fmeasure
+    rougeL_score = scores["rougeL"].fmeasure
     print(f"ROUGE-1: {rouge1_score:.3f}, ROUGE-2: {rouge2_score:.3f}, ROUGE-L: {rougeL_score:.3f}")
     return rougeL_score
+
+
+def limited_complete(llm, prompt: str, **kwargs) -> CompletionResponse:
+    """
+    llm.complete(prompt, **kwargs) once the shared rate limiter has room for it under the model's RPM/TPM.
+    """
+    limiter = get_rate_limiter()
+    if limiter is None:
+        admitted()
+        response = llm.complete(prompt, **_request_kwargs(kwargs))
+        get_cache_stats().record_usage(llm.model, getattr(response.raw, "usage", None))
+        return response
+    with limiter.limit_sync(llm.model, prompt, kwargs.get("max_tokens", getattr(llm, "max_tokens", None))) as reservation:
+        # The attempt's timeout starts here, not while queued (see tools/resilient_call.py)
+        admitted()
+        response = llm.complete(prompt, **_request_kwargs(kwargs))
+        usage = getattr(response.raw, "usage", None)
+        if usage is not None:
+            reservation.reconcile(usage.prompt_tokens, usage.completion_tokens)
+        get_cache_stats().record_usage(llm.model, usage)
+    return response
+
+
+def _request_kwargs(kwargs: dict) -> dict:
+    # A blocking request given up on by resilient_complete is aborted by the HTTP client at the same time
+    timeout = request_timeout()
+    return kwargs if timeout is None else {**kwargs, "timeout": timeout}
+
+
+async def alimited_complete(llm, prompt: str, **kwargs) -> CompletionResponse:
+    """
+    await llm.acomplete(prompt, **kwargs) once the shared rate limiter has room for it; the event loop keeps
+    running the other steps while the request is in flight.
+    """
+    limiter = get_rate_limiter()
+    if limiter is None:
+        admitted()
+        response = await llm.acomplete(prompt, **kwargs)
+        get_cache_stats().record_usage(llm.model, getattr(response.raw, "usage", None))
+        return response
+    async with limiter.limit(llm.model, prompt, kwargs.get("max_tokens", getattr(llm, "max_tokens", None))) as reservation:
+        admitted()
+        response = await llm.acomplete(prompt, **kwargs)
+        usage = getattr(response.raw, "usage", None)
+        if usage is not None:
+            reservation.reconcile(usage.prompt_tokens, usage.completion_tokens)
+        get_cache_stats().record_usage(llm.model, usage)
+    return response
+
+
+def _with_profile(agent: str | None, kwargs: dict) -> dict:
+    # Explicit arguments win over the agent's generation profile (see tools/generation_profiles.py)
+    return {**get_profile(agent).params(), **kwargs} if agent is not None else kwargs
+
+
+def resilient_complete(llm, prompt: str, *, agent: str | None = None, **kwargs) -> CompletionResponse:
+    """
+    limited_complete with backoff, per-attempt timeouts and a deadline (see tools/resilient_call.py).
+    Empty completions are retried too; a call that keeps failing raises LLMCallError. With `agent`, the request
+    carries the agent's generation profile and its finish reason is recorded.
+    """
+    kwargs = _with_profile(agent, kwargs)
+    response = call(lambda: limited_complete(llm, prompt, **kwargs), llm.model, validate=lambda r: bool(r.text.strip()),
+                    queued=True)
+    retry_kwargs = _retry_kwargs(agent, _record_finish(agent, response), kwargs)
+    if retry_kwargs is not None:
+        response = call(lambda: limited_complete(llm, prompt, **retry_kwargs), llm.model,
+                        validate=lambda r: bool(r.text.strip()), queued=True)
+        check_retry(agent, _record_finish(agent, response))
+    return response
+
+
+def _llm_slot() -> asyncio.Semaphore:
+    # One semaphore per event loop, as a later asyncio.run (the evaluation phase) cannot wait on an earlier one
+    loop = asyncio.get_running_loop()
+    slot = _llm_slots.get(loop)
+    if slot is None:
+        slot = _llm_slots[loop] = asyncio.Semaphore(LLM_CONCURRENCY)
+    return slot
+
+
+async def aresilient_complete(llm, prompt: str, *, agent: str | None = None, **kwargs) -> CompletionResponse:
+    """
+    resilient_complete on llm.acomplete, for the workflow steps. At most LLM_CONCURRENCY calls are in flight
+    across all steps.
+    """
+    async with _llm_slot():
+        return await _aresilient_complete(llm, prompt, agent, kwargs)
+
+
+async def _aresilient_complete(llm, prompt: str, agent: str | None, kwargs: dict) -> CompletionResponse:
+    kwargs = _with_profile(agent, kwargs)
+    response = await acall(lambda: alimited_complete(llm, prompt, **kwargs), llm.model,
+                           validate=lambda r: bool(r.text.strip()), queued=True)
+    retry_kwargs = _retry_kwargs(agent, _record_finish(agent, response), kwargs)
+    if retry_kwargs is not None:
+        response = await acall(lambda: alimited_complete(llm, prompt, **retry_kwargs), llm.model,
+                               validate=lambda r: bool(r.text.strip()), queued=True)
+        check_retry(agent, _record_finish(agent, response))
+    return response
+
+
+def _record_finish(agent: str | None, response: CompletionResponse):
+    """Records the finish reason of the response of an agent and returns it."""
+    if agent is None:
+        return None
+    choices = getattr(response.raw, "choices", None)
+    usage = getattr(response.raw, "usage", None)
+    finish_reason = choices[0].finish_reason if choices else None
+    get_generation_stats().record(agent, finish_reason, getattr(usage, "completion_tokens", None))
+    return finish_reason
+
+
+def _retry_kwargs(agent: str | None, finish_reason, kwargs: dict) -> dict | None:
+    """
+    The arguments of the retry of an output cut at max_tokens, or None when it is not retried. A Teacher or
+    Combiner output must be a whole prompt (see tools/generation_profiles.py); check_retry raises when the retry
+    is cut as well.
+    """
+    if agent is None:
+        return None
+    profile = get_profile(agent)
+    if not profile.retries(finish_reason):
+        return None
+    print(f"[{agent}] Output cut at max_tokens, retrying with max_tokens={profile.retry_max_tokens}")
+    return {**kwargs, "max_tokens": profile.retry_max_tokens}
+
+
+def cached_complete(llm, prompt: str, *, agent: str | None = None, **kwargs) -> CompletionResponse:
+    """
+    resilient_complete(llm, prompt, agent=agent, **kwargs), answered from the on-disk response cache for
+    temperature 0 calls.
+    """
+    kwargs = _with_profile(agent, kwargs)
+    cache, cache_key = _cache_key(llm, prompt, kwargs)
+    if cache is None:
+        return resilient_complete(llm, prompt, agent=agent, **kwargs)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return CompletionResponse(text=cached)
+
+    response = resilient_complete(llm, prompt, agent=agent, **kwargs)
+    cache.set(cache_key, response.text)
+    return response
+
+
+async def acached_complete(llm, prompt: str, *, agent: str | None = None, **kwargs) -> CompletionResponse:
+    """cached_complete on llm.acomplete, for the workflow steps."""
+    kwargs = _with_profile(agent, kwargs)
+    cache, cache_key = _cache_key(llm, prompt, kwargs)
+    if cache is None:
+        return await aresilient_complete(llm, prompt, agent=agent, **kwargs)
+    # The SQLite lookups run in a worker thread, off the event loop the other steps share
+    cached = await asyncio.to_thread(cache.get, cache_key)
+    if cached is not None:
+        return CompletionResponse(text=cached)
+
+    response = await aresilient_complete(llm, prompt, agent=agent, **kwargs)
+    await asyncio.to_thread(cache.set, cache_key, response.text)
+    return response
+
+
+def _cache_key(llm, prompt: str, kwargs: dict):
+    """(response cache, key of the call), or (None, None) when the call is not deterministic or the cache is off."""
+    temperature = kwargs.get("temperature", getattr(llm, "temperature", None))
+    cache = get_llm_cache() if is_deterministic(temperature) else None
+    if cache is None:
+        return None, None
+    params = {"provider": type(llm).__name__, "engine": getattr(llm, "engine", None), **kwargs}
+    return cache, cache.make_key(llm.model, params, prompt)
+
+
+def fill_summarizer_prompt(summarizer_prompt: str, extracted_text: str) -> str:
+    """
+    The Summarizer prompt for one README: the optional word budget of its generation profile joins the static
+    instructions and the data goes last, where the prompt cache needs it (see tools/prompt_layout.py).
+    """
+    hint = get_profile("summarizer").hint()
+    if hint:
+        summarizer_prompt = f"{summarizer_prompt}\n\n{hint}"
+    return stable_layout(summarizer_prompt, ["extracted_text"]).replace("$extracted_text", extracted_text)
+
+
+def extract_readme(llm, extractor_prompt: str, readme: str) -> str:
+    """
+    Extractor call made once per README and extractor prompt; later rows, iterations and phases reuse it.
+    Oversized READMEs are cut to README_TOKEN_BUDGET first, and the stored extraction is keyed on what was sent.
+    """
+    readme = fit_readme(readme)
+
+    def extract() -> str:
+        prompt = extractor_prompt.replace("$readme_text", readme)
+        return cached_complete(llm, prompt, agent="extractor", temperature=0.0).text.strip()
+
+    return extract_once(readme, extractor_prompt, llm.model, extract)
+
+
+async def aextract_readme(llm, extractor_prompt: str, readme: str) -> str:
+    """extract_readme on llm.acomplete, for the workflow steps."""
+    readme = fit_readme(readme)
+
+    async def extract() -> str:
+        prompt = extractor_prompt.replace("$readme_text", readme)
+        return (await acached_complete(llm, prompt, agent="extractor", temperature=0.0)).text.strip()
+
+    return await aextract_once(readme, extractor_prompt, llm.model, extract)
+
+
+def batch_evaluate(llm, extractor_prompt: str, summarizer_prompt: str, readmes: list[str]) -> tuple[dict, dict]:
+    """
+    Both evaluation stages through the Batch API: all Extractor requests in one batch, then all Summarizer requests.
+    Returns {readme: extracted_text} and {extracted_text: summary}; READMEs already in the extraction store are reused.
+    The requests that failed in the batch are left out, and the flows run them online.
+    """
+    client = llm._get_client()
+    # Azure addresses the deployment (engine), OpenAI the model
+    model = getattr(llm, "engine", None) or llm.model
+    store = get_extraction_store()
+    extracted = {}
+    requests = []
+    requested = set()
+    fitted = [fit_readme(readme) for readme in readmes]
+    for i, readme in enumerate(readmes):
+        stored = store.get(fitted[i], extractor_prompt, llm.model) if store else None
+        if stored is not None:
+            extracted[readme] = stored
+        elif readme not in requested:
+            requested.add(readme)
+            prompt = extractor_prompt.replace("$readme_text", fitted[i])
+            requests.append(chat_request(str(i), model, [{"role": "user", "content": prompt}], temperature=0.0,
+                                         **get_profile("extractor").params()))
+    extractions, _ = run_batch(client, requests, "extractor")
+    for custom_id, text in extractions.items():
+        readme = readmes[int(custom_id)]
+        extracted[readme] = text.strip()
+        if store is not None:
+            store.put(fitted[int(custom_id)], extractor_prompt, llm.model, extracted[readme])
+
+    extracted_texts = list(dict.fromkeys(extracted.values()))
+    requests = [
+        chat_request(str(i), model, [{"role": "user", "content": fill_summarizer_prompt(summarizer_prompt, text)}],
+                     temperature=0.0, **get_profile("summarizer").params())
+        for i, text in enumerate(extracted_texts)
+    ]
+    summaries, _ = run_batch(client, requests, "summarizer")
+    summaries = {extracted_texts[int(custom_id)]: text.strip() for custom_id, text in summaries.items()}
+    return extracted, summaries
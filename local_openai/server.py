@@ -0,0 +1,446 @@
+"""
+Local OpenAI-compatible stand-in server, so the pipelines can run and be benchmarked without network access.
+
+Implements chat completions (plain JSON and SSE streaming) on the OpenAI and Azure OpenAI routes, answers
+deterministically (scripted responses, otherwise a heuristic summary of the prompt), simulates latency and
+429 rate limits, emulates the provider's prompt prefix cache (reported as cached_tokens) and writes usage in
+the analysis_results/token_usage CSV layout. The Files and Batch API
+(/v1/files, /v1/batches) are emulated on disk under --batch-dir, so batch evaluation runs offline too.
+
+    python local_openai/server.py --port 8000 --latency-ms 300 --per-token-ms 15 --rpm 500 \
+        --usage-csv local_openai/usage.csv
+
+Point the frameworks to it with:
+    OPENAI_BASE_URL=http://127.0.0.1:8000/v1 OPENAI_API_KEY=local            (OpenAI clients)
+    azure_endpoint="http://127.0.0.1:8000"                                     (Azure clients)
+
+Batch requests skip the simulated latency and rate limits (the real service has its own queue) and are
+recorded with batch=True in the usage CSV.
+
+Scripted responses (--script) are a JSON list of {"match": "<regex>", "response": "<text>"}; the first
+pattern found in the last user message wins.
+"""
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+# Same columns as the OpenAI usage export in analysis_results/token_usage
+USAGE_COLUMNS = [
+    "start_time", "end_time", "input_tokens", "output_tokens", "num_model_requests", "project_id", "user_id",
+    "api_key_id", "model", "batch", "service_tier", "input_cached_tokens", "input_uncached_tokens",
+    "input_audio_tokens", "output_audio_tokens",
+]
+# Usage and responses report the dated snapshot, like the real API
+MODEL_SNAPSHOTS = {
+    "gpt-4o-mini": "gpt-4o-mini-2024-07-18",
+    "gpt-4o": "gpt-4o-2024-08-06",
+    "gpt-4.1": "gpt-4.1-2025-04-14",
+}
+DEFAULT_MAX_TOKENS = 256
+# Prompt caching: prefixes of 1024 tokens or more are reused in 128-token steps
+CACHE_MIN_TOKENS = 1024
+CACHE_STEP_TOKENS = 128
+WORD_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+class Settings:
+    def __init__(self, latency_ms: float = 0, per_token_ms: float = 0, rpm: int = 0, error_rate: float = 0,
+                 seed: int = 0, usage_csv: str = None, script: list = None, batch_dir: str = "local_openai/batches",
+                 batch_delay: float = 0, prompt_cache_ttl: float = 300):
+        self.prompt_cache_ttl = prompt_cache_ttl
+        self.batch_dir = batch_dir
+        self.batch_delay = batch_delay
+        self.latency_ms = latency_ms
+        self.per_token_ms = per_token_ms
+        self.rpm = rpm
+        self.error_rate = error_rate
+        self.usage_csv = usage_csv
+        self.script = [(re.compile(entry["match"], re.S), entry["response"]) for entry in script or []]
+        self.random = random.Random(seed)
+
+
+def count_tokens(text: str) -> int:
+    """Rough offline token count: words and punctuation, with long words split every 4 characters."""
+    return sum(max(1, math.ceil(len(piece) / 4)) for piece in WORD_PATTERN.findall(text))
+
+
+def message_text(message: dict) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        # Content parts: keep the text ones
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def compose_response(settings: Settings, messages: list[dict], max_tokens: int, stop) -> tuple[str, str]:
+    """Returns (text, finish_reason) for the request, deterministic in its messages."""
+    user_messages = [message_text(m) for m in messages if m.get("role") == "user"]
+    prompt = user_messages[-1] if user_messages else message_text(messages[-1]) if messages else ""
+
+    for pattern, response in settings.script:
+        if pattern.search(prompt):
+            text = response
+            break
+    else:
+        # Heuristic answer: the first sentence of the last non-empty paragraph, where prompts put their input
+        paragraphs = [p.strip() for p in re.split(r"\n\s*\n", prompt) if p.strip()]
+        last = paragraphs[-1] if paragraphs else ""
+        last = re.sub(r"<[^>]+>", " ", last)
+        sentence = re.split(r"(?<=[.!?])\s", last.strip(), maxsplit=1)[0]
+        text = " ".join(sentence.split()) or "OK"
+
+    for token in [stop] if isinstance(stop, str) else stop or []:
+        if token and token in text:
+            return text[:text.index(token)], "stop"
+
+    words = text.split(" ")
+    kept, used = [], 0
+    for word in words:
+        used += count_tokens(word)
+        if used > max_tokens:
+            return " ".join(kept), "length"
+        kept.append(word)
+    return text, "stop"
+
+
+class PromptCache:
+    """
+    Prefix cache like the provider's: the longest prefix of 1024+ tokens, in 128-token steps, that the same model
+    saw within the last ttl seconds is reported as cached.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.seen: dict[str, float] = {}
+
+    def lookup(self, model: str, messages: list[dict]) -> int:
+        """Cached tokens of the prompt; its prefixes are cached for the next requests."""
+        if not self.ttl:
+            return 0
+        now = time.monotonic()
+        digest = hashlib.sha256(model.encode())
+        prefixes, used, boundary = [], 0, CACHE_STEP_TOKENS
+        for message in messages:
+            for piece in [f"<{message.get('role')}>"] + WORD_PATTERN.findall(message_text(message)):
+                digest.update(piece.encode() + b"\0")
+                used += count_tokens(piece)
+                if used >= boundary:
+                    boundary = used - used % CACHE_STEP_TOKENS + CACHE_STEP_TOKENS
+                    if used >= CACHE_MIN_TOKENS:
+                        prefixes.append((used - used % CACHE_STEP_TOKENS, digest.copy().hexdigest()))
+        cached = 0
+        for tokens, key in prefixes:
+            if now - self.seen.get(key, -math.inf) >= self.ttl:
+                break
+            cached = tokens
+        for _, key in prefixes:
+            self.seen[key] = now
+        if len(self.seen) > 100_000:
+            self.seen = {key: at for key, at in self.seen.items() if now - at < self.ttl}
+        return cached
+
+
+class UsageRecorder:
+    """Aggregates usage per (minute, model, batch), like the OpenAI usage export."""
+
+    def __init__(self):
+        self.buckets = defaultdict(lambda: [0, 0, 0, 0])
+
+    def add(self, model: str, input_tokens: int, output_tokens: int, batch: bool = False, cached_tokens: int = 0):
+        minute = int(time.time()) // 60 * 60
+        bucket = self.buckets[(minute, model, batch)]
+        bucket[0] += input_tokens
+        bucket[1] += output_tokens
+        bucket[2] += 1
+        bucket[3] += cached_tokens
+
+    def write(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f, delimiter=";")
+            writer.writerow(USAGE_COLUMNS)
+            for (minute, model, batch), (input_tokens, output_tokens, requests, cached) in sorted(self.buckets.items()):
+                writer.writerow([
+                    minute, minute + 60, float(input_tokens), float(output_tokens), float(requests),
+                    "local", "local", "local", model, batch or "", "default", float(cached),
+                    float(input_tokens - cached), 0.0, 0.0,
+                ])
+
+
+class RateLimiter:
+    """Sliding one-minute window of requests per model."""
+
+    def __init__(self, rpm: int):
+        self.rpm = rpm
+        self.requests = defaultdict(deque)
+
+    def retry_after(self, model: str) -> float:
+        """0 when the request is admitted, otherwise the seconds until a slot frees up."""
+        if not self.rpm:
+            return 0
+        now = time.monotonic()
+        window = self.requests[model]
+        while window and now - window[0] >= 60:
+            window.popleft()
+        if len(window) >= self.rpm:
+            return 60 - (now - window[0])
+        window.append(now)
+        return 0
+
+
+def create_app(settings: Settings) -> FastAPI:
+    usage = UsageRecorder()
+    prompt_cache = PromptCache(settings.prompt_cache_ttl)
+    limiter = RateLimiter(settings.rpm)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        yield
+        if settings.usage_csv:
+            usage.write(settings.usage_csv)
+            print(f"Usage written to {settings.usage_csv}")
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.usage = usage
+
+    def rate_limited(retry_after: float) -> JSONResponse:
+        return JSONResponse(
+            status_code=429,
+            headers={"retry-after": str(max(1, math.ceil(retry_after)))},
+            content={"error": {"message": "Rate limit reached (local stand-in).", "type": "requests",
+                               "param": None, "code": "rate_limit_exceeded"}},
+        )
+
+    def complete(body: dict, model: str, batch: bool = False) -> dict:
+        """Chat completion body for the request, with its usage recorded."""
+        snapshot = MODEL_SNAPSHOTS.get(model, model)
+        messages = body.get("messages", [])
+        max_tokens = body.get("max_completion_tokens") or body.get("max_tokens") or DEFAULT_MAX_TOKENS
+        text, finish_reason = compose_response(settings, messages, max_tokens, body.get("stop"))
+        prompt_tokens = sum(count_tokens(message_text(m)) + 4 for m in messages) + 3
+        completion_tokens = count_tokens(text)
+        cached_tokens = min(prompt_cache.lookup(snapshot, messages), prompt_tokens)
+        usage.add(snapshot, prompt_tokens, completion_tokens, batch, cached_tokens)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}", "object": "chat.completion", "created": int(time.time()),
+            "model": snapshot,
+            "choices": [{"index": 0, "finish_reason": finish_reason, "logprobs": None,
+                         "message": {"role": "assistant", "content": text, "refusal": None}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens,
+                      "prompt_tokens_details": {"cached_tokens": cached_tokens}},
+            "system_fingerprint": "local",
+        }
+
+    async def chat_completions(body: dict, model: str):
+        retry_after = limiter.retry_after(model)
+        if not retry_after and settings.error_rate and settings.random.random() < settings.error_rate:
+            retry_after = 1
+        if retry_after:
+            return rate_limited(retry_after)
+
+        completion = complete(body, model)
+        completion_id, created, snapshot = completion["id"], completion["created"], completion["model"]
+        text = completion["choices"][0]["message"]["content"]
+        finish_reason = completion["choices"][0]["finish_reason"]
+        usage_body = completion["usage"]
+        completion_tokens = usage_body["completion_tokens"]
+
+        if not body.get("stream"):
+            await asyncio.sleep((settings.latency_ms + settings.per_token_ms * completion_tokens) / 1000)
+            return JSONResponse(completion)
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        def chunk(delta: dict, finish=None, usage_data=None, choices=True) -> str:
+            data = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": snapshot,
+                    "system_fingerprint": "local",
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish, "logprobs": None}] if choices else []}
+            if usage_data is not None:
+                data["usage"] = usage_data
+            return f"data: {json.dumps(data)}\n\n"
+
+        async def events():
+            await asyncio.sleep(settings.latency_ms / 1000)
+            yield chunk({"role": "assistant", "content": ""})
+            for index, word in enumerate(text.split(" ")):
+                await asyncio.sleep(settings.per_token_ms * count_tokens(word) / 1000)
+                yield chunk({"content": word if index == 0 else " " + word})
+            yield chunk({}, finish=finish_reason)
+            if include_usage:
+                yield chunk({}, usage_data=usage_body, choices=False)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/chat/completions")
+    @app.post("/chat/completions")
+    async def openai_route(request: Request):
+        body = await request.json()
+        return await chat_completions(body, body.get("model", "gpt-4o-mini"))
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def azure_route(deployment: str, request: Request):
+        # Azure addresses the model through the deployment name
+        body = await request.json()
+        return await chat_completions(body, deployment)
+
+    # ---- Files and Batch API, stored under settings.batch_dir ----
+    files_dir = os.path.join(settings.batch_dir, "files")
+    batches_dir = os.path.join(settings.batch_dir, "batches")
+    os.makedirs(files_dir, exist_ok=True)
+    os.makedirs(batches_dir, exist_ok=True)
+    batch_tasks = set()
+
+    def read_json(path: str) -> dict:
+        if not os.path.exists(path):
+            raise HTTPException(status_code=404, detail=f"No such object: {os.path.basename(path)[:-5]}")
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def write_json(path: str, data: dict) -> None:
+        # Replace atomically, so a poll never reads a half-written batch
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(path + ".tmp", path)
+
+    def store_file(content: bytes, filename: str, purpose: str) -> dict:
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        with open(os.path.join(files_dir, file_id), "wb") as f:
+            f.write(content)
+        meta = {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed"}
+        write_json(os.path.join(files_dir, file_id + ".json"), meta)
+        return meta
+
+    async def process_batch(batch_id: str):
+        batch_path = os.path.join(batches_dir, batch_id + ".json")
+        batch = read_json(batch_path)
+        batch.update(status="in_progress", in_progress_at=int(time.time()))
+        write_json(batch_path, batch)
+        await asyncio.sleep(settings.batch_delay)
+
+        with open(os.path.join(files_dir, batch["input_file_id"]), encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+        outputs, errors = [], []
+        for line in lines:
+            result = {"id": f"batch_req_{uuid.uuid4().hex[:24]}", "custom_id": line.get("custom_id")}
+            if line.get("url", "").rstrip("/").split("/")[-2:] != ["chat", "completions"]:
+                errors.append({**result, "response": None,
+                               "error": {"code": "invalid_url", "message": f"Unsupported url {line.get('url')}"}})
+                continue
+            body = line.get("body", {})
+            completion = complete(body, body.get("model", "gpt-4o-mini"), batch=True)
+            outputs.append({**result, "error": None,
+                            "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": completion}})
+
+        def jsonl(records: list) -> bytes:
+            return "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+
+        batch.update(
+            status="completed", completed_at=int(time.time()),
+            # Like the API, a batch whose requests all failed has no output file
+            output_file_id=store_file(jsonl(outputs), f"{batch_id}_output.jsonl", "batch_output")["id"] if outputs else None,
+            error_file_id=store_file(jsonl(errors), f"{batch_id}_error.jsonl", "batch_output")["id"] if errors else None,
+            request_counts={"total": len(lines), "completed": len(outputs), "failed": len(errors)},
+        )
+        write_json(batch_path, batch)
+
+    @app.post("/v1/files")
+    @app.post("/openai/files")
+    async def create_file(file: UploadFile = File(...), purpose: str = Form(...)):
+        return store_file(await file.read(), file.filename, purpose)
+
+    @app.get("/v1/files/{file_id}")
+    @app.get("/openai/files/{file_id}")
+    async def retrieve_file(file_id: str):
+        return read_json(os.path.join(files_dir, file_id + ".json"))
+
+    @app.get("/v1/files/{file_id}/content")
+    @app.get("/openai/files/{file_id}/content")
+    async def file_content(file_id: str):
+        read_json(os.path.join(files_dir, file_id + ".json"))
+        with open(os.path.join(files_dir, file_id), encoding="utf-8") as f:
+            return PlainTextResponse(f.read())
+
+    @app.post("/v1/batches")
+    @app.post("/openai/batches")
+    async def create_batch(request: Request):
+        body = await request.json()
+        read_json(os.path.join(files_dir, body["input_file_id"] + ".json"))
+        batch_id = f"batch_{uuid.uuid4().hex[:24]}"
+        batch = {
+            "id": batch_id, "object": "batch", "endpoint": body.get("endpoint", "/v1/chat/completions"),
+            "input_file_id": body["input_file_id"], "completion_window": body.get("completion_window", "24h"),
+            "status": "validating", "created_at": int(time.time()), "output_file_id": None, "error_file_id": None,
+            "errors": None, "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "metadata": body.get("metadata"),
+        }
+        write_json(os.path.join(batches_dir, batch_id + ".json"), batch)
+        # Keep a reference, the event loop only holds tasks weakly
+        task = asyncio.create_task(process_batch(batch_id))
+        batch_tasks.add(task)
+        task.add_done_callback(batch_tasks.discard)
+        return batch
+
+    @app.get("/v1/batches/{batch_id}")
+    @app.get("/openai/batches/{batch_id}")
+    async def retrieve_batch(batch_id: str):
+        return read_json(os.path.join(batches_dir, batch_id + ".json"))
+
+    @app.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": model, "object": "model", "owned_by": "local"}
+                                           for model in MODEL_SNAPSHOTS]}
+
+    @app.post("/usage/flush")
+    async def flush_usage():
+        """Writes the usage CSV now instead of at shutdown."""
+        if not settings.usage_csv:
+            return {"written": None}
+        usage.write(settings.usage_csv)
+        return {"written": settings.usage_csv}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay before the first token")
+    parser.add_argument("--per-token-ms", type=float, default=0, help="Delay per generated token")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute per model before 429s (0: no limit)")
+    parser.add_argument("--error-rate", type=float, default=0, help="Fraction of requests answered with a random 429")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random 429s")
+    parser.add_argument("--usage-csv", default=None, help="Write usage here in the token_usage CSV layout")
+    parser.add_argument("--script", default=None, help="JSON file with scripted responses")
+    parser.add_argument("--batch-dir", default="local_openai/batches", help="Where uploaded files and batches are kept")
+    parser.add_argument("--batch-delay", type=float, default=0, help="Seconds before a batch starts processing")
+    parser.add_argument("--prompt-cache-ttl", type=float, default=300,
+                        help="Seconds a prompt prefix stays cached (0: no prompt caching)")
+    args = parser.parse_args()
+
+    script = None
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            script = json.load(f)
+
+    settings = Settings(args.latency_ms, args.per_token_ms, args.rpm, args.error_rate, args.seed,
+                        args.usage_csv, script, args.batch_dir, args.batch_delay, args.prompt_cache_ttl)
+    uvicorn.run(create_app(settings), host=args.host, port=args.port, log_level="warning")
@@ -1,10 +1,12 @@
 from string import Template
 from utils.chat_kernel_provider import OpenAIChatProvider, OllamaChatProvider
+from utils.extraction_store import aextract_once
+from utils.readme_budget import fit_readme
 
 
 class ExtractorAgent:
     def __init__(self):
-        self.llm = OpenAIChatProvider(model="gpt-4o-mini")
+        self.llm = OpenAIChatProvider(model="gpt-4o-mini", agent="extractor")
         # self.llm = OllamaChatProvider(model="llama3.2")
 
     def _build_prompt(self, prompt: str, readme_text: str) -> str:
@@ -13,6 +15,12 @@ class ExtractorAgent:
         return prompt
 
     async def run(self, prompt: str, readme_text: str) -> str:
+        # Oversized READMEs are cut to the token budget first, so the stored extraction matches what was sent
+        readme_text = fit_readme(readme_text)
+        # Extract once per README and prompt, across iterations and phases
+        return await aextract_once(readme_text, prompt, self.llm.model, lambda: self._extract(prompt, readme_text))
+
+    async def _extract(self, prompt: str, readme_text: str) -> str:
         prompt = self._build_prompt(prompt, readme_text)
         extracted_text = await self.llm.run(prompt,  temperature=0)
         return extracted_text
\ No newline at end of file
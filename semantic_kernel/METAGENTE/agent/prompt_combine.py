@@ -7,7 +7,7 @@ from utils.chat_kernel_provider import OpenAIChatProvider, OllamaChatProvider
 
 class PromptCombineAgent:
     def __init__(self):
-        self.llm = OpenAIChatProvider(model="gpt-4o")
+        self.llm = OpenAIChatProvider(model="gpt-4o", agent="combiner")
         # self.llm = OllamaChatProvider(model="llama3.2")
 
     def _build_prompt(self, summarizer_list: str) -> str:
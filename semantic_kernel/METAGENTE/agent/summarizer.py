@@ -1,14 +1,20 @@
 from string import Template
+from utils.prompt_layout import stable_layout
 from utils.chat_kernel_provider import OpenAIChatProvider, OllamaChatProvider
 
 
 class SummarizerAgent:
     def __init__(self):
-        self.llm = OpenAIChatProvider(model="gpt-4o-mini")
+        self.llm = OpenAIChatProvider(model="gpt-4o-mini", agent="summarizer")
         # self.llm = OllamaChatProvider(model="llama3.2")
 
     def _build_prompt(self, prompt: str, extracted_text: str) -> str:
-        prompt = Template(prompt)
+        # Optional word budget of the generation profile, kept with the static instructions
+        hint = self.llm.profile.hint()
+        if hint:
+            prompt = f"{prompt}\n\n{hint}"
+        # The Teacher may write $extracted_text anywhere; the data goes last so the instructions form the prefix
+        prompt = Template(stable_layout(prompt, ["extracted_text"]))
         prompt = prompt.substitute(extracted_text=extracted_text)
         return prompt
 
@@ -3,11 +3,12 @@ from string import Template
 
 from prompt.prompt import TEACHER_PROMPT
 from utils.chat_kernel_provider import OpenAIChatProvider, OllamaChatProvider
+from utils.generation_profiles import TruncatedOutputError
 
 
 class TeacherAgent:
     def __init__(self):
-        self.llm = OpenAIChatProvider(model="gpt-4o")
+        self.llm = OpenAIChatProvider(model="gpt-4o", agent="teacher")
         # self.llm = OllamaChatProvider(model="llama3.2")
 
     def _build_prompt(
@@ -45,7 +46,12 @@ class TeacherAgent:
         prompt = self._build_prompt(
             extracted_text, description, generated_about, rouge_score, summarizer_prompt
         )
-        answer = await self.llm.run(prompt, temperature=0.7)
+        try:
+            answer = await self.llm.run(prompt, temperature=0.7)
+        except TruncatedOutputError as e:
+            # A prompt cut at max_tokens is never optimized against
+            print(f"Teacher: {e}, keeping the previous prompt")
+            return summarizer_prompt
 
         # print(f"Teacher raw answer: {answer}")
 
@@ -1,61 +1,121 @@
 import asyncio
+import os
+import openai
 import pandas as pd
 from agent.extractor import ExtractorAgent
 from agent.summarizer import SummarizerAgent
 from metric.rouge import ROUGE
+from utils.batch_runner import chat_request, run_batch
+from utils.extraction_store import get_extraction_store
+from utils.generation_profiles import get_generation_stats
+from utils.prompt_layout import get_cache_stats
+from utils.readme_budget import fit_readme, get_readme_budget
 from prompt.prompt import (
     EXTRACTOR_PROMPT,
     OPTIMIZED_SUMMARIZER_PROMPT
 )
 
 class Evaluation:
-    def __init__(self):
+    def __init__(self, batch: bool = False):
         self.extractor_agent = ExtractorAgent()
         self.summarizer_agent = SummarizerAgent()
         self.extractor_prompt = EXTRACTOR_PROMPT
         self.summarizer_prompt = OPTIMIZED_SUMMARIZER_PROMPT
+        # Batch mode sends all Extractor requests as one Batch API job, then all Summarizer requests
+        self.batch = batch
         self.dic_results = []
 
+    def _score(self, description: str, about: str) -> None:
+        scores = ROUGE().score_all(candidate=about, reference=description)
+        rougeL_score = scores["rougeL"].fmeasure
+        rouge1_score = scores["rouge1"].fmeasure
+        rouge2_score = scores["rouge2"].fmeasure
+        print(f"Rouge1 Score: {rouge1_score}")
+        print(f"Rouge2 Score: {rouge2_score}")
+        print(f"RougeL Score: {rougeL_score}")
+
+        # Store result
+        result_save = {
+            "Description": description,
+            "Generated About": about,
+            "ROUGE-1": rouge1_score,
+            "ROUGE-2": rouge2_score,
+            "ROUGE-L": rougeL_score,
+        }
+        self.dic_results.append(result_save)
+
+    async def _run_batch(self, dataset: list[dict]):
+        client = openai.OpenAI()
+        extractor_model = self.extractor_agent.llm.model
+
+        #### Extractor Agent: one batch for the READMEs not extracted yet ####
+        store = get_extraction_store()
+        extracted = {}
+        requests = []
+        readmes = [fit_readme(data["readme"]) for data in dataset]
+        for i, readme in enumerate(readmes):
+            stored = store.get(readme, self.extractor_prompt, extractor_model) if store else None
+            if stored is not None:
+                extracted[i] = stored
+                continue
+            prompt = self.extractor_agent._build_prompt(self.extractor_prompt, readme)
+            requests.append(chat_request(str(i), extractor_model, [{"role": "user", "content": prompt}], temperature=0,
+                                         **self.extractor_agent.llm.profile.params()))
+        extractions, errors = await asyncio.to_thread(run_batch, client, requests, "extractor")
+        for custom_id, extracted_text in extractions.items():
+            i = int(custom_id)
+            extracted[i] = extracted_text
+            if store is not None:
+                store.put(readmes[i], self.extractor_prompt, extractor_model, extracted_text)
+
+        #### Summarizer Agent: one batch over the extracted texts ####
+        requests = [
+            chat_request(str(i), self.summarizer_agent.llm.model, [
+                {"role": "user", "content": self.summarizer_agent._build_prompt(self.summarizer_prompt, extracted_text)},
+            ], temperature=0, **self.summarizer_agent.llm.profile.params())
+            for i, extracted_text in sorted(extracted.items())
+        ]
+        abouts, summary_errors = await asyncio.to_thread(run_batch, client, requests, "summarizer")
+        errors.update(summary_errors)
+
+        for i, data in enumerate(dataset):
+            if str(i) not in abouts:
+                # The row is scored like the others instead of missing from the results
+                print(f"Data #{i}: no batch result ({errors.get(str(i))}), running it online")
+                await self._run_row(i, data)
+                continue
+            print(f"Data #{i}:\n- Description: {data['description']}\n")
+            print(f"Generated About: {abouts[str(i)]}\n")
+            self._score(data["description"], abouts[str(i)])
+
     async def run(self, dataset: list[dict]):
+        if self.batch:
+            return await self._run_batch(dataset)
         
         for i, data in enumerate(dataset):
-            try:
-                description = data["description"]
-                readme = data["readme"]
-                print(f"Data #{i}:\n- Description: {description}\n")
+            await self._run_row(i, data)
 
-                #### Extractor Agent ####
-                extracted_text = await self.extractor_agent.run(
-                    prompt=self.extractor_prompt, readme_text=readme
-                )
-                print(f"Extracted text: {extracted_text}\n")
+    async def _run_row(self, i: int, data: dict):
+        try:
+            description = data["description"]
+            readme = data["readme"]
+            print(f"Data #{i}:\n- Description: {description}\n")
 
-                #### Summarizer Agent ####
-                about = await self.summarizer_agent.run(
-                    prompt=self.summarizer_prompt, extracted_text=extracted_text
-                )
-                print(f"Generated About: {about}\n")
-                
-                rougeL_score = ROUGE().get_RougeL(string_1=about, string_2=description)
-                rouge1_score = ROUGE().get_Rouge1(string_1=about, string_2=description)
-                rouge2_score = ROUGE().get_Rouge2(string_1=about, string_2=description)
-                print(f"Rouge1 Score: {rouge1_score}")
-                print(f"Rouge2 Score: {rouge2_score}")
-                print(f"RougeL Score: {rougeL_score}")
-                
-                # Store result
-                result_save = {
-                    "Description": description,
-                    "Generated About": about,
-                    "ROUGE-1": rouge1_score,
-                    "ROUGE-2": rouge2_score,
-                    "ROUGE-L": rougeL_score,
-                }
-                self.dic_results.append(result_save)
+            #### Extractor Agent ####
+            extracted_text = await self.extractor_agent.run(
+                prompt=self.extractor_prompt, readme_text=readme
+            )
+            print(f"Extracted text: {extracted_text}\n")
 
-            except Exception as e:
-                print(f"Error while running data {i}: {e}")
-                continue
+            #### Summarizer Agent ####
+            about = await self.summarizer_agent.run(
+                prompt=self.summarizer_prompt, extracted_text=extracted_text
+            )
+            print(f"Generated About: {about}\n")
+            self._score(description, about)
+
+        except Exception as e:
+            print(f"Error while running data {i}: {e}")
 
 class Main:
     def __init__(self):
@@ -63,8 +123,12 @@ class Main:
 
     def run(self):
         test_data = pd.read_csv("data-experiment/ES.csv").to_dict(orient="records")
-        evaluation = Evaluation()
+        # EVALUATION_MODE=batch runs both stages through the Batch API
+        evaluation = Evaluation(batch=os.getenv("EVALUATION_MODE", "online") == "batch")
         asyncio.run(evaluation.run(test_data))
+        get_cache_stats().report("evaluation")
+        get_generation_stats().report("evaluation")
+        get_readme_budget().report("evaluation")
         df_results = pd.DataFrame(evaluation.dic_results)
         df_results.to_csv("results/evaluation_TS50.csv", index=False)
 
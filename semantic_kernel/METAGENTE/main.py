@@ -1,5 +1,8 @@
 import pandas as pd
 from optimizer.parallel_optimizer import ParallelOptimizer
+from utils.generation_profiles import get_generation_stats
+from utils.prompt_layout import get_cache_stats
+from utils.readme_budget import get_readme_budget
 import asyncio
 
 
@@ -14,6 +17,9 @@ class Main:
 
         optimizer = ParallelOptimizer(self.threshold)
         asyncio.run(optimizer.run(self.num_iterations, train_data))
+        get_cache_stats().report("training")
+        get_generation_stats().report("training")
+        get_readme_budget().report("training")
 
 
 if __name__ == "__main__":
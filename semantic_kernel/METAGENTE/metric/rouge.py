@@ -1,20 +1,219 @@
-from rouge_score import rouge_scorer
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from nltk.stem import porter
+from rouge_score import rouge_scorer, scoring, tokenizers
+from rouge_score import tokenize as rouge_tokenize
+
+REFERENCE_CACHE_SIZE = 256
+STEM_CACHE_SIZE = 65536
+
+
+class StemCachingTokenizer(tokenizers.Tokenizer):
+    """rouge_score's default tokenizer with a memoized Porter stemmer, so each word is stemmed once per process."""
+
+    def __init__(self, maxsize: int = STEM_CACHE_SIZE):
+        self.stem = functools.lru_cache(maxsize=maxsize)(porter.PorterStemmer().stem)
+
+    def tokenize(self, text):
+        # rouge_score only needs an object with a stem() method
+        return rouge_tokenize.tokenize(text, self)
+
+
+class ReferenceCache:
+    """Bounded LRU cache of tokenized references and their n-gram tables, keyed by text hash."""
+
+    def __init__(self, maxsize: int = REFERENCE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text: str, tokenizer):
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        tokens = tokenizer.tokenize(text)
+        entry = (tokens, rouge_scorer._create_ngrams(tokens, 1), rouge_scorer._create_ngrams(tokens, 2))
+
+        with self._lock:
+            self._entries[key] = entry
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared by every ROUGE instance so the ground truth is tokenized once per README
+reference_cache = ReferenceCache()
+
+# Process-wide scorer: building a RougeScorer (and its stemmer) per call is the dominant cost for short texts
+shared_scorer = rouge_scorer.RougeScorer(["rouge1", "rouge2", "rougeL"], tokenizer=StemCachingTokenizer())
+
+
+def _lcs_length(ref: list, can: list) -> int:
+    """Word-level LCS length with the bit-parallel recurrence of Hyyro (2004) on Python big ints."""
+    # Bit i of match[token] is set where ref[i] == token; the longer side is the bit vector
+    if len(ref) < len(can):
+        ref, can = can, ref
+    match = {}
+    for i, token in enumerate(ref):
+        match[token] = match.get(token, 0) | (1 << i)
+
+    full = (1 << len(ref)) - 1
+    v = full
+    for token in can:
+        bits = match.get(token)
+        if bits is None:
+            continue
+        u = v & bits
+        v = ((v + u) | (v - u)) & full
+    # Every zero bit left in v is one matched position of the LCS
+    return len(ref) - v.bit_count()
+
+
+def _score_lcs(target_tokens: list, prediction_tokens: list):
+    """Same scores as rouge_scorer._score_lcs without its O(n*m) Python table."""
+    if not target_tokens or not prediction_tokens:
+        return scoring.Score(precision=0, recall=0, fmeasure=0)
+
+    lcs_length = _lcs_length(target_tokens, prediction_tokens)
+    precision = lcs_length / len(prediction_tokens)
+    recall = lcs_length / len(target_tokens)
+    return scoring.Score(precision=precision, recall=recall, fmeasure=scoring.fmeasure(precision, recall))
+
+
+def _sparse_counts(tables: list, vocabulary: dict, n_rows: int):
+    """Flattens per-row n-gram Counters into (ngram id * n_rows + row) keys and their counts."""
+    keys, counts = [], []
+    for row, table in enumerate(tables):
+        for ngram, count in table.items():
+            keys.append(vocabulary.setdefault(ngram, len(vocabulary)) * n_rows + row)
+            counts.append(count)
+    return np.asarray(keys, dtype=np.int64), np.asarray(counts, dtype=np.int64)
+
+
+def _batch_ngram_scores(reference_tables: list, candidate_tables: list):
+    """ROUGE-N for a whole batch: overlaps are the sorted intersection of the sparse count keys."""
+    n_rows = len(reference_tables)
+    vocabulary = {}
+    reference_keys, reference_counts = _sparse_counts(reference_tables, vocabulary, n_rows)
+    candidate_keys, candidate_counts = _sparse_counts(candidate_tables, vocabulary, n_rows)
+
+    common, reference_index, candidate_index = np.intersect1d(
+        reference_keys, candidate_keys, assume_unique=True, return_indices=True
+    )
+    overlap = np.bincount(
+        common % n_rows,
+        weights=np.minimum(reference_counts[reference_index], candidate_counts[candidate_index]),
+        minlength=n_rows,
+    )
+    reference_total = np.bincount(reference_keys % n_rows, weights=reference_counts, minlength=n_rows)
+    candidate_total = np.bincount(candidate_keys % n_rows, weights=candidate_counts, minlength=n_rows)
+
+    # Same operation order as rouge_score.scoring.fmeasure so results are bit-identical
+    precision = overlap / np.maximum(candidate_total, 1)
+    recall = overlap / np.maximum(reference_total, 1)
+    denominator = precision + recall
+    fmeasure = np.divide(2 * precision * recall, denominator, out=np.zeros(n_rows), where=denominator > 0)
+    return precision, recall, fmeasure
+
 
 class ROUGE:
     def __init__(self):
-        self.scorer = rouge_scorer.RougeScorer(["rouge1", "rouge2", "rougeL"], use_stemmer=True)
+        self.scorer = shared_scorer
 
-    def get_RougeL(self, string_1: str, string_2: str):
-        score = self.scorer.score(string_1, string_2)
+    def score_all(self, candidate: str, reference: str):
+        """Computes ROUGE-1, ROUGE-2 and ROUGE-L (precision, recall, fmeasure) with a single tokenization pass."""
+        tokenizer = self.scorer._tokenizer
+        reference_tokens, reference_unigrams, reference_bigrams = reference_cache.get(reference, tokenizer)
+        candidate_tokens = tokenizer.tokenize(candidate)
 
-        return score["rougeL"].fmeasure
+        return {
+            "rouge1": rouge_scorer._score_ngrams(reference_unigrams, rouge_scorer._create_ngrams(candidate_tokens, 1)),
+            "rouge2": rouge_scorer._score_ngrams(reference_bigrams, rouge_scorer._create_ngrams(candidate_tokens, 2)),
+            "rougeL": _score_lcs(reference_tokens, candidate_tokens),
+        }
 
-    def get_Rouge1(self, string_1: str, string_2: str):
-        score = self.scorer.score(string_1, string_2)
+    def score_batch(self, candidates: list[str], references: list[str]) -> pd.DataFrame:
+        """Scores aligned lists of candidates and references at once, one row per pair."""
+        if len(candidates) != len(references):
+            raise ValueError("candidates and references must have the same length")
+        tokenizer = self.scorer._tokenizer
+        reference_entries = [reference_cache.get(reference, tokenizer) for reference in references]
+        candidate_tokens = [tokenizer.tokenize(candidate) for candidate in candidates]
 
-        return score["rouge1"].fmeasure
+        columns = {}
+        for name, n in (("ROUGE-1", 1), ("ROUGE-2", 2)):
+            precision, recall, fmeasure = _batch_ngram_scores(
+                [entry[n] for entry in reference_entries],
+                [rouge_scorer._create_ngrams(tokens, n) for tokens in candidate_tokens],
+            )
+            columns[name] = fmeasure
+            columns[f"{name} Precision"] = precision
+            columns[f"{name} Recall"] = recall
+
+        lcs_scores = [
+            _score_lcs(entry[0], tokens) for entry, tokens in zip(reference_entries, candidate_tokens)
+        ]
+        columns["ROUGE-L"] = np.array([score.fmeasure for score in lcs_scores], dtype=np.float64)
+        columns["ROUGE-L Precision"] = np.array([score.precision for score in lcs_scores], dtype=np.float64)
+        columns["ROUGE-L Recall"] = np.array([score.recall for score in lcs_scores], dtype=np.float64)
+        return pd.DataFrame(columns)
+
+    def get_RougeL(self, string_1: str, string_2: str):
+        return self.score_all(string_1, string_2)["rougeL"].fmeasure
+
+    def get_Rouge1(self, string_1: str, string_2: str):
+        return self.score_all(string_1, string_2)["rouge1"].fmeasure
 
     def get_Rouge2(self, string_1: str, string_2: str):
-        score = self.scorer.score(string_1, string_2)
+        return self.score_all(string_1, string_2)["rouge2"].fmeasure
+
+
+if __name__ == "__main__":
+    # Equivalence check of the bit-parallel ROUGE-L against rouge_score: python -m metric.rouge
+    import random
+
+    rng = random.Random(0)
+    vocabulary = [f"w{i}" for i in range(30)]
+    for _ in range(2000):
+        target = rng.choices(vocabulary, k=rng.randint(0, 150))
+        prediction = rng.choices(vocabulary, k=rng.randint(0, 150))
+        assert _score_lcs(target, prediction) == rouge_scorer._score_lcs(target, prediction), (target, prediction)
+    print("Bit-parallel ROUGE-L matches rouge_score on 2000 random pairs")
+
+    # Per-call cost of building a RougeScorer for every pair against the shared scorer, then the ReferenceCache alone
+    import time
+
+    candidate = "A framework for building multi-agent conversational applications with large language models"
+    reference = "Enable next-gen large language model applications with multi-agent conversation framework"
+    calls = 2000
+    # Distinct references, so neither side is helped by the ReferenceCache
+    references = [f"{reference} {i}" for i in range(calls)]
+
+    def per_call(score, texts) -> float:
+        start = time.perf_counter()
+        for text in texts:
+            score(candidate, text)
+        return (time.perf_counter() - start) / len(texts) * 1e6
+
+    def new_scorer(c: str, r: str):
+        return rouge_scorer.RougeScorer(["rouge1", "rouge2", "rougeL"], use_stemmer=True).score(r, c)
 
-        return score["rouge2"].fmeasure
\ No newline at end of file
+    before = per_call(new_scorer, references)
+    reference_cache.clear()
+    fresh = per_call(ROUGE().score_all, references)
+    ROUGE().score_all(candidate, reference)
+    cached = per_call(ROUGE().score_all, [reference] * calls)
+    print(f"Per call on fresh references: new RougeScorer {before:.1f} us, shared scorer {fresh:.1f} us")
+    print(f"Per call with the reference cached (a README's iterations): {cached:.1f} us")
@@ -1,3 +1,17 @@
+"""
+Optimizes the Summarizer prompt on every training README, then combines the best prompts into one.
+
+The prompt being optimized and the best score of a README live in its own RowState, and the agents only hold
+their chat providers, so one set of agents serves all READMEs. A pool of workers takes the READMEs from a queue
+and optimizes them concurrently; the best prompts are combined in input order, as in a sequential run.
+Configured with environment variables:
+
+    OPTIMIZER_CONCURRENCY   READMEs optimized at the same time (default: 1, one after the other)
+"""
+import asyncio
+import os
+from dataclasses import dataclass
+
 from metric.rouge import ROUGE
 from prompt.prompt import (
     EXTRACTOR_PROMPT,
@@ -9,100 +23,128 @@ from agent.summarizer import SummarizerAgent
 from agent.teacher import TeacherAgent
 from agent.prompt_combine import PromptCombineAgent
 
+DEFAULT_CONCURRENCY = 1
+
+
+@dataclass
+class RowState:
+    """Optimization state of one README; every README starts again from the initial prompt."""
+    index: int
+    description: str
+    readme: str
+    summarizer_prompt: str = INITIAL_SUMMARIZER_PROMPT
+    best_summarizer_prompt: str = INITIAL_SUMMARIZER_PROMPT
+    best_score: float = 0.0
+    approved: bool = False
+
 
 class ParallelOptimizer:
-    def __init__(self, threshold: float = 0.7):
+    def __init__(self, threshold: float = 0.7, concurrency: int | None = None):
         self.extractor_prompt = EXTRACTOR_PROMPT
-        self.summarizer_prompt = INITIAL_SUMMARIZER_PROMPT
+        # Stateless between calls, shared by the workers
         self.extractor_agent = ExtractorAgent()
         self.summarizer_agent = SummarizerAgent()
         self.teacher_agent = TeacherAgent()
         self.prompt_combine = PromptCombineAgent()
         self.threshold = threshold
+        if concurrency is None:
+            concurrency = int(os.getenv("OPTIMIZER_CONCURRENCY", DEFAULT_CONCURRENCY))
+        self.concurrency = max(1, concurrency)
 
-    async def run(self, max_iterations: int, train_data: list[dict]):
-        
-        # Store different prompt from the interactions
-        data_prompt = [] ## CHECK: The way that is now stores the one that reached the rouge threshold
-        
-        for i, data in enumerate(train_data):   
-            
-            # Load the initial prompt created for the experiment
-            self.summarizer_prompt = INITIAL_SUMMARIZER_PROMPT  ## CHECK: Should I put this outside because it is reinitializing every iteration, so should each iteraction not remember previous loop 
-        
-            # Ground truth value
-            description = data["description"]
-            # Readme value
-            readme = data["readme"]
-            
-            print(f"Data #{i}:\n- Description: {description}")
-            
-            best_score = 0
-            best_summarizer_prompt = self.summarizer_prompt  # Why reload always with the same initial prompt? #Is it just to initialize?
-            
-            # Run Extractor Agent
-            extracted_text = await self.extractor_agent.run(
-                prompt=self.extractor_prompt, readme_text=readme
+    async def _optimize(self, state: RowState, max_iterations: int) -> None:
+        i = state.index
+        print(f"Data #{i}:\n- Description: {state.description}")
+
+        # Run Extractor Agent
+        extracted_text = await self.extractor_agent.run(
+            prompt=self.extractor_prompt, readme_text=state.readme
+        )
+        print(f"Extracted text #{i}: {extracted_text}\n")
+
+        for iter in range(max_iterations):
+            print(f"\nData #{i} Iteration #{iter}:")
+
+            about = await self.summarizer_agent.run(
+                prompt=state.summarizer_prompt, extracted_text=extracted_text
             )
-            print(f"Extracted text: {extracted_text}\n")
-            
-            for iter in range(max_iterations):
-                print(f"\nIteration #{iter}:")
-
-                print(f"Extracted Text: {extracted_text}")
-                
-                about = await self.summarizer_agent.run(
-                    prompt=self.summarizer_prompt, extracted_text=extracted_text
+
+            print(f"\nGenerated About #{i}: {about}")
+
+            scores = ROUGE().score_all(candidate=about, reference=state.description)
+            rougeL_score = scores["rougeL"].fmeasure
+            rouge1_score = scores["rouge1"].fmeasure
+            rouge2_score = scores["rouge2"].fmeasure
+
+            print(f"\nData #{i} Rouge1 Score: {rouge1_score}")
+            print(f"Data #{i} Rouge2 Score: {rouge2_score}")
+            print(f"Data #{i} RougeL Score: {rougeL_score}")
+
+            # Replacing the best score found
+            if rougeL_score >= state.best_score:
+                state.best_score = rougeL_score
+                state.best_summarizer_prompt = state.summarizer_prompt
+
+            # Verify if is below the defined threshold
+            # If it is not achieved send the prompts and metric to the teacher agent
+            if rougeL_score < self.threshold:
+                state.summarizer_prompt = await self.teacher_agent.run(
+                    extracted_text=extracted_text,
+                    description=state.description,
+                    generated_about=about,
+                    rouge_score=rougeL_score,
+                    summarizer_prompt=state.summarizer_prompt,
                 )
-                
-                print(f"\nGenerated About: {about}")
-
-                rougeL_score = ROUGE().get_RougeL(string_1=about, string_2=description)
-                rouge1_score = ROUGE().get_Rouge1(string_1=about, string_2=description)
-                rouge2_score = ROUGE().get_Rouge2(string_1=about, string_2=description)
-
-                print(f"\nRouge1 Score: {rouge1_score}")
-                print(f"Rouge2 Score: {rouge2_score}")
-                print(f"RougeL Score: {rougeL_score}")
-                
-                # Replacing the best score found
-                if rougeL_score >= best_score:
-                    best_score = rougeL_score
-                    best_summarizer_prompt = self.summarizer_prompt #Getting the best prompt so far 
-                    
-                # Verify if is below the defined threshold
-                # If it is not achieved send the prompts and metric to the teacher agent
-                if rougeL_score < self.threshold:
-                    self.summarizer_prompt = await self.teacher_agent.run(
-                        extracted_text=extracted_text,
-                        description=description,
-                        generated_about=about,
-                        rouge_score=rougeL_score,
-                        summarizer_prompt=self.summarizer_prompt,
-                    )
-                    print(f"\nNew Summarizer Prompt: {self.summarizer_prompt}")
-                    
-                # If the threshold is achieved just store the summarizer prompt without
-                # going to the teacher and stop the loop
-                else:
-                    print(f"Added Prompt #{i}: {best_summarizer_prompt}")
-                    data_prompt.append(best_summarizer_prompt)
-                    break
-                
-                print(f"Best RougeL Score for Data #{i}: {best_score}")
-            
-            print(f"Length data_prompt: {len(data_prompt)}")
-            
+                print(f"\nNew Summarizer Prompt #{i}: {state.summarizer_prompt}")
+
+            # If the threshold is achieved just store the summarizer prompt without
+            # going to the teacher and stop the loop
+            else:
+                print(f"Added Prompt #{i}: {state.best_summarizer_prompt}")
+                state.approved = True
+                break
+
+            print(f"Best RougeL Score for Data #{i}: {state.best_score}")
+
+    async def _worker(self, queue: asyncio.Queue, max_iterations: int) -> None:
+        while True:
+            try:
+                state = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await self._optimize(state, max_iterations)
+
+    async def run(self, max_iterations: int, train_data: list[dict]):
+        states = [
+            RowState(index=i, description=data["description"], readme=data["readme"])
+            for i, data in enumerate(train_data)
+        ]
+        queue = asyncio.Queue()
+        for state in states:
+            queue.put_nowait(state)
+        workers = [
+            asyncio.create_task(self._worker(queue, max_iterations))
+            for _ in range(min(self.concurrency, len(states)))
+        ]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            # A failing README stops the run, as it did when they ran one after the other
+            for worker in workers:
+                worker.cancel()
+
+        # Store the prompts that reached the rouge threshold, in input order
+        data_prompt = [state.best_summarizer_prompt for state in states if state.approved]
+        print(f"Length data_prompt: {len(data_prompt)}")
+
         combined_text = await self.prompt_combine.run(prompt_list=data_prompt)
-        print(f"Final Result:\nSummarizer Prompt: {combined_text}")  
-            
-            
+        print(f"Final Result:\nSummarizer Prompt: {combined_text}")
+
+
         # Show history of all best prompts
         with open("results/best_prompts_TS50.txt", "w", encoding="utf-8") as f:
             for line in data_prompt:
                 f.write(line + "\n")
-        
+
         # Optimized prompt
         with open("results/optimized_prompt_TS50.txt", "w", encoding="utf-8") as f:
             f.write(combined_text)
-            
\ No newline at end of file
@@ -0,0 +1,212 @@
+"""Per-model token-bucket rate limiter (RPM and TPM) shared by every agent call in the process."""
+import asyncio
+import itertools
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+# OpenAI usage tier 1 limits for the models used in the experiments
+DEFAULT_LIMITS = {
+    "gpt-4o-mini": (500, 200_000),
+    "gpt-4o": (500, 30_000),
+    "gpt-4.1": (500, 30_000),
+    "gpt-4.1-mini": (500, 200_000),
+}
+# Output reserved when the caller does not cap max_tokens; reconciled once the real usage is known
+DEFAULT_OUTPUT_TOKENS = 512
+# How often callers queued behind another request re-check the head of the queue
+POLL_INTERVAL = 0.01
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap upper-leaning estimate (about 4 characters per token) used to reserve capacity up front."""
+    return math.ceil(len(text) / 4) + 4
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.available = per_minute
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        return max(0.0, (amount - self.available) / self.rate)
+
+
+class Reservation:
+    def __init__(self, limiter: "RateLimiter", model: str | None, tokens: int):
+        self.limiter = limiter
+        self.model = model
+        self.tokens = tokens
+
+    def reconcile(self, prompt_tokens: int | None, completion_tokens: int | None) -> None:
+        """Replaces the estimate with the usage returned by the API; missing or zero usage keeps the estimate."""
+        if not prompt_tokens and not completion_tokens:
+            return
+        actual = (prompt_tokens or 0) + (completion_tokens or 0)
+        self.limiter._adjust(self.model, self.tokens - actual)
+        self.tokens = actual
+
+
+class RateLimiter:
+    def __init__(self, limits: dict[str, tuple[int, int]]):
+        self.limits = limits
+        self._lock = threading.Lock()
+        self._buckets: dict[str, tuple[TokenBucket, TokenBucket]] = {}
+        self._queues: dict[str, deque] = {}
+        self._tickets = itertools.count()
+
+    def resolve(self, model: str) -> str | None:
+        """Configured name for a model, so dated snapshots (gpt-4o-mini-2024-07-18) share its buckets."""
+        if model in self.limits:
+            return model
+        for name in sorted(self.limits, key=len, reverse=True):
+            if model.startswith(name):
+                return name
+        return None
+
+    def _enqueue(self, model: str):
+        with self._lock:
+            limit = self.limits[model]
+            if model not in self._buckets:
+                self._buckets[model] = (TokenBucket(limit[0]), TokenBucket(limit[1]))
+                self._queues[model] = deque()
+            ticket = next(self._tickets)
+            self._queues[model].append(ticket)
+            return ticket
+
+    def _try_take(self, model: str, ticket: int, tokens: int) -> float:
+        """0 once the reservation is taken, otherwise how long to wait before trying again."""
+        with self._lock:
+            queue = self._queues[model]
+            if queue[0] != ticket:
+                # FIFO: only the oldest waiting call may take capacity
+                return POLL_INTERVAL
+            requests, token_bucket = self._buckets[model]
+            now = time.monotonic()
+            requests.refill(now)
+            token_bucket.refill(now)
+            wait = max(requests.wait_time(1), token_bucket.wait_time(tokens))
+            if wait > 0:
+                return wait
+            requests.available -= 1
+            token_bucket.available -= tokens
+            queue.popleft()
+            return 0
+
+    def _cancel(self, model: str, ticket: int) -> None:
+        with self._lock:
+            try:
+                self._queues[model].remove(ticket)
+            except ValueError:
+                pass
+
+    def _adjust(self, model: str | None, refund: int) -> None:
+        with self._lock:
+            buckets = self._buckets.get(model)
+            if buckets is not None:
+                token_bucket = buckets[1]
+                token_bucket.available = min(token_bucket.capacity, token_bucket.available + refund)
+
+    async def acquire(self, model: str, prompt_tokens: int, max_output_tokens: int | None = None) -> Reservation:
+        tokens = prompt_tokens + (max_output_tokens or DEFAULT_OUTPUT_TOKENS)
+        model = self.resolve(model)
+        if model is None:
+            return Reservation(self, model, 0)
+        # A single call larger than the whole bucket would never fit, so it only takes a full bucket; the
+        # reservation records what was taken, so reconcile() never refunds tokens the bucket did not give
+        tokens = min(tokens, self.limits[model][1])
+        ticket = self._enqueue(model)
+        try:
+            while (wait := self._try_take(model, ticket, tokens)) > 0:
+                await asyncio.sleep(wait)
+        except BaseException:
+            self._cancel(model, ticket)
+            raise
+        return Reservation(self, model, tokens)
+
+    def acquire_sync(self, model: str, prompt_tokens: int, max_output_tokens: int | None = None) -> Reservation:
+        tokens = prompt_tokens + (max_output_tokens or DEFAULT_OUTPUT_TOKENS)
+        model = self.resolve(model)
+        if model is None:
+            return Reservation(self, model, 0)
+        # A single call larger than the whole bucket would never fit, so it only takes a full bucket; the
+        # reservation records what was taken, so reconcile() never refunds tokens the bucket did not give
+        tokens = min(tokens, self.limits[model][1])
+        ticket = self._enqueue(model)
+        try:
+            while (wait := self._try_take(model, ticket, tokens)) > 0:
+                time.sleep(wait)
+        except BaseException:
+            self._cancel(model, ticket)
+            raise
+        return Reservation(self, model, tokens)
+
+    @asynccontextmanager
+    async def limit(self, model: str, prompt: str, max_output_tokens: int | None = None):
+        """`async with limiter.limit(...) as reservation:` then `reservation.reconcile(...)` with the usage."""
+        yield await self.acquire(model, estimate_tokens(prompt), max_output_tokens)
+
+    @contextmanager
+    def limit_sync(self, model: str, prompt: str, max_output_tokens: int | None = None):
+        yield self.acquire_sync(model, estimate_tokens(prompt), max_output_tokens)
+
+
+def parse_limits(value: str) -> dict[str, tuple[int, int]]:
+    limits = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        model, _, rates = entry.partition("=")
+        rpm, _, tpm = rates.partition(":")
+        limits[model.strip()] = (int(rpm), int(tpm))
+    return limits
+
+
+_limiter: RateLimiter | None = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter | None:
+    """
+    Returns the process-wide limiter, or None when LLM_RATE_LIMITS=off. LLM_RATE_LIMITS replaces the default
+    limits, e.g. "gpt-4o-mini=500:200000,gpt-4o=500:30000" (model=RPM:TPM).
+    """
+    global _limiter
+    value = os.getenv("LLM_RATE_LIMITS", "")
+    if value.lower() == "off":
+        return None
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(parse_limits(value) if value else dict(DEFAULT_LIMITS))
+        return _limiter
+
+
+
+async def _demo():
+    """Four agents sharing 60 RPM: calls are admitted in arrival order at one per second once the burst is spent."""
+    limiter = RateLimiter({"gpt-4o-mini": (60, 200_000)})
+    # Start with an almost empty request bucket to show the queueing
+    await asyncio.gather(*(limiter.acquire("gpt-4o-mini", 10) for _ in range(58)))
+    start = time.monotonic()
+    admitted = []
+
+    async def agent(name: str, calls: int):
+        for _ in range(calls):
+            reservation = await limiter.acquire("gpt-4o-mini-2024-07-18", estimate_tokens("README " * 100), 50)
+            reservation.reconcile(120, 30)
+            admitted.append((name, round(time.monotonic() - start, 1)))
+
+    await asyncio.gather(*(agent(name, 2) for name in ("Extractor", "Summarizer", "Teacher", "Combiner")))
+    for name, at in admitted:
+        print(f"{at:5.1f}s  {name}")
+
+
+if __name__ == "__main__":
+    asyncio.run(_demo())
@@ -0,0 +1,235 @@
+"""Token budget for the READMEs sent to the Extractor (README_TOKEN_BUDGET, off by default), cutting
+low-value sections first."""
+import argparse
+import os
+import re
+import threading
+
+DEFAULT_BUDGET = 0
+DEFAULT_ENCODING = "o200k_base"
+# A section cut shorter than this is not worth its heading
+MIN_PARTIAL_TOKENS = 32
+
+HEADING = re.compile(r"^\s{0,3}(#{1,6})\s+(.*?)\s*#*\s*$|^\s*<h([1-6])\b[^>]*>(.*?)</h[1-6]>", re.IGNORECASE)
+SETEXT_UNDERLINE = re.compile(r"^\s{0,3}(=+|-+)\s*$")
+FENCE = re.compile(r"^\s{0,3}(```|~~~)")
+BYTES_REPR = re.compile(r"^b(['\"])(.*)\1\s*$", re.DOTALL)
+HTML_COMMENT = re.compile(r"<!--.*?-->", re.DOTALL)
+# Lines made only of badges/images (shields, CI status, links around images)
+BADGE_LINE = re.compile(r"^\s*(?:\[?!\[[^\]]*\]\([^)]*\)(?:\]\([^)]*\))?\s*|<a\b[^>]*>\s*<img\b[^>]*>\s*</a>\s*|<img\b[^>]*>\s*)+$",
+                        re.IGNORECASE)
+INFORMATIVE = re.compile(r"about|overview|introduction|description|features|what|why|summary|highlights|motivation",
+                         re.IGNORECASE)
+LOW_VALUE = re.compile(r"licen[cs]e|contribut|changelog|change log|release notes|citation|cite|acknowledg|credits|"
+                       r"sponsor|support|authors|maintainers|star history|table of contents|^contents$|faq|roadmap",
+                       re.IGNORECASE)
+
+
+class Tokenizer:
+    def __init__(self, encoding_name: str = DEFAULT_ENCODING):
+        import tiktoken
+        try:
+            self.encoding = tiktoken.get_encoding(encoding_name)
+        except Exception as e:
+            raise RuntimeError(
+                f"The tiktoken {encoding_name} encoding could not be loaded ({e}); "
+                f"point TIKTOKEN_CACHE_DIR to a folder holding it"
+            ) from e
+
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """The longest prefix of whole lines within max_tokens (a single long line is cut at a space)."""
+        if max_tokens <= 0:
+            return ""
+        tokens = self.encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        prefix = self.encoding.decode(tokens[:max_tokens])
+        cut = prefix.rfind("\n")
+        if cut <= 0:
+            cut = prefix.rfind(" ")
+        return prefix[:cut] if cut > 0 else prefix
+
+
+def _unescape(readme: str) -> tuple[str, str, str, bool]:
+    """
+    The datasets store each README as the repr of its bytes (b'...' with escaped newlines). Returns the plain text,
+    the prefix and suffix around it and whether its newlines were escaped.
+    """
+    match = BYTES_REPR.match(readme)
+    if match is None or "\n" in readme:
+        return readme, "", "", False
+    quote = match.group(1)
+    return match.group(2).replace("\\n", "\n"), "b" + quote, quote, True
+
+
+def _clean(readme: str) -> str:
+    """Drops HTML comments, badge-only lines and runs of blank lines."""
+    lines = [line for line in HTML_COMMENT.sub("", readme).splitlines() if not BADGE_LINE.match(line)]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip() + "\n"
+
+
+def _sections(readme: str) -> list[tuple[str, str]]:
+    """(heading text, section text) in document order; the part before the first heading has an empty heading."""
+    sections = [["", []]]
+    in_fence = False
+    for line in readme.splitlines(keepends=True):
+        if FENCE.match(line):
+            in_fence = not in_fence
+        elif not in_fence:
+            match = HEADING.match(line)
+            if match:
+                sections.append([match.group(2) or re.sub(r"<[^>]+>", "", match.group(4) or ""), [line]])
+                continue
+            current = sections[-1][1]
+            # Setext heading: the previous line underlined with === or ---
+            if SETEXT_UNDERLINE.match(line) and current and current[-1].strip() and not HEADING.match(current[-1]):
+                heading = current.pop()
+                sections.append([heading.strip(), [heading, line]])
+                continue
+        sections[-1][1].append(line)
+    return [(heading, "".join(lines)) for heading, lines in sections if "".join(lines).strip()]
+
+
+def _priority(index: int, heading: str, first_heading: int) -> int:
+    # The title and introduction first: the text before the first heading and the first section
+    if not heading or index == first_heading:
+        return 0
+    if LOW_VALUE.search(heading):
+        return 3
+    if INFORMATIVE.search(heading):
+        return 1
+    return 2
+
+
+def _close_fence(text: str) -> str:
+    # A section cut inside a code block would leave the rest of the prompt in it
+    fences = sum(1 for line in text.splitlines() if FENCE.match(line))
+    return text.rstrip("\n") + "\n```\n" if fences % 2 else text
+
+
+class ReadmeBudget:
+    def __init__(self, budget: int = DEFAULT_BUDGET, tokenizer: Tokenizer | None = None):
+        self.budget = budget
+        # Only loaded with a budget set: with none, the READMEs pass through uncounted
+        self.tokenizer = tokenizer or (Tokenizer() if budget else None)
+        self._lock = threading.Lock()
+        self.readmes = 0
+        self.truncated = 0
+        self.original_tokens = 0
+        self.saved_tokens = 0
+
+    def fit(self, readme: str) -> tuple[str, int, int]:
+        """(README within the budget, its original tokens, tokens kept); unchanged when it already fits."""
+        if not self.budget:
+            return readme, 0, 0
+        original = self.tokenizer.count(readme)
+        if original <= self.budget:
+            return readme, original, original
+        plain, prefix, suffix, escaped = _unescape(readme)
+
+        def encode(text: str) -> str:
+            return text.replace("\n", "\\n") if escaped else text
+
+        def count(text: str) -> int:
+            return self.tokenizer.count(encode(text))
+
+        cleaned = _clean(plain)
+        if count(cleaned) <= self.budget:
+            text = prefix + encode(cleaned) + suffix
+            return text, original, self.tokenizer.count(text)
+
+        sections = _sections(cleaned)
+        first_heading = next((i for i, (heading, _) in enumerate(sections) if heading), -1)
+        order = sorted(range(len(sections)), key=lambda i: (_priority(i, sections[i][0], first_heading), i))
+        kept: dict[int, str] = {}
+        remaining = self.budget - self.tokenizer.count(prefix + suffix)
+        for i in order:
+            text = sections[i][1]
+            tokens = count(text)
+            if tokens <= remaining:
+                kept[i] = text
+                remaining -= tokens
+            elif remaining >= MIN_PARTIAL_TOKENS:
+                # Room for part of it; cut in the tokenizer's terms, then shorten until the restored text fits
+                limit = remaining - 4
+                part = _close_fence(self.tokenizer.truncate(text, limit))
+                while count(part) > remaining and limit > 0:
+                    limit = limit * 9 // 10
+                    part = _close_fence(self.tokenizer.truncate(text, limit))
+                kept[i] = part
+                remaining -= count(part)
+        text = "".join(kept[i] if kept[i].endswith("\n") else kept[i] + "\n" for i in sorted(kept))
+        text = prefix + encode(text) + suffix
+        return text, original, self.tokenizer.count(text)
+
+    def apply(self, readme: str, label: str | None = None) -> str:
+        """fit() that records the saving and prints it for READMEs over the budget, named by label or title."""
+        text, original, kept = self.fit(readme)
+        with self._lock:
+            self.readmes += 1
+            self.original_tokens += original
+            if kept < original:
+                self.truncated += 1
+                self.saved_tokens += original - kept
+        if kept < original:
+            if label is None:
+                plain = _unescape(readme)[0]
+                title = next((heading for heading, _ in _sections(plain) if heading), plain.strip().split("\n", 1)[0])
+                label = repr(title[:60])
+            print(f"[README budget] {label}: {original} -> {kept} tokens ({original - kept} saved)")
+        return text
+
+    def report(self, label: str) -> None:
+        with self._lock:
+            if not self.budget or not self.readmes:
+                return
+            share = self.saved_tokens / self.original_tokens if self.original_tokens else 0.0
+            print(f"[README budget {label}] {self.truncated}/{self.readmes} READMEs over {self.budget} tokens, "
+                  f"{self.saved_tokens} tokens saved ({share:.1%} of the README tokens)")
+
+
+_budget: ReadmeBudget | None = None
+_tokenizer: Tokenizer | None = None
+_budget_lock = threading.Lock()
+
+
+def get_tokenizer() -> Tokenizer:
+    """The README_ENCODING tokenizer, loaded on first use."""
+    global _tokenizer
+    with _budget_lock:
+        if _tokenizer is None:
+            _tokenizer = Tokenizer(os.getenv("README_ENCODING", DEFAULT_ENCODING))
+        return _tokenizer
+
+
+def get_readme_budget() -> ReadmeBudget:
+    global _budget
+    budget = int(os.getenv("README_TOKEN_BUDGET", DEFAULT_BUDGET))
+    tokenizer = get_tokenizer() if budget else None
+    with _budget_lock:
+        if _budget is None:
+            _budget = ReadmeBudget(budget, tokenizer)
+        return _budget
+
+
+def fit_readme(readme: str) -> str:
+    """The README to embed in the Extractor prompt, within README_TOKEN_BUDGET."""
+    return get_readme_budget().apply(readme)
+
+
+if __name__ == "__main__":
+    # Tokens saved on a dataset, e.g. python -m utils.readme_budget data-experiment/TS50.csv --budget 1000
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Tokens saved per README of a dataset under a token budget")
+    parser.add_argument("csv", nargs="+", help="datasets with a readme column")
+    parser.add_argument("--budget", type=int, required=True)
+    args = parser.parse_args()
+    budget = ReadmeBudget(args.budget)
+    for path in args.csv:
+        for i, readme in enumerate(pd.read_csv(path)["readme"].astype(str)):
+            budget.apply(readme, f"{path} row {i}")
+    budget.report("total")
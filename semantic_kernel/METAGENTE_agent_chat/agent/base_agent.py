@@ -1,23 +1,30 @@
 from semantic_kernel import Kernel
-from semantic_kernel.connectors.ai.open_ai import OpenAIChatCompletion
-from semantic_kernel.connectors.ai.ollama import OllamaChatCompletion, OllamaChatPromptExecutionSettings
+from semantic_kernel.connectors.ai.ollama import OllamaChatPromptExecutionSettings
+from utils.generation_profiles import get_profile
+from utils.kernel_pool import get_kernel_pool
 
 
 class BaseAgentCreator:
     """Base class for creating agents with common kernel and prompt template setup."""
 
     def __init__(self, name):
-        """Initializes the agent creator with a kernel and service."""
+        """Initializes the agent creator with its own kernel; the service comes from the process-wide pool."""
         self.name = name
         self.kernel = Kernel()
+        # Output limits of the agent, looked up by its name (see utils/generation_profiles.py)
+        self.profile = get_profile(name.lower())
+
+    def _generation_settings(self) -> dict:
+        """The generation profile as OpenAIChatPromptExecutionSettings arguments."""
+        return {
+            "max_tokens": self.profile.max_tokens,
+            "stop": list(self.profile.stop) or None,
+            "number_of_responses": self.profile.n,
+        }
 
     def _add_chat_completion_kernel(self, service_id: str, model_id: str = "gpt-4o-mini",type:str = "OpenAI") -> Kernel:
-        """Creates a kernel with a chat completion service."""
-        
-        if type=='OpenAI':
-            self.kernel.add_service(OpenAIChatCompletion(service_id=service_id))
-        else:
-            self.kernel.add_service(OllamaChatCompletion(service_id=service_id, ai_model_id="llama3.2"))
+        """Adds the pooled chat completion service to the kernel, created once per process."""
+        self.kernel.add_service(get_kernel_pool().service(service_id, type))
     
     def add_plugin_kernel(self, name, plugin):
         """Adds plugin to kernel"""
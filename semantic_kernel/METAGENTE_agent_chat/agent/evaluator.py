@@ -14,6 +14,7 @@ class EvaluatorAgent(BaseAgentCreator):
             service_id=name,
             ai_model_id="gpt-4o-mini",
             temperature=0,
+            **self._generation_settings(),
         )
 
     def create_agent(self, file_path: str, ground_truth: str) -> ChatCompletionAgent:
@@ -3,6 +3,9 @@ from semantic_kernel.connectors.ai.open_ai import OpenAIChatCompletion, OpenAICh
 from semantic_kernel.functions import KernelArguments
 from .base_agent import BaseAgentCreator 
 from utils.prompt_builder import PromptBuilder
+from utils.extraction_store import aextract_once
+from utils.generation_profiles import get_generation_stats
+from utils.readme_budget import fit_readme
 from semantic_kernel.connectors.ai.ollama import OllamaChatPromptExecutionSettings
 
 class ExtractorAgent(BaseAgentCreator):
@@ -15,6 +18,7 @@ class ExtractorAgent(BaseAgentCreator):
             service_id=name,
             ai_model_id="gpt-4o-mini",
             temperature=0,
+            **self._generation_settings(),
         )
         
         # self.settings = OllamaChatPromptExecutionSettings(
@@ -40,4 +44,20 @@ class ExtractorAgent(BaseAgentCreator):
             arguments=KernelArguments(settings=self.settings, readme_text = readme_text),
         )
         return agent
+
+    async def extract(self, file_path: str, readme_text: str) -> str:
+        """Runs the extraction once per README and template; later calls reuse the stored text."""
+        prompt_template = PromptBuilder.prompt_template(file_path)
+        # Oversized READMEs are cut to the token budget first, so the stored extraction matches what was sent
+        readme_text = fit_readme(readme_text)
+
+        async def run_extractor() -> str:
+            agent = self.create_agent(file_path, readme_text)
+            response = await agent.get_response(messages=None)
+            usage = response.content.metadata.get("usage")
+            get_generation_stats().record("extractor", response.content.finish_reason,
+                                          getattr(usage, "completion_tokens", None))
+            return str(response.content)
+
+        return await aextract_once(readme_text, prompt_template.template, self.settings.ai_model_id, run_extractor)
     
@@ -14,6 +14,7 @@ class PromptCombineAgent(BaseAgentCreator):
             service_id=name,
             ai_model_id="gpt-4o",
             temperature=0.2,
+            **self._generation_settings(),
         )
 
     def create_agent(self, file_path: str, summarizer_list: str) -> ChatCompletionAgent:
@@ -16,6 +16,7 @@ class TeacherAgent(BaseAgentCreator):
             service_id=name,
             ai_model_id="gpt-4o",
             temperature=.7,
+            **self._generation_settings(),
         )
         # self.settings = OllamaChatPromptExecutionSettings(
         #     service_id = name,
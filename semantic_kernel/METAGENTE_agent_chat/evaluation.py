@@ -3,6 +3,9 @@ import pandas as pd
 from agent.extractor import ExtractorAgent
 from agent.summarizer import SummarizerAgent
 from metric.rouge import ROUGE
+from utils.generation_profiles import get_generation_stats
+from utils.prompt_layout import get_cache_stats
+from utils.readme_budget import get_readme_budget
 
 class Evaluation:
     def __init__(self):
@@ -22,11 +25,9 @@ class Evaluation:
 
                 #### Extractor Agent ####
                 extractor_agent_handler =  ExtractorAgent(self.EXTRACTOR_NAME)
-                extractor_agent = extractor_agent_handler.create_agent(self.EXTRACTOR_TEMPLATE_FILE, readme)    
             
-                # Get response Extractor
-                extracted_text = await extractor_agent.get_response(messages=None)
-                extracted_text = extracted_text.content
+                # Get response Extractor (reused when the training phase already extracted this README)
+                extracted_text = await extractor_agent_handler.extract(self.EXTRACTOR_TEMPLATE_FILE, readme)
                 print(f"Extracted text: {extracted_text}\n")
 
                 #### Summarizer Agent ####
@@ -36,11 +37,16 @@ class Evaluation:
                 # Get response Summarizer
                 summarized_text = await summarizer_agent.get_response(messages=None)
                 about = summarized_text.content.content
+                usage = summarized_text.content.metadata.get("usage")
+                get_cache_stats().record_usage(summarized_text.content.ai_model_id, usage)
+                get_generation_stats().record("summarizer", summarized_text.content.finish_reason,
+                                              getattr(usage, "completion_tokens", None))
                 print(f"Generated About: {about}\n")
                 
-                rougeL_score = ROUGE().get_RougeL(string_1=about, string_2=description)
-                rouge1_score = ROUGE().get_Rouge1(string_1=about, string_2=description)
-                rouge2_score = ROUGE().get_Rouge2(string_1=about, string_2=description)
+                scores = ROUGE().score_all(candidate=about, reference=description)
+                rougeL_score = scores["rougeL"].fmeasure
+                rouge1_score = scores["rouge1"].fmeasure
+                rouge2_score = scores["rouge2"].fmeasure
                 print(f"Rouge1 Score: {rouge1_score}")
                 print(f"Rouge2 Score: {rouge2_score}")
                 print(f"RougeL Score: {rougeL_score}")
@@ -67,6 +73,9 @@ class Main:
         test_data = pd.read_csv("data-experiment/ES.csv").to_dict(orient="records")
         evaluation = Evaluation()
         asyncio.run(evaluation.run(test_data))
+        get_cache_stats().report("evaluation")
+        get_generation_stats().report("evaluation")
+        get_readme_budget().report("evaluation")
         df_results = pd.DataFrame(evaluation.dic_results)
         df_results.to_csv("results/evaluation_TS50.csv", index=False)
 
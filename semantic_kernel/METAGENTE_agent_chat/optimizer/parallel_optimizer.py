@@ -1,3 +1,13 @@
+"""
+Optimizes the Summarizer prompt on every training README with a Summarizer - Evaluator - Teacher group chat,
+then combines the approved prompts into one.
+
+Each README gets its own agents, kernels and PromptPlugin/RougePlugin, while the chat completion services behind
+the kernels are created once per process (see utils/kernel_pool.py). The group chats of up to
+OPTIMIZER_CONCURRENCY READMEs (default: 4; 1: one after the other) run at the same time, and the approved prompts
+are combined in row order, as in a sequential run.
+"""
+import asyncio
 import os
 from agent.extractor import ExtractorAgent
 from agent.summarizer import SummarizerAgent
@@ -8,14 +18,30 @@ from utils.rouge_plugin import RougePlugin
 from utils.prompt_plugin import PromptPlugin
 from utils.prompt_builder import PromptBuilder
 from utils.agent_functions import AgentFunctions
+from utils.generation_profiles import check_retry, get_generation_stats, get_profile, is_truncated
+from utils.kernel_pool import get_kernel_pool
+from utils.prompt_layout import get_cache_stats
 from metric.rouge import ROUGE
-from semantic_kernel import Kernel
 from semantic_kernel.agents import AgentGroupChat
-from semantic_kernel.connectors.ai.open_ai import OpenAIChatCompletion
+
+DEFAULT_CONCURRENCY = 4
+
+
+def _record_usage(agent: str, message) -> None:
+    """Records the usage and the finish reason of an agent message."""
+    usage = message.metadata.get("usage")
+    get_cache_stats().record_usage(message.ai_model_id, usage)
+    get_generation_stats().record(agent, message.finish_reason, getattr(usage, "completion_tokens", None))
 
 
 class ParallelOptimizer:
-    def __init__(self, threshold: float = 0.7):
+    EXTRACTOR_NAME = "Extractor"
+    SUMMARIZER_NAME = "Summarizer"
+    TEACHER_NAME = "Teacher"
+    EVALUATOR_NAME = "Evaluator"
+    COMBINE_NAME = "Combiner"
+
+    def __init__(self, threshold: float = 0.7, concurrency: int | None = None):
         
         self.EXTRACTOR_TEMPLATE_FILE = "template/extractor.yaml"
         self.SUMMARIZER_TEMPLATE_FILE = "template/summarizer.yaml"
@@ -23,104 +49,115 @@ class ParallelOptimizer:
         self.TEACHER_TEMPLATE_FILE = "template/teacher.yaml"
         self.COMBINE_TEMPLATE_FILE = "template/prompt_combine.yaml"
         self.threshold = threshold
-        
-    def _create_kernel_with_chat_completion(self, service_id: str) -> Kernel:
-        kernel = Kernel()
-        kernel.add_service(OpenAIChatCompletion(service_id=service_id, api_key = os.getenv("OPENAI_API_KEY")))
-        return kernel
+        self.concurrency = max(1, concurrency or int(os.getenv("OPTIMIZER_CONCURRENCY", DEFAULT_CONCURRENCY)))
 
-    async def run(self, max_iterations: int, train_data: list[dict]):
+    async def _optimize(self, i: int, data: dict, max_iterations: int) -> str | None:
+        """Runs the group chat of one README with its own agents and plugins; the approved prompt, if any."""
+        # Ground truth value
+        description = data["description"]
+        # Readme value
+        readme = data["readme"]
         
-        # Store different prompt from the interactions
-        data_prompt = [] 
-        EXTRACTOR_NAME = "Extractor"
-        SUMMARIZER_NAME = "Summarizer"
-        TEACHER_NAME = "Teacher"
-        EVALUATOR_NAME = "Evaluator"
-        COMBINE_NAME = "Combiner"
+        print(f"Data #{i}:\n- Description: {description}")
         
-        for i, data in enumerate(train_data):   
-            
-            # Ground truth value
-            description = data["description"]
-            # Readme value
-            readme = data["readme"]
-            
-            print(f"Data #{i}:\n- Description: {description}")
-            
-            # Create Extractor Agent
-            extractor_agent_handler =  ExtractorAgent(EXTRACTOR_NAME)
-            extractor_agent = extractor_agent_handler.create_agent(self.EXTRACTOR_TEMPLATE_FILE, readme)
+        # Create Extractor Agent
+        extractor_agent_handler =  ExtractorAgent(self.EXTRACTOR_NAME)
 
-            # Start Conversation Chat Extractor
-            extracted_text = await extractor_agent.get_response(messages=None)
-            extracted_text = extracted_text.content
-            print(f"Extracted text: {extracted_text}")
-            
-            # Initialize plugins
-            rouge_plugin = RougePlugin()
-            prompt_plugin = PromptPlugin()
-            
-            # Create Agent Summarizer
-            summarizer_agent_handler =  SummarizerAgent(SUMMARIZER_NAME)
-            summarizer_agent_handler.add_plugin_kernel("prompt_plugin", prompt_plugin)
-            summarizer_agent = summarizer_agent_handler.create_agent(self.SUMMARIZER_TEMPLATE_FILE, extracted_text)
-            
-            # Create Agent Evaluator 
-            evaluator_agent_handler =  EvaluatorAgent(EVALUATOR_NAME)
-            evaluator_agent_handler.add_plugin_kernel("prompt_plugin", prompt_plugin)
-            evaluator_agent_handler.add_plugin_kernel("rouge_plugin", rouge_plugin)
-            evaluator_agent = evaluator_agent_handler.create_agent(self.EVALUATOR_TEMPLATE_FILE, description)
+        # Start Conversation Chat Extractor (once per README, shared with the evaluation phase)
+        extracted_text = await extractor_agent_handler.extract(self.EXTRACTOR_TEMPLATE_FILE, readme)
+        print(f"Extracted text #{i}: {extracted_text}")
+        
+        # Initialize plugins
+        rouge_plugin = RougePlugin()
+        prompt_plugin = PromptPlugin()
+        
+        # Create Agent Summarizer
+        summarizer_agent_handler =  SummarizerAgent(self.SUMMARIZER_NAME)
+        summarizer_agent_handler.add_plugin_kernel("prompt_plugin", prompt_plugin)
+        summarizer_agent = summarizer_agent_handler.create_agent(self.SUMMARIZER_TEMPLATE_FILE, extracted_text)
+        
+        # Create Agent Evaluator 
+        evaluator_agent_handler =  EvaluatorAgent(self.EVALUATOR_NAME)
+        evaluator_agent_handler.add_plugin_kernel("prompt_plugin", prompt_plugin)
+        evaluator_agent_handler.add_plugin_kernel("rouge_plugin", rouge_plugin)
+        evaluator_agent = evaluator_agent_handler.create_agent(self.EVALUATOR_TEMPLATE_FILE, description)
 
-            # Create Agent Teacher
-            teacher_agent_handler =  TeacherAgent(TEACHER_NAME)
-            teacher_agent_handler.add_plugin_kernel("prompt_plugin", prompt_plugin)
-            teacher_agent_handler.add_plugin_kernel("rouge_plugin", rouge_plugin)
-            teacher_agent = teacher_agent_handler.create_agent(self.TEACHER_TEMPLATE_FILE, ground_truth=description, extracted_text=extracted_text)
+        # Create Agent Teacher
+        teacher_agent_handler =  TeacherAgent(self.TEACHER_NAME)
+        teacher_agent_handler.add_plugin_kernel("prompt_plugin", prompt_plugin)
+        teacher_agent_handler.add_plugin_kernel("rouge_plugin", rouge_plugin)
+        teacher_agent = teacher_agent_handler.create_agent(self.TEACHER_TEMPLATE_FILE, ground_truth=description, extracted_text=extracted_text)
 
-            # Initializing GroupChat
-            kernel = self._create_kernel_with_chat_completion("kernel_loop") #Creating this kernel outside --> I dont know why it was not working inside AgentFunctions
-            agent_functions =  AgentFunctions(kernel)    
-            group_chat = AgentGroupChat(
-                agents=[summarizer_agent,evaluator_agent,  teacher_agent],
-                selection_strategy=agent_functions.get_selection_function(summarizer_agent, teacher_agent, evaluator_agent),
-                termination_strategy=agent_functions.get_termination_function(evaluator_agent, description, max_iterations=45),
-            )
-            
-            initial_summarizer_prompt = """
+        # Initializing GroupChat
+        kernel = get_kernel_pool().kernel("kernel_loop") #Creating this kernel outside --> I dont know why it was not working inside AgentFunctions
+        agent_functions =  AgentFunctions(kernel)    
+        group_chat = AgentGroupChat(
+            agents=[summarizer_agent,evaluator_agent,  teacher_agent],
+            selection_strategy=agent_functions.get_selection_function(summarizer_agent, teacher_agent, evaluator_agent),
+            termination_strategy=agent_functions.get_termination_function(evaluator_agent, description, max_iterations=45),
+        )
+        
+        initial_summarizer_prompt = """
             Summarize the following extracted text from a Github repository README into a short term/phrase introducing the repository:
             
             The output should include only a short term/phrase introducing the repository.
             """
-            # Initialize prompt in the plugin
-            await prompt_plugin.set_last_instruction(initial_summarizer_prompt)
-            
-            # Start Conversation
-            await group_chat.add_chat_message(message=initial_summarizer_prompt)
-            print("\n\nGroupChat: Summarizer - Evaluator - Teacher\n")
-            async for content in group_chat.invoke():
-                print(f"# {content.name}: {content.content}\n")
-            
-            # Get best prompts
-            last_summary = await prompt_plugin.get_last_summary()
-            rouge_l = ROUGE().get_RougeL(
-                    string_1=last_summary,
-                    string_2=description
-                )
-            last_instruction = await prompt_plugin.get_last_instruction()
-            if(rouge_l >= .7):
-                print(f"Added Prompt #{i}: {last_instruction}")
-                data_prompt.append(last_instruction)
+        # Initialize prompt in the plugin
+        await prompt_plugin.set_last_instruction(initial_summarizer_prompt)
+        
+        # Start Conversation
+        await group_chat.add_chat_message(message=initial_summarizer_prompt)
+        print(f"\n\nGroupChat #{i}: Summarizer - Evaluator - Teacher\n")
+        async for content in group_chat.invoke():
+            print(f"# {content.name} #{i}: {content.content}\n")
+            _record_usage(content.name.lower(), content)
+            if content.name == self.TEACHER_NAME and is_truncated(content.finish_reason):
+                # The Summarizer would apply an instruction cut at max_tokens: the chat ends on the previous one,
+                # which is the last instruction stored with its summary
+                print(f"GroupChat #{i}: Teacher output cut at max_tokens, keeping the previous instruction")
+                break
+        
+        # Get best prompts
+        last_summary = await prompt_plugin.get_last_summary()
+        rouge_l = ROUGE().get_RougeL(
+                string_1=last_summary,
+                string_2=description
+            )
+        last_instruction = await prompt_plugin.get_last_instruction()
+        if(rouge_l >= .7):
+            print(f"Added Prompt #{i}: {last_instruction}")
+            return last_instruction
+        return None
+
+    async def run(self, max_iterations: int, train_data: list[dict]):
+        # The group chats of the READMEs run concurrently, up to `concurrency` at a time
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def optimize(i: int, data: dict) -> str | None:
+            async with semaphore:
+                return await self._optimize(i, data, max_iterations)
+
+        results = await asyncio.gather(*(optimize(i, data) for i, data in enumerate(train_data)))
+        # Store different prompt from the interactions, in row order
+        data_prompt = [prompt for prompt in results if prompt is not None]
+        print(f"Length data_prompt: {len(data_prompt)}")
 
-            print(f"Length data_prompt: {len(data_prompt)}")
-            
         # Call Prompt Combiner
         summarizer_list = PromptBuilder._clean_prompt_list(data_prompt)
-        combine_agent_handler =  PromptCombineAgent(COMBINE_NAME)
+        combine_agent_handler =  PromptCombineAgent(self.COMBINE_NAME)
         combine_agent = combine_agent_handler.create_agent(self.COMBINE_TEMPLATE_FILE, summarizer_list)
         
         # Generate the agent response
         combined_text = await combine_agent.get_response(messages=None)
+        _record_usage("combiner", combined_text.content)
+        # A combined prompt cut at max_tokens is requested once more with a larger cap, and never used cut
+        profile = get_profile("combiner")
+        if profile.retries(combined_text.content.finish_reason):
+            print(f"[combiner] Output cut at max_tokens, retrying with max_tokens={profile.retry_max_tokens}")
+            combine_agent_handler.settings.max_tokens = profile.retry_max_tokens
+            combined_text = await combine_agent.get_response(messages=None)
+            _record_usage("combiner", combined_text.content)
+            check_retry("combiner", combined_text.content.finish_reason)
         combined_text = combined_text.content.content
         print(f"Extracted text: {combined_text}")
             
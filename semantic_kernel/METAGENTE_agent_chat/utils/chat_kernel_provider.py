@@ -1,42 +1,103 @@
 import os
+from openai import AsyncOpenAI
 from semantic_kernel.connectors.ai.open_ai import OpenAIChatCompletion, OpenAIChatPromptExecutionSettings
 from semantic_kernel.connectors.ai.ollama import OllamaChatCompletion, OllamaChatPromptExecutionSettings
 
 from semantic_kernel.contents import ChatHistory
 
+from utils.generation_profiles import GenerationProfile, check_retry, get_generation_stats, get_profile
+from utils.llm_cache import get_llm_cache, is_deterministic
+from utils.prompt_layout import get_cache_stats
+from utils.rate_limiter import get_rate_limiter
+from utils.resilient_call import acall, admitted
+
 class OpenAIChatProvider():
-    def __init__(self, model):
+    def __init__(self, model, agent: str | None = None):
         self.api_key = os.getenv("OPENAI_API_KEY")
         self.model = model
         self.service_id = None
+        # Output limits sent with every request of the agent (see utils/generation_profiles.py)
+        self.agent = agent
+        self.profile = get_profile(agent) if agent is not None else GenerationProfile()
 
         # Create chat service
         self.chat_completion_service = OpenAIChatCompletion(
             service_id=self.service_id,
             ai_model_id=self.model,
             api_key=self.api_key,
+            # Retries are left to resilient_call, so they go through the rate limiter and the deadline
+            async_client=AsyncOpenAI(api_key=self.api_key, max_retries=0),
         )
     
 
     async def run(self, prompt,  temperature: float= 0.7):
+        # Deterministic calls are answered from the on-disk response cache when possible
+        cache = get_llm_cache() if is_deterministic(temperature) else None
+        if cache is not None:
+            params = {"provider": type(self).__name__, "temperature": temperature, **self.profile.params()}
+            cache_key = cache.make_key(self.model, params, prompt)
+            cached = cache.get(cache_key)
+            if cached is not None:
+                return cached
+
         # Create a temporary chat history for this prompt only
         chat_history = ChatHistory()
         chat_history.add_user_message(prompt)
         
-        # Set up prompt execution settings
-        self.execution_settings = OpenAIChatPromptExecutionSettings(
+        # Set up prompt execution settings; local, as concurrent rows share the provider
+        execution_settings = OpenAIChatPromptExecutionSettings(
             service_id=self.service_id,
             ai_model_id=self.model,
             temperature=temperature,
+            max_tokens=self.profile.max_tokens,
+            stop=list(self.profile.stop) or None,
+            number_of_responses=self.profile.n,
         )
 
-        # Generate response
-        response = await self.chat_completion_service.get_chat_message_content(
-            chat_history=chat_history,
-            settings=self.execution_settings,
-        )
+        # Generate response; the shared rate limiter queues the call when the model's RPM/TPM is spent
+        async def generate():
+            limiter = get_rate_limiter()
+            if limiter is None:
+                admitted()
+                response = await self.chat_completion_service.get_chat_message_content(
+                    chat_history=chat_history,
+                    settings=execution_settings,
+                )
+                get_cache_stats().record_usage(self.model, response.metadata.get("usage"))
+                return response
+            async with limiter.limit(self.model, prompt, execution_settings.max_tokens) as reservation:
+                # The attempt's timeout starts here, not while queued (see utils/resilient_call.py)
+                admitted()
+                response = await self.chat_completion_service.get_chat_message_content(
+                    chat_history=chat_history,
+                    settings=execution_settings,
+                )
+                usage = response.metadata.get("usage")
+                if usage is not None:
+                    reservation.reconcile(usage.prompt_tokens, usage.completion_tokens)
+                get_cache_stats().record_usage(self.model, usage)
+                return response
+
+        # Transient failures and empty answers are retried with backoff; the rest raise LLMCallError
+        response = await acall(generate, self.model, validate=lambda r: bool(str(r).strip()), queued=True)
+        self._record_finish(response)
+        # A Teacher or Combiner answer cut at max_tokens is requested once more with a larger cap; a truncated
+        # prompt is never used (check_retry raises TruncatedOutputError)
+        if self.agent is not None and self.profile.retries(response.finish_reason):
+            print(f"[{self.agent}] Output cut at max_tokens, retrying with max_tokens={self.profile.retry_max_tokens}")
+            execution_settings.max_tokens = self.profile.retry_max_tokens
+            response = await acall(generate, self.model, validate=lambda r: bool(str(r).strip()), queued=True)
+            self._record_finish(response)
+            check_retry(self.agent, response.finish_reason)
 
+        if cache is not None:
+            cache.set(cache_key, str(response))
         return str(response)
+
+    def _record_finish(self, response) -> None:
+        if self.agent is not None:
+            usage = response.metadata.get("usage")
+            get_generation_stats().record(self.agent, response.finish_reason, getattr(usage, "completion_tokens", None))
     
     
 class OllamaChatProvider(OpenAIChatProvider):
@@ -0,0 +1,145 @@
+"""Per-agent generation profiles (output caps, stop sequences, length hints) sent with every agent's requests,
+and the finish-reason counts of a run."""
+import os
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+
+# About 0.75 words per token
+WORDS_PER_TOKEN = 0.75
+
+
+@dataclass(frozen=True)
+class GenerationProfile:
+    max_tokens: int | None = None
+    stop: tuple[str, ...] = field(default_factory=tuple)
+    n: int = 1
+    length_hint: bool = False
+    retry_max_tokens: int | None = None
+
+    def params(self) -> dict:
+        """The OpenAI chat completion parameters of the profile; unset ones are left out."""
+        params = {}
+        if self.max_tokens:
+            params["max_tokens"] = self.max_tokens
+        if self.stop:
+            params["stop"] = list(self.stop)
+        if self.n != 1:
+            params["n"] = self.n
+        return params
+
+    def retries(self, finish_reason) -> bool:
+        """Whether an output that ended with finish_reason is requested again with max_tokens=retry_max_tokens."""
+        return bool(self.retry_max_tokens) and is_truncated(finish_reason)
+
+    def hint(self) -> str:
+        """The length instruction for the prompt, empty unless length_hint is on and max_tokens is set."""
+        if not (self.length_hint and self.max_tokens):
+            return ""
+        # Half of the cap, so a compliant answer ends well before it is cut
+        words = int(self.max_tokens * WORDS_PER_TOKEN) // 2
+        return f"Answer with a single sentence of at most {words} words."
+
+
+class TruncatedOutputError(Exception):
+    """An output that must be complete was still cut at max_tokens after its retry with retry_max_tokens."""
+
+    def __init__(self, agent: str, max_tokens: int | None):
+        super().__init__(f"{agent} output cut at max_tokens={max_tokens}")
+        self.agent = agent
+
+
+def is_truncated(finish_reason) -> bool:
+    # Semantic Kernel reports the finish reason as an enum
+    return getattr(finish_reason, "value", finish_reason) == "length"
+
+
+def check_retry(agent: str, finish_reason) -> None:
+    """Raises TruncatedOutputError when the retry of a truncated output was cut as well."""
+    if is_truncated(finish_reason):
+        raise TruncatedOutputError(agent, get_profile(agent).retry_max_tokens)
+
+
+DEFAULT_PROFILES = {
+    "extractor": GenerationProfile(),
+    "summarizer": GenerationProfile(max_tokens=96),
+    "teacher": GenerationProfile(max_tokens=1024, retry_max_tokens=4096),
+    "combiner": GenerationProfile(max_tokens=1024, retry_max_tokens=4096),
+}
+
+
+def _from_env(agent: str, default: GenerationProfile) -> GenerationProfile:
+    """
+    GEN_<AGENT>_MAX_TOKENS / RETRY_MAX_TOKENS (0: none), STOP (separated by |, \\n for newlines), N and
+    LENGTH_HINT (on/off) override the default profile of the agent.
+    """
+    prefix = f"GEN_{agent.upper()}_"
+    max_tokens = os.getenv(prefix + "MAX_TOKENS")
+    stop = os.getenv(prefix + "STOP")
+    n = os.getenv(prefix + "N")
+    length_hint = os.getenv(prefix + "LENGTH_HINT")
+    retry_max_tokens = os.getenv(prefix + "RETRY_MAX_TOKENS")
+    return GenerationProfile(
+        max_tokens=default.max_tokens if max_tokens is None else int(max_tokens) or None,
+        stop=default.stop if stop is None else tuple(s.replace("\\n", "\n") for s in stop.split("|") if s),
+        n=default.n if n is None else int(n),
+        length_hint=default.length_hint if length_hint is None else length_hint.lower() == "on",
+        retry_max_tokens=default.retry_max_tokens if retry_max_tokens is None else int(retry_max_tokens) or None,
+    )
+
+
+_profiles: dict[str, GenerationProfile] = {}
+
+
+def get_profile(agent: str) -> GenerationProfile:
+    """The profile of an agent, read from the environment on first use; unknown agents get no limits."""
+    profile = _profiles.get(agent)
+    if profile is None:
+        profile = _profiles[agent] = _from_env(agent, DEFAULT_PROFILES.get(agent, GenerationProfile()))
+    return profile
+
+
+class GenerationStats:
+    """Finish reasons and completion tokens of the outputs, per agent."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reasons: dict[str, Counter] = {}
+        self.completion_tokens: Counter = Counter()
+
+    def record(self, agent: str, finish_reason, completion_tokens: int | None = None) -> None:
+        # Semantic Kernel reports the finish reason as an enum
+        finish_reason = getattr(finish_reason, "value", finish_reason) or "unknown"
+        with self._lock:
+            self.reasons.setdefault(agent, Counter())[finish_reason] += 1
+            self.completion_tokens[agent] += completion_tokens or 0
+
+    def report(self, label: str) -> None:
+        with self._lock:
+            reasons = {agent: Counter(counts) for agent, counts in self.reasons.items()}
+            completion_tokens = Counter(self.completion_tokens)
+        if not reasons:
+            print(f"[Generation {label}] No outputs")
+            return
+        for agent, counts in sorted(reasons.items()):
+            outputs = sum(counts.values())
+            cut = counts["length"] + counts["aborted"]
+            cap = get_profile(agent).max_tokens
+            # Aborted streams never report their usage
+            finished = outputs - counts["aborted"]
+            average = completion_tokens[agent] / finished if finished else 0.0
+            print(f"[Generation {label}] {agent}: {cut}/{outputs} outputs truncated ({cut / outputs:.1%}; "
+                  f"{counts['length']} at max_tokens={cap}, {counts['aborted']} aborted), "
+                  f"{average:.1f} completion tokens on average")
+
+    def reset(self) -> None:
+        with self._lock:
+            self.reasons.clear()
+            self.completion_tokens.clear()
+
+
+_stats = GenerationStats()
+
+
+def get_generation_stats() -> GenerationStats:
+    return _stats
@@ -0,0 +1,46 @@
+"""
+Process-wide pool of chat completion services shared by the agents' kernels.
+
+Every agent used to create its own OpenAIChatCompletion, with its own OpenAI client and connections, for every
+training README. The pool creates one service per service id the first time it is asked for and hands the same
+instance to every kernel, so the setup is paid once per process. Kernels themselves stay per agent: they hold
+the plugins (PromptPlugin, RougePlugin) of one group chat, which must not be shared between concurrent chats.
+"""
+import threading
+
+from semantic_kernel import Kernel
+from semantic_kernel.connectors.ai.chat_completion_client_base import ChatCompletionClientBase
+from semantic_kernel.connectors.ai.ollama import OllamaChatCompletion
+from semantic_kernel.connectors.ai.open_ai import OpenAIChatCompletion
+
+
+class KernelPool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._services: dict[tuple[str, str], ChatCompletionClientBase] = {}
+
+    def service(self, service_id: str, type: str = "OpenAI") -> ChatCompletionClientBase:
+        """The chat completion service of service_id, created on first use."""
+        key = (service_id, type)
+        with self._lock:
+            service = self._services.get(key)
+            if service is None:
+                if type == "OpenAI":
+                    service = OpenAIChatCompletion(service_id=service_id)
+                else:
+                    service = OllamaChatCompletion(service_id=service_id, ai_model_id="llama3.2")
+                self._services[key] = service
+            return service
+
+    def kernel(self, service_id: str, type: str = "OpenAI") -> Kernel:
+        """A new kernel with the pooled service of service_id; plugins added to it stay with the caller."""
+        kernel = Kernel()
+        kernel.add_service(self.service(service_id, type))
+        return kernel
+
+
+_pool = KernelPool()
+
+
+def get_kernel_pool() -> KernelPool:
+    return _pool
@@ -0,0 +1,127 @@
+"""Disk-backed cache of deterministic (temperature 0) LLM responses, keyed on model, parameters and prompt."""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = os.path.join(".llm_cache", "responses.sqlite")
+DEFAULT_MAX_MB = 512
+# Eviction frees down to this fraction of the limit, so it does not run on every write
+EVICT_TO = 0.9
+
+MODES = ("on", "replay", "off")
+
+
+class CacheMissError(KeyError):
+    """Raised in replay mode when a prompt has no cached response."""
+
+
+class LLMResponseCache:
+    def __init__(self, path: str = DEFAULT_PATH, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024, mode: str = "on"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown LLM cache mode {mode!r}, expected one of {MODES}")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        # WAL lets several experiment processes share one cache file
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._connection.commit()
+
+    @property
+    def replay(self) -> bool:
+        return self.mode == "replay"
+
+    @staticmethod
+    def make_key(model: str, params: dict, prompt) -> str:
+        """`prompt` is a string or any JSON-serializable message list."""
+        data = json.dumps({"model": model, "params": params, "prompt": prompt}, sort_keys=True, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                if self.replay:
+                    raise CacheMissError(f"No cached response for {key} in {self.path} (LLM_CACHE=replay)")
+                return None
+            self.hits += 1
+            if not self.replay:
+                self._connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+                self._connection.commit()
+            return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        if self.replay:
+            return
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), time.time()),
+            )
+            self._evict()
+            self._connection.commit()
+
+    def _evict(self) -> None:
+        total = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = total - int(self.max_bytes * EVICT_TO)
+        freed = 0
+        stale = []
+        for key, size in self._connection.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            stale.append((key,))
+            freed += size
+            if freed >= target:
+                break
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", stale)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+            self._connection.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+_cache: LLMResponseCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMResponseCache | None:
+    """
+    Returns the process-wide cache, or None when LLM_CACHE=off. LLM_CACHE=replay only reads (a miss raises
+    CacheMissError); LLM_CACHE_PATH and LLM_CACHE_MAX_MB set the SQLite file and its size limit.
+    """
+    global _cache
+    mode = os.getenv("LLM_CACHE", "on").lower()
+    if mode == "off":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMResponseCache(
+                path=os.getenv("LLM_CACHE_PATH", DEFAULT_PATH),
+                max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024),
+                mode=mode,
+            )
+        return _cache
+
+
+def is_deterministic(temperature) -> bool:
+    """Only temperature 0 calls are cached; the API default temperature is 1."""
+    return temperature is not None and float(temperature) == 0
@@ -0,0 +1,76 @@
+"""
+Copies the shared LLM helpers from autogen/METAGENT/utils, their source, to the other framework folders.
+
+The frameworks stay self-contained: each one imports its own copy of a helper (utils.<name>, or tools.<name> in
+llama-index and haystack), and the copies only differ in that import prefix. A fix is made once in the source and
+copied from here instead of by hand. From the repository root:
+
+    python sync_helpers.py           overwrite the copies with the source modules
+    python sync_helpers.py --check   list the copies that differ from the source (exit status 1 if any)
+"""
+import argparse
+import os
+import re
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SOURCE = os.path.join("autogen", "METAGENT", "utils")
+
+# Copy folder and the package name its framework imports the helpers from
+TARGETS = {
+    os.path.join("semantic_kernel", "METAGENTE", "utils"): "utils",
+    os.path.join("semantic_kernel", "METAGENTE_agent_chat", "utils"): "utils",
+    os.path.join("llama-index", "tools"): "tools",
+    os.path.join("haystack", "tools"): "tools",
+}
+# Helper and the copy folders it is used in
+HELPERS = {
+    "rate_limiter": list(TARGETS),
+    "resilient_call": list(TARGETS),
+    "llm_cache": list(TARGETS),
+    "extraction_store": list(TARGETS),
+    "readme_budget": list(TARGETS),
+    "generation_profiles": list(TARGETS),
+    "prompt_layout": list(TARGETS),
+    # Only the frameworks with a Batch API evaluation mode
+    "batch_runner": [os.path.join("semantic_kernel", "METAGENTE", "utils"), os.path.join("llama-index", "tools")],
+}
+
+
+def render(source: str, package: str) -> str:
+    """The source module with its imports of sibling helpers moved to `package`."""
+    names = "|".join(HELPERS)
+    return re.sub(rf"^(\s*)from utils\.({names}) import", rf"\1from {package}.\2 import", source, flags=re.MULTILINE)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Copy the shared LLM helpers to every framework folder")
+    parser.add_argument("--check", action="store_true", help="only report the copies that differ")
+    args = parser.parse_args()
+    stale = []
+    for name, folders in HELPERS.items():
+        with open(os.path.join(ROOT, SOURCE, name + ".py"), encoding="utf-8") as f:
+            source = f.read()
+        for folder in folders:
+            path = os.path.join(folder, name + ".py")
+            expected = render(source, TARGETS[folder])
+            try:
+                with open(os.path.join(ROOT, path), encoding="utf-8") as f:
+                    current = f.read()
+            except FileNotFoundError:
+                current = None
+            if current == expected:
+                continue
+            stale.append(path)
+            if not args.check:
+                with open(os.path.join(ROOT, path), "w", encoding="utf-8") as f:
+                    f.write(expected)
+    for path in stale:
+        print(f"{'differs' if args.check else 'updated'}: {path}")
+    if not stale:
+        print("All copies match autogen/METAGENT/utils")
+    return 1 if args.check and stale else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())